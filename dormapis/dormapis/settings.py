@@ -51,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Đặt đầu tiên để nén body sau khi các middleware khác đã xử lý xong response
+    'dorms.middleware.CompressionMiddleware',
+    'dorms.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,12 +65,28 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# Đếm query/thời gian DB theo request, header Server-Timing, cảnh báo N+1 (tắt mặc định)
+QUERY_BUDGET = {
+    'ENABLED': config('QUERY_BUDGET_ENABLED', default=False, cast=bool),
+    'MAX_QUERIES': 50,
+    'REPEAT_THRESHOLD': 10,
+    'RAISE': False,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
-    )
+    ),
+    # Dùng orjson nếu có cài đặt (pip install orjson), không có thì giống JSONRenderer mặc định
+    'DEFAULT_RENDERER_CLASSES': (
+        'dorms.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Nén gzip/brotli (pip install brotli) cho response JSON/CSV từ kích thước này (byte)
+COMPRESSION_MIN_SIZE = 1024
+
 OAUTH2_PROVIDER = {'OAUTH2_BACKEND_CLASS': 'oauth2_provider.oauth2_backends.JSONOAuthLibCore'}
 
 ROOT_URLCONF = 'dormapis.urls'
@@ -103,12 +122,39 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')  # App Password, KHÔNG dùn
 
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Outbox gửi email/FCM bất đồng bộ (python manage.py run_outbox_worker)
+# Dùng 'dorms.services.notification_backends.FakeBackend' để chạy offline khi dev/test
+NOTIFICATION_BACKEND = 'dorms.services.notification_backends.LiveBackend'
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE_SECONDS = 30
+# Đặt 'dorms.services.firebase_service.local_send_each_for_multicast' để không gọi FCM thật
+FCM_MULTICAST_SENDER = None
+
 # VNPAY-SETTINGS
 VNPAY_TMN_CODE = config("VNPAY_TMN_CODE")
 VNPAY_HASH_SECRET_KEY = config("VNPAY_HASH_SECRET_KEY")
 VNPAY_PAYMENT_URL = config("VNPAY_PAYMENT_URL")
 VNPAY_RETURN_URL = config("VNPAY_RETURN_URL")
 
+# Cache: Redis khi có REDIS_URL, ngược lại dùng LocMem (dev/test)
+REDIS_URL = config('REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Thời gian cache (giây) cho các API danh mục: tòa nhà, phòng, phương thức thanh toán
+CATALOG_CACHE_TIMEOUT = 300
+# Thời gian cache (giây) phòng hiện tại của sinh viên dùng cho kiểm tra quyền, 0 để tắt
+STUDENT_CONTEXT_CACHE_TIMEOUT = 60
+# Giới hạn ảnh upload (avatar, ảnh phòng): dung lượng, số điểm ảnh, cạnh dài tối đa khi lưu
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000
+IMAGE_UPLOAD_MAX_EDGE = 2560
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -164,6 +210,8 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# Đặt base URL của CDN (vd. https://cdn.example.com/media/) để API trả link ảnh qua CDN
+MEDIA_CDN_URL = config('MEDIA_CDN_URL', default='')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,8 +1,9 @@
 from django.contrib import admin
+from django.db.models import Count, Q
 from .models import (
     Building, Room, RoomRegistration, RoomSwap,
-    FeeType, PaymentMethod, Invoice, InvoiceDetail,
-    NotificationType, Notification, FCMDevice,
+    FeeType, PaymentMethod, Invoice, InvoiceDetail, PaymentTransaction,
+    NotificationType, Notification, NotificationRecipient, FCMDevice, OutboxMessage,
     SupportRequest, SupportResponse,
     Survey, SurveyQuestion, SurveyResponse
 )
@@ -10,7 +11,9 @@ from django.utils.html import mark_safe
 from django import forms
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 from django.utils.html import format_html
+from .utils.media import get_media_resolver
 
 
 class MyAdminSite(admin.AdminSite):
@@ -37,20 +40,24 @@ class RoomForm(forms.ModelForm):
 class MyRoomAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'building', 'image_tag', 'capacity', 'gender_restriction')
     list_filter = ('building', 'gender_restriction')
+    list_select_related = ('building',)
     search_fields = ('name',)
     readonly_fields = ['image_view']
     form = RoomForm
 
     def image_tag(self, obj):
         if obj.image:
-            return format_html(f'<img src="{obj.image.url}" width="100" height="auto" style="object-fit: cover;" />', obj.image.url)
+            # Danh sách chỉ cần bản thumb, không tải ảnh gốc cho mỗi dòng
+            thumb = obj.image_variants.get('sizes', {}).get('thumb')
+            url = get_media_resolver().url(thumb['jpeg'] if thumb else obj.image.name)
+            return format_html('<img src="{}" width="100" height="auto" style="object-fit: cover;" />', url)
         return "-"
 
     image_tag.short_description = 'Image'  # Cột tiêu đề
 
     def image_view(self, rooms):
         if rooms:
-            return mark_safe(f"<img src='{rooms.image.url}' width='120' />")
+            return mark_safe(f"<img src='{get_media_resolver().url(rooms.image.name)}' width='120' />")
 
 
 admin.site.register(Room, MyRoomAdmin)
@@ -81,29 +88,49 @@ class PaymentMethodAdmin(admin.ModelAdmin):
 @admin.register(RoomRegistration)
 class RoomRegistrationAdmin(admin.ModelAdmin):
     list_display = ('student', 'room', 'registered_at', 'start_date', 'end_date', 'is_active')
+    # Room.__str__ đọc building nên join luôn tới building
+    list_select_related = ('student', 'room__building')
     search_fields = ('student__username', 'room__name')
     list_filter = ('is_active', 'room__building')
     autocomplete_fields = ('student', 'room')
+    # Không chạy thêm COUNT(*) trên toàn bảng cho mỗi trang
+    show_full_result_count = False
 
 
 class InvoiceDetailInline(admin.TabularInline):
     model = InvoiceDetail
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('fee_type')
+
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ('room', 'billing_period', 'is_paid', 'paid_at', 'payment_method', 'total_amount')
+    list_display = ('room', 'billing_period', 'is_paid', 'paid_at', 'payment_method', 'detail_count', 'total_amount')
+    list_select_related = ('room__building', 'payment_method')
     list_filter = ('is_paid', 'room__building')
     search_fields = ('room__name',)
+    autocomplete_fields = ('room',)
+    show_full_result_count = False
     inlines = [InvoiceDetailInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(detail_count=Count('invoice_details'))
+
+    @admin.display(description='Số khoản phí', ordering='detail_count')
+    def detail_count(self, obj):
+        return obj.detail_count
+
 
 @admin.register(InvoiceDetail)
 class InvoiceDetailAdmin(admin.ModelAdmin):
     list_display = ('invoice', 'fee_type', 'quantity', 'unit', 'unit_price', 'amount')
+    list_select_related = ('invoice__room', 'fee_type')
     search_fields = ('invoice__room__name', 'fee_type__name')
     list_filter = ('unit',)
+    autocomplete_fields = ('invoice',)
+    show_full_result_count = False
 
 
 @admin.register(NotificationType)
@@ -113,28 +140,76 @@ class NotificationTypeAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'notification_type', 'created_at', 'sent_by', 'is_urgent')
+    list_display = ('title', 'notification_type', 'created_at', 'sent_by', 'is_urgent', 'read_ratio')
+    list_select_related = ('notification_type', 'sent_by')
     search_fields = ('title', 'content')
     list_filter = ('notification_type', 'is_urgent')
-    filter_horizontal = ('target_users',)
+    autocomplete_fields = ('sent_by',)
+    show_full_result_count = False
+    # Thông báo theo audience có thể có hàng chục nghìn người nhận: không dựng inline mà dẫn sang danh sách phân trang
+    readonly_fields = ('recipient_list',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipient_count=Count('recipients'),
+            read_count=Count('recipients', filter=Q(recipients__is_read=True))
+        )
+
+    @admin.display(description='Đã đọc', ordering='recipient_count')
+    def read_ratio(self, obj):
+        return f"{obj.read_count}/{obj.recipient_count}"
+
+    @admin.display(description='Người nhận')
+    def recipient_list(self, obj):
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:dorms_notificationrecipient_changelist')
+        return format_html('<a href="{}?notification__id__exact={}">{} người nhận ({} đã đọc)</a>',
+                           url, obj.pk, obj.recipient_count, obj.read_count)
+
+
+@admin.register(NotificationRecipient)
+class NotificationRecipientAdmin(admin.ModelAdmin):
+    list_display = ('notification', 'user', 'is_read', 'read_at')
+    list_select_related = ('notification__notification_type', 'user')
+    search_fields = ('user__username', 'user__email', 'notification__title')
+    list_filter = ('is_read',)
+    autocomplete_fields = ('notification', 'user')
+    readonly_fields = ('is_read', 'read_at')
+    show_full_result_count = False
 
 
 @admin.register(SupportRequest)
 class SupportRequestAdmin(admin.ModelAdmin):
-    list_display = ('title', 'student', 'room', 'created_at', 'is_resolved')
+    list_display = ('title', 'student', 'room', 'created_at', 'is_resolved', 'response_count')
+    list_select_related = ('student', 'room__building')
     search_fields = ('title', 'student__username')
     list_filter = ('is_resolved',)
+    autocomplete_fields = ('student', 'room')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(response_count=Count('responses'))
+
+    @admin.display(description='Số phản hồi', ordering='response_count')
+    def response_count(self, obj):
+        return obj.response_count
 
 
 @admin.register(SupportResponse)
 class SupportResponseAdmin(admin.ModelAdmin):
     list_display = ('request', 'responder', 'responded_at')
+    # SupportRequest.__str__ đọc student
+    list_select_related = ('request__student', 'responder')
     search_fields = ('request__title', 'responder__username')
+    autocomplete_fields = ('request', 'responder')
+    show_full_result_count = False
 
 
 @admin.register(Survey)
 class SurveyAdmin(admin.ModelAdmin):
     list_display = ('title', 'created_by', 'start_date', 'end_date')
+    list_select_related = ('created_by',)
     search_fields = ('title',)
     list_filter = ('start_date', 'end_date')
 
@@ -142,17 +217,42 @@ class SurveyAdmin(admin.ModelAdmin):
 @admin.register(SurveyQuestion)
 class SurveyQuestionAdmin(admin.ModelAdmin):
     list_display = ('question_text', 'survey')
+    list_select_related = ('survey',)
 
 
 @admin.register(SurveyResponse)
 class SurveyResponseAdmin(admin.ModelAdmin):
     list_display = ('student', 'question', 'answer')
+    list_select_related = ('student', 'question')
     search_fields = ('student__username', 'question__question_text')
+    autocomplete_fields = ('student',)
+    show_full_result_count = False
 
 
 @admin.register(FCMDevice)
 class FCMDeviceAdmin(admin.ModelAdmin):
     list_display = ('user', 'token', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'token')
-
-
+    autocomplete_fields = ('user',)
+    show_full_result_count = False
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'channel', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('channel', 'status')
+    search_fields = ('recipient__username',)
+    list_select_related = ('recipient',)
+    readonly_fields = ('created_at', 'sent_at', 'locked_at')
+    show_full_result_count = False
+
+
+@admin.register(PaymentTransaction)
+class PaymentTransactionAdmin(admin.ModelAdmin):
+    list_display = ('txn_ref', 'invoice', 'amount', 'status', 'response_code', 'created_at', 'processed_at')
+    list_filter = ('status',)
+    search_fields = ('txn_ref', 'transaction_no')
+    list_select_related = ('invoice__room',)
+    readonly_fields = [f.name for f in PaymentTransaction._meta.fields]
+    show_full_result_count = False
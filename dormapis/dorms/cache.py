@@ -0,0 +1,97 @@
+import hashlib
+import json
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def _version_key(namespace):
+    return f'catalog:{namespace}:version'
+
+
+def catalog_version(namespace):
+    """Phiên bản dữ liệu của namespace (thời điểm thay đổi gần nhất, tính bằng ns)"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def _bump(namespaces):
+    for namespace in namespaces:
+        cache.set(_version_key(namespace), time.time_ns(), None)
+
+
+def invalidate_catalog(*namespaces):
+    # Đổi phiên bản thay vì xóa từng key: key cũ không còn được đọc và tự hết hạn.
+    # Đổi lại sau commit để response dựng từ dữ liệu chưa commit trong lúc đó không còn được dùng.
+    _bump(namespaces)
+    transaction.on_commit(lambda: _bump(namespaces))
+
+
+class CatalogCacheMixin:
+    """
+    Cache kết quả list/retrieve của viewset chỉ đọc theo query params (gồm cả page),
+    hỗ trợ GET có điều kiện qua ETag/Last-Modified. Bị vô hiệu hóa bằng dorms.signals.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request,
+                                     lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs))
+
+    def _cache_key(self, version):
+        params = sorted(self.request.query_params.lists())
+        # URL ảnh và link phân trang (next/previous) là tuyệt đối, phụ thuộc scheme và host của request
+        raw = json.dumps([self.request.scheme, self.request.get_host(), self.action,
+                          self.kwargs.get(self.lookup_url_kwarg or self.lookup_field), params])
+        return f'catalog:{self.cache_namespace}:{version}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def _cached_response(self, request, render):
+        version = catalog_version(self.cache_namespace)
+        key = self._cache_key(version)
+        entry = cache.get(key)
+
+        if entry is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True)
+            entry = {
+                'data': response.data,
+                'etag': quote_etag(hashlib.md5(body.encode()).hexdigest()),
+                # Làm tròn lên giây để thay đổi trong cùng một giây không bị trả 304 nhầm
+                'last_modified': math.ceil(version / 1e9),
+            }
+            cache.set(key, entry, CATALOG_CACHE_TIMEOUT)
+
+        headers = {
+            'ETag': entry['etag'],
+            'Last-Modified': http_date(entry['last_modified']),
+            'Cache-Control': 'no-cache',
+        }
+        if self._not_modified(request, entry):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry['data'], headers=headers)
+
+    def _not_modified(self, request, entry):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in etags or entry['etag'] in etags or f"W/{entry['etag']}" in etags
+
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and entry['last_modified'] <= if_modified_since
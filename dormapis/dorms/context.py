@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from .models import RoomRegistration
+
+# Thời gian (giây) giữ phòng hiện tại của sinh viên giữa các request, 0 để tắt
+STUDENT_CONTEXT_CACHE_TIMEOUT = getattr(settings, 'STUDENT_CONTEXT_CACHE_TIMEOUT', 60)
+
+
+def _cache_key(user_id):
+    return f'student-context:{user_id}'
+
+
+def active_registration(user_id):
+    """(id, room_id) đăng ký đang hiệu lực của sinh viên"""
+    return RoomRegistration.objects.filter(student_id=user_id, is_active=True).values_list('id', 'room_id')
+
+
+def invalidate_student_context(user_id):
+    # Xóa lại sau commit để request đọc dữ liệu cũ trong lúc transaction chưa xong không giữ nó trong cache
+    cache.delete(_cache_key(user_id))
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)))
+
+
+class StudentContext:
+    """Vai trò, đăng ký phòng đang hiệu lực và phòng của người dùng trong request, chỉ truy vấn khi cần"""
+
+    def __init__(self, user):
+        self.user = user
+        self.is_authenticated = bool(user and user.is_authenticated)
+        self.role = user.role if self.is_authenticated else None
+        self.is_admin = self.role == 'admin'
+        self.is_student = self.role == 'student'
+
+    @cached_property
+    def _active(self):
+        if not self.is_student:
+            return None, None
+
+        key = _cache_key(self.user.pk)
+        if STUDENT_CONTEXT_CACHE_TIMEOUT:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        active = active_registration(self.user.pk).first() or (None, None)
+        if STUDENT_CONTEXT_CACHE_TIMEOUT:
+            cache.set(key, active, STUDENT_CONTEXT_CACHE_TIMEOUT)
+        return active
+
+    @property
+    def registration_id(self):
+        return self._active[0]
+
+    @property
+    def room_id(self):
+        return self._active[1]
+
+    @property
+    def has_room(self):
+        return self.room_id is not None
+
+    def owns_room(self, room_id):
+        return self.has_room and self.room_id == room_id
+
+
+def get_student_context(request):
+    """Context được tạo một lần cho mỗi request và dùng chung giữa permission, view và serializer"""
+    http_request = getattr(request, '_request', request)
+    context = getattr(http_request, 'student_context', None)
+    if context is None or context.user is not request.user:
+        context = StudentContext(request.user)
+        http_request.student_context = context
+    return context
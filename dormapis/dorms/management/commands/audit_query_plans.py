@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dorms.utils import query_audit
+
+
+class Command(BaseCommand):
+    help = ('Chạy EXPLAIN cho các dạng truy vấn chính của ứng dụng (dorms.utils.query_audit) '
+            'và báo các truy vấn quét toàn bộ bảng')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plan', action='store_true', help='In toàn bộ kế hoạch thực thi')
+        parser.add_argument('--fail', action='store_true', help='Thoát với lỗi nếu có truy vấn quét toàn bộ bảng')
+
+    def handle(self, *args, **options):
+        failures = 0
+        for name, source, scans, plan in query_audit.audit():
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"[FULL SCAN] {name} ({source}): {', '.join(scans)}"))
+            else:
+                self.stdout.write(f"[OK] {name} ({source})")
+            if options['verbose_plan'] or scans:
+                for row in plan:
+                    self.stdout.write(f"    {row}")
+
+        summary = f"{len(query_audit.QUERY_SHAPES)} truy vấn, {failures} truy vấn quét toàn bộ bảng."
+        if failures and options['fail']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary) if not failures else summary)
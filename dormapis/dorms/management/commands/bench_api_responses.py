@@ -0,0 +1,117 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from dorms import middleware
+from dorms.models import User, Building, Room, FeeType, Invoice, InvoiceDetail, Notification, SupportRequest
+from dorms.renderers import FastJSONRenderer, orjson
+
+ROOM_DESCRIPTION = (
+    '<h3>Phòng ở ký túc xá</h3><p>Phòng <strong>4 người</strong>, diện tích 24m², có máy lạnh, '
+    'nóng lạnh, ban công và nhà vệ sinh riêng. Sinh viên được trang bị giường tầng, tủ quần áo, '
+    'bàn học và kệ sách.</p><ul><li>Giờ đóng cửa: 23h00</li><li>Điện tính theo đồng hồ riêng</li>'
+    '<li>Wifi miễn phí toàn tòa nhà</li></ul>'
+)
+NOTIFICATION_CONTENT = (
+    'Ban quản lý ký túc xá thông báo: tòa nhà sẽ tạm ngưng cung cấp điện từ 8h00 đến 11h30 '
+    'để bảo trì hệ thống. Sinh viên vui lòng sạc đầy thiết bị, rút phích cắm các thiết bị điện '
+    'và liên hệ phòng quản lý nếu cần hỗ trợ.'
+)
+
+
+class Command(BaseCommand):
+    help = 'Đo thời gian render JSON (JSONRenderer/orjson) và số byte truyền đi (gzip/brotli) theo endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=200, help='Số phòng trong tòa nhà')
+        parser.add_argument('--repeat', type=int, default=20, help='Lấy kết quả tốt nhất sau số lần chạy này')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write('Chưa cài orjson: FastJSONRenderer dùng lại JSONRenderer.')
+        if middleware.brotli is None:
+            self.stdout.write('Chưa cài brotli: chỉ đo gzip.')
+
+        with transaction.atomic():
+            admin, building = self._seed(options['rooms'])
+            cache.clear()
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(admin)
+
+            endpoints = [
+                ('GET /building/{id}/', f'/building/{building.pk}/'),
+                ('GET /room/', '/room/'),
+                ('GET /invoice/', '/invoice/'),
+                ('GET /notifications/', '/notifications/'),
+                ('GET /support-request/', '/support-request/'),
+            ]
+            for label, url in endpoints:
+                data = client.get(url).data
+                raw = JSONRenderer().render(data)
+                if FastJSONRenderer().render(data) != raw:
+                    self.stderr.write(f"{label}: FastJSONRenderer cho kết quả khác JSONRenderer.")
+                    continue
+
+                self.stdout.write(f"{label}: {len(raw):,} byte JSON")
+                self._report('JSONRenderer', lambda: JSONRenderer().render(data), options)
+                self._report('FastJSONRenderer', lambda: FastJSONRenderer().render(data), options)
+                self._report('gzip', lambda: compress_string(raw), options, size=len(compress_string(raw)))
+                if middleware.brotli:
+                    compress = lambda: middleware.brotli.compress(raw, quality=middleware.BROTLI_QUALITY)
+                    self._report(f'brotli q{middleware.BROTLI_QUALITY}', compress, options, size=len(compress()))
+
+                # Byte thực tế qua CompressionMiddleware
+                cache.clear()
+                response = client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+                encoding = response.get('Content-Encoding', 'không nén')
+                self.stdout.write(f"  Trên đường truyền ({encoding}): {len(response.content):,} byte")
+
+            transaction.set_rollback(True)
+
+    def _report(self, label, func, options, size=None):
+        best = float('inf')
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        line = f"  {label}: {best * 1000:.2f} ms"
+        if size is not None:
+            line += f", {size:,} byte"
+        self.stdout.write(line)
+
+    def _seed(self, n):
+        admin = User.objects.create(username='bench_api_admin', role='admin')
+        student = User.objects.create(username='bench_api_student', role='student')
+        building = Building.objects.create(name='Bench API', address='Khu phố 6, Linh Trung, Thủ Đức')
+        Room.objects.bulk_create([
+            Room(building=building, name=f'A{i:03d}', capacity=4, description=ROOM_DESCRIPTION,
+                 image=f'rooms/2025/06/a{i:03d}.jpg', gender_restriction='male' if i % 2 else 'female')
+            for i in range(n)
+        ])
+        rooms = list(Room.objects.filter(building=building).values_list('id', flat=True))
+
+        fee_types = [FeeType.objects.create(name=f'bench-api-{name}') for name in ('Tiền phòng', 'Điện', 'Nước')]
+        Invoice.objects.bulk_create([Invoice(room_id=room_id, billing_period=date(2025, 6, 1),
+                                             total_amount=Decimal('1650000.00')) for room_id in rooms])
+        InvoiceDetail.objects.bulk_create([
+            InvoiceDetail(invoice_id=invoice_id, fee_type=fee_type, quantity=120, unit='kWh',
+                          unit_price=Decimal('3500.00'), amount=Decimal('420000.00'))
+            for invoice_id in Invoice.objects.filter(room__building=building).values_list('id', flat=True)
+            for fee_type in fee_types
+        ])
+
+        Notification.objects.bulk_create([Notification(title=f'Thông báo cúp điện đợt {i}', content=NOTIFICATION_CONTENT,
+                                                        sent_by=admin) for i in range(50)])
+        SupportRequest.objects.bulk_create([
+            SupportRequest(student=student, room_id=rooms[i], title=f'Hỏng vòi nước phòng A{i:03d}',
+                           description='Vòi nước trong nhà vệ sinh bị rò rỉ từ tối qua, nhờ ban quản lý kiểm tra.')
+            for i in range(min(50, n))
+        ])
+        return admin, building
@@ -0,0 +1,125 @@
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+
+from django import forms
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import load_handler
+from django.core.management.base import BaseCommand
+from django.http.multipartparser import MultiPartParser, MultiPartParserError
+from PIL import Image
+
+from dorms.services import image_service
+from dorms.utils.uploads import ImageUploadHandler
+
+BOUNDARY = 'dormhub-bench-boundary'
+
+
+def _memory_kb(field):
+    return int(re.search(rf'{field}:\s+(\d+)', open('/proc/self/status').read()).group(1))
+
+
+class _Peak:
+    # Reset VmHWM của process rồi đo mức RAM đỉnh tăng thêm trong khối with
+    def __enter__(self):
+        open('/proc/self/clear_refs', 'w').write('5')
+        self.baseline = _memory_kb('VmRSS')
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.peak_mb = (_memory_kb('VmHWM') - self.baseline) / 1024
+
+    def __str__(self):
+        return f"{self.elapsed * 1000:.0f} ms, RAM đỉnh +{self.peak_mb:.1f} MB"
+
+
+def _run_case(body_path, handler_factory, media_root, conn):
+    # Chạy trong process riêng để số đo RAM không bị ảnh hưởng bởi các lần đo trước
+    error = None
+    with _Peak() as upload_peak:
+        try:
+            with open(body_path, 'rb') as stream:
+                meta = {'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+                        'CONTENT_LENGTH': str(os.path.getsize(body_path))}
+                _, files = MultiPartParser(meta, stream, handler_factory()).parse()
+            upload = files['avatar']
+            # Cùng bước kiểm tra với ImageField của serializer
+            image = forms.ImageField().to_python(upload).image
+        except MultiPartParserError as ex:
+            error = ex
+    if error:
+        conn.send(f"upload {upload_peak}, từ chối: {error}")
+        return
+
+    lines = [f"upload {upload_peak}, lưu {upload.size / 1024 / 1024:.1f} MB, {image.width}x{image.height}"]
+
+    # Worker tạo ảnh thu nhỏ (user-021) đọc lại đúng file đã lưu
+    storage = FileSystemStorage(location=media_root)
+    # Bọc lại để storage chép theo chunk thay vì move file tạm (file tạm còn được đóng sau đó)
+    name = storage.save(upload.name, File(upload.file, name=upload.name))
+    with _Peak() as render_peak:
+        image_service.render_variants(name, storage)
+    lines.append(f"tạo ảnh thu nhỏ {render_peak}")
+    conn.send('; '.join(lines))
+
+
+def _legacy_handlers():
+    return [load_handler(path) for path in settings.FILE_UPLOAD_HANDLERS]
+
+
+def _image_handlers():
+    return [ImageUploadHandler()]
+
+
+class Command(BaseCommand):
+    help = 'Đo RAM đỉnh và thời gian parse một request upload ảnh ~20 MB (handler mặc định so với ImageUploadHandler)'
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/clear_refs'):
+            self.stderr.write('Cần Linux (/proc/self/clear_refs) để đo RAM đỉnh.')
+            return
+
+        inputs = [
+            # Cạnh dài < 2 * MAX_EDGE: không giải mã ở 1/2 được (nhỏ hơn đích), vẫn dựng ảnh gốc trong RAM
+            ('JPEG 4800x3500 (giải mã đủ kích thước)', (4800, 3500), 'JPEG', {'quality': 95}),
+            ('JPEG 6000x4000 (giải mã ở 1/2)', (6000, 4000), 'JPEG', {'quality': 60}),
+            ('PNG 2900x2300', (2900, 2300), 'PNG', {'compress_level': 1}),
+            ('JPEG 5200x3900 (vượt giới hạn)', (5200, 3900), 'JPEG', {'quality': 95}),
+        ]
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, size, fmt, save_options in inputs:
+                body_path = os.path.join(tmp, 'body')
+                file_size = self._write_body(body_path, size, fmt, save_options)
+                self.stdout.write(f"{label}, {file_size / 1024 / 1024:.1f} MB:")
+
+                for name, factory in (('mặc định', _legacy_handlers), ('ImageUploadHandler', _image_handlers)):
+                    parent, child = context.Pipe()
+                    media_root = tempfile.mkdtemp(dir=tmp)
+                    process = context.Process(target=_run_case, args=(body_path, factory, media_root, child))
+                    process.start()
+                    result = parent.recv()
+                    process.join()
+                    self.stdout.write(f"  {name}: {result}")
+
+    @staticmethod
+    def _write_body(path, size, fmt, save_options):
+        # Nhiễu ngẫu nhiên nén kém nên đạt dung lượng gần với ảnh chụp điện thoại
+        image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+        data = io.BytesIO()
+        image.save(data, format=fmt, **save_options)
+        extension = 'jpg' if fmt == 'JPEG' else fmt.lower()
+
+        with open(path, 'wb') as f:
+            f.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="avatar"; filename="photo.{extension}"\r\n'
+                    f'Content-Type: image/{extension}\r\n\r\n'.encode())
+            f.write(data.getbuffer())
+            f.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+        return data.tell()
@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from rest_framework import serializers as drf_serializers
+from rest_framework.request import Request
+
+from dorms.models import Building, Room
+from dorms.serializers import RoomSerializer
+
+
+class LegacyRoomSerializer(RoomSerializer):
+    # Cách cũ: build_absolute_uri cho ảnh gốc và từng bản thu nhỏ của mỗi phòng
+    image = drf_serializers.ImageField()
+    image_srcset = drf_serializers.ReadOnlyField(source='image_variants')
+
+    def to_representation(self, instance):
+        d = super().to_representation(instance)
+        request = self.context.get('request')
+        url = lambda name: request.build_absolute_uri('/static/' + name)
+        d['image'] = url(instance.image.name) if instance.image else ''
+        d['image_srcset'] = {
+            variant: {'width': entry['width'], 'webp': url(entry['webp']), 'jpeg': url(entry['jpeg'])}
+            for variant, entry in instance.image_variants.get('sizes', {}).items()
+        }
+        return d
+
+
+class Command(BaseCommand):
+    help = 'Đo thời gian serialize danh sách phòng có ảnh (build_absolute_uri mỗi object so với MediaURLResolver)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Số phòng')
+        parser.add_argument('--repeat', type=int, default=3, help='Lấy kết quả tốt nhất sau số lần chạy này')
+
+    def handle(self, *args, **options):
+        rooms = [self._room(i) for i in range(options['count'])]
+        factory = RequestFactory()
+
+        def run(serializer_class):
+            # Mỗi lần chạy là một request mới, như một lần gọi GET /room/
+            request = Request(factory.get('/room/', HTTP_HOST='localhost'))
+            return serializer_class(rooms, many=True, context={'request': request}).data
+
+        legacy, current = run(LegacyRoomSerializer), run(RoomSerializer)
+        if [dict(row) for row in legacy] != [dict(row) for row in current]:
+            self.stderr.write('Kết quả hai cách serialize khác nhau.')
+            return
+
+        cdn = override_settings(MEDIA_CDN_URL='https://cdn.example.com/media/')
+        cases = [
+            ('build_absolute_uri mỗi object', lambda: run(LegacyRoomSerializer)),
+            ('MediaURLResolver', lambda: run(RoomSerializer)),
+            ('MediaURLResolver (CDN)', cdn(lambda: run(RoomSerializer))),
+        ]
+        for label, func in cases:
+            best = min(self._time(func) for _ in range(options['repeat']))
+            self.stdout.write(f"{label}: {best * 1000:.0f} ms, {best / len(rooms) * 1e6:.1f} µs/phòng")
+
+    @staticmethod
+    def _time(func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _room(i):
+        building = Building(id=i % 20 + 1, name=f'B{i % 20 + 1}')
+        name = f'rooms/2025/06/p{i}.jpg'
+        room = Room(id=i + 1, building=building, name=f'P{i}', description='Phòng 4 người', image=name,
+                    capacity=4, gender_restriction='male')
+        room.image_variants = {'source': name, 'sizes': {
+            variant: {'width': width, 'height': width * 3 // 4,
+                      'webp': f'rooms/2025/06/p{i}__{variant}.webp', 'jpeg': f'rooms/2025/06/p{i}__{variant}.jpg'}
+            for variant, width in (('thumb', 160), ('card', 480), ('full', 1280))
+        }}
+        room.active_students = i % 5
+        return room
@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from dorms.models import User, FCMDevice, Notification
+from dorms.services import firebase_service, notification_service
+
+
+class Command(BaseCommand):
+    help = 'Đo thời gian/bộ nhớ/số query khi fan-out một thông báo tới nhiều sinh viên (dữ liệu được rollback)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=50000)
+        parser.add_argument('--chunk-size', type=int, default=notification_service.FANOUT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        n = options['recipients']
+        with transaction.atomic():
+            self._seed(n)
+            notif = Notification.objects.create(title='Benchmark', content='Fan-out benchmark')
+
+            self._measure('Ghi target_users', lambda: notification_service.add_recipients(
+                notif, notification_service.resolve_audience('all'), chunk_size=options['chunk_size']))
+
+            self._measure('Gửi multicast (local sender)', lambda: firebase_service.notify_users(
+                notification_service.recipient_ids(notif), notif.title, notif.content,
+                send=firebase_service.local_send_each_for_multicast))
+
+            transaction.set_rollback(True)
+
+    def _seed(self, n):
+        start = time.perf_counter()
+        User.objects.bulk_create([User(username=f'bench_fanout_{i}', role='student') for i in range(n)],
+                                 batch_size=5000)
+        users = User.objects.filter(username__startswith='bench_fanout_').values_list('id', flat=True)
+        FCMDevice.objects.bulk_create([FCMDevice(user_id=user_id, token=f'bench-token-{user_id}')
+                                       for user_id in users.iterator(chunk_size=5000)], batch_size=5000)
+        self.stdout.write(f"Tạo {n} sinh viên + thiết bị: {time.perf_counter() - start:.2f}s")
+
+    def _measure(self, label, func):
+        tracemalloc.start()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if isinstance(result, list):
+            result = f"{len(result)} lô, {sum(r['success'] for r in result)} thành công"
+        self.stdout.write(f"{label}: {elapsed:.2f}s, {len(queries)} query, "
+                          f"peak {peak / 1024 / 1024:.1f} MB -> {result}")
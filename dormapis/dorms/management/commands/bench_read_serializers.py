@@ -0,0 +1,97 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from dorms import read_serializers, serializers
+from dorms.models import User, Building, Room, FeeType, Invoice, InvoiceDetail, Notification, NotificationRecipient
+
+
+class Command(BaseCommand):
+    help = 'Đo chi phí serialize mỗi dòng của ModelSerializer so với ReadSerializer (dữ liệu được rollback)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3, help='Lấy kết quả tốt nhất sau số lần chạy này')
+
+    def handle(self, *args, **options):
+        n = options['rows']
+        with transaction.atomic():
+            student = self._seed(n)
+            request = Request(APIRequestFactory().get('/', HTTP_HOST='localhost'))
+            request.user = student
+            context = {'request': request}
+
+            cases = [
+                ('Room', serializers.RoomSerializer, read_serializers.RoomReadSerializer,
+                 Room.objects.select_related('building').with_occupancy().order_by('id')),
+                ('Invoice (+3 chi tiết)', serializers.InvoiceSerializer, read_serializers.InvoiceReadSerializer,
+                 Invoice.objects.prefetch_related('invoice_details').order_by('id')),
+                ('Notification', serializers.NotificationSerializer, read_serializers.NotificationReadSerializer,
+                 Notification.objects.select_related('notification_type').filter(recipients__user=student)
+                 .annotate(is_read=F('recipients__is_read'), read_at=F('recipients__read_at'))
+                 .order_by('-created_at', '-id')),
+            ]
+            for label, serializer_class, read_serializer_class, queryset in cases:
+                fast = read_serializer_class(context)
+                instances, rows = list(queryset), list(fast.values(queryset))
+                if serializer_class(instances, many=True, context=context).data != fast.serialize(rows):
+                    self.stderr.write(f"{label}: kết quả hai cách serialize khác nhau.")
+                    continue
+
+                n = len(rows)
+                self.stdout.write(f"{label}, {n} dòng:")
+                self._report('ModelSerializer (query + serialize)',
+                             lambda: serializer_class(queryset.all(), many=True, context=context).data, n, options)
+                self._report('ReadSerializer (query + serialize)',
+                             lambda: fast.serialize(fast.values(queryset.all())), n, options)
+                self._report('ModelSerializer (chỉ serialize)',
+                             lambda: serializer_class(instances, many=True, context=context).data, n, options)
+                # Với Invoice, ReadSerializer còn query chi tiết trong prepare(), ModelSerializer đã prefetch sẵn
+                self._report('ReadSerializer (chỉ serialize)', lambda: fast.serialize(rows), n, options)
+
+            transaction.set_rollback(True)
+
+    def _report(self, label, func, n, options):
+        best = float('inf')
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        self.stdout.write(f"  {label}: {best * 1000:.0f} ms, {best / n * 1e6:.1f} µs/dòng")
+
+    def _seed(self, n):
+        start = time.perf_counter()
+        building = Building.objects.create(name='Bench', address='Nhà Bè')
+        Room.objects.bulk_create([
+            Room(building=building, name=f'bench-{i}', capacity=4, gender_restriction='male',
+                 description='<p>Phòng <b>4 người</b>, có máy lạnh</p>', image=f'rooms/2025/06/bench-{i}.jpg')
+            for i in range(n)
+        ], batch_size=2000)
+        rooms = Room.objects.filter(building=building).values_list('id', flat=True)
+        Invoice.objects.bulk_create([Invoice(room_id=room_id, billing_period=date(2025, 6, 1),
+                                             total_amount=Decimal('1650000.00')) for room_id in rooms],
+                                    batch_size=2000)
+        fee_types = [FeeType.objects.create(name=f'bench-{name}') for name in ('Tiền phòng', 'Điện', 'Nước')]
+        InvoiceDetail.objects.bulk_create([
+            InvoiceDetail(invoice_id=invoice_id, fee_type=fee_type, quantity=12.5, unit='kWh',
+                          unit_price=Decimal('3500.00'), amount=Decimal('43750.00'))
+            for invoice_id in Invoice.objects.filter(room__building=building).values_list('id', flat=True)
+            for fee_type in fee_types
+        ], batch_size=5000)
+
+        student = User.objects.create(username='bench_reader', role='student')
+        Notification.objects.bulk_create([Notification(title=f'Thông báo {i}', content='Lịch cúp điện tòa B1')
+                                          for i in range(n)], batch_size=2000)
+        NotificationRecipient.objects.bulk_create([
+            NotificationRecipient(notification_id=notification_id, user=student)
+            for notification_id in Notification.objects.filter(title__startswith='Thông báo ')
+            .values_list('id', flat=True)
+        ], batch_size=5000)
+        self.stdout.write(f"Tạo dữ liệu {n} dòng mỗi bảng: {time.perf_counter() - start:.2f}s")
+        return student
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import time
+import urllib.parse
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dorms.utils.vnpay import VNPaySigner
+
+
+def legacy_sign(hash_secret, query):
+    # Cách ký cũ: dựng lại key HMAC ở mỗi lần gọi
+    return hmac.new(bytes(str(hash_secret), 'utf-8'), bytes(query, 'utf-8'), hashlib.sha512).hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Đo thông lượng tạo URL thanh toán và kiểm tra chữ ký VNPay (cách cũ so với VNPaySigner)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20000, help='Số payload mỗi phép đo')
+        parser.add_argument('--repeat', type=int, default=3, help='Lấy kết quả tốt nhất sau số lần chạy này')
+
+    def handle(self, *args, **options):
+        secret = settings.VNPAY_HASH_SECRET_KEY
+        base_url = settings.VNPAY_PAYMENT_URL
+        requests = [self._request(i) for i in range(options['count'])]
+        signer = VNPaySigner(secret)
+        responses = [dict(data, vnp_SecureHash=signer.sign(data)) for data in requests]
+
+        def legacy_urls():
+            for data in requests:
+                query = urllib.parse.urlencode(sorted(data.items()))
+                f"{base_url}?{query}&vnp_SecureHash={legacy_sign(secret, query)}"
+
+        def legacy_verify():
+            for data in responses:
+                payload = data.copy()
+                secure_hash = payload.pop('vnp_SecureHash')
+                legacy_sign(secret, urllib.parse.urlencode(sorted(payload.items()))) == secure_hash
+
+        cases = [
+            ('Tạo URL (cũ)', legacy_urls),
+            ('Tạo URL (VNPaySigner)', lambda: [signer.payment_url(base_url, data) for data in requests]),
+            ('sign_many', lambda: signer.sign_many(requests)),
+            ('Kiểm tra chữ ký (cũ)', legacy_verify),
+            ('verify_many', lambda: signer.verify_many(responses)),
+        ]
+        for label, func in cases:
+            best = min(self._time(func) for _ in range(options['repeat']))
+            self.stdout.write(f"{label}: {best * 1000:.1f} ms, {len(requests) / best:,.0f} payload/s")
+
+    @staticmethod
+    def _time(func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _request(i):
+        return {
+            'vnp_Version': '2.1.0',
+            'vnp_Command': 'pay',
+            'vnp_TmnCode': 'BENCH001',
+            'vnp_Amount': 150000000 + i,
+            'vnp_CurrCode': 'VND',
+            'vnp_TxnRef': f'{i}_{int(datetime.now().timestamp())}',
+            'vnp_OrderInfo': 'Hóa đơn ký túc xá tháng 06/2025',
+            'vnp_OrderType': 'billpayment',
+            'vnp_Locale': 'vn',
+            'vnp_CreateDate': '20250601000000',
+            'vnp_IpAddr': '127.0.0.1',
+            'vnp_ReturnUrl': 'https://example.com/payment-return/',
+        }
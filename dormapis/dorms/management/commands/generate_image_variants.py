@@ -0,0 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from dorms.services import image_service
+
+
+def _setup_worker():
+    django.setup()
+
+
+def _process(task):
+    label, pk = task
+    try:
+        return label, pk, image_service.process(label, pk), None
+    except Exception as ex:
+        return label, pk, False, f"{type(ex).__name__}: {ex}"
+
+
+class Command(BaseCommand):
+    help = 'Tạo ảnh thu nhỏ WebP/JPEG cho ảnh phòng và avatar đã có (chạy song song bằng process pool)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Số process, 0 = chạy ngay trong process hiện tại')
+        parser.add_argument('--force', action='store_true', help='Tạo lại cả những ảnh đã có bản thu nhỏ')
+        parser.add_argument('--model', choices=sorted(image_service.IMAGE_FIELDS), action='append',
+                            help='Chỉ xử lý model này (có thể lặp lại)')
+
+    def handle(self, *args, **options):
+        tasks = list(self._tasks(options['model'] or sorted(image_service.IMAGE_FIELDS), options['force']))
+        if not tasks:
+            self.stdout.write(self.style.SUCCESS('Không có ảnh nào cần xử lý.'))
+            return
+
+        if options['workers'] > 0:
+            # Process con không được dùng chung connection đã mở của process cha
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_setup_worker) as pool:
+                results = list(pool.map(_process, tasks, chunksize=8))
+        else:
+            results = [_process(task) for task in tasks]
+
+        done = 0
+        for label, pk, processed, error in results:
+            if error:
+                self.stderr.write(f"{label} #{pk}: {error}")
+            done += processed
+        self.stdout.write(self.style.SUCCESS(f"Đã tạo ảnh thu nhỏ cho {done}/{len(tasks)} ảnh."))
+
+    @staticmethod
+    def _tasks(labels, force):
+        for label in labels:
+            image_field, variants_field = image_service.IMAGE_FIELDS[label]
+            rows = apps.get_model(label)._default_manager.exclude(**{f'{image_field}__isnull': True}) \
+                .exclude(**{image_field: ''}).values_list('pk', image_field, variants_field).order_by('pk')
+            for pk, source_name, variants in rows.iterator():
+                if force or (variants or {}).get('sizes') is None or variants.get('source') != source_name:
+                    yield label, pk
@@ -0,0 +1,43 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dorms.services import invoice_service
+
+
+class Command(BaseCommand):
+    help = 'Tạo hóa đơn cho cả kỳ từ file chỉ số (CSV hoặc JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', help='Kỳ hóa đơn, dạng YYYY-MM hoặc YYYY-MM-DD')
+        parser.add_argument('file', help='File CSV (room,fee_type,quantity,unit,unit_price,description) hoặc JSON')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--no-notify', action='store_true', help='Không gửi email/thông báo')
+
+    def handle(self, *args, **options):
+        period = options['period']
+        try:
+            fmt = '%Y-%m' if len(period) == 7 else '%Y-%m-%d'
+            billing_period = datetime.strptime(period, fmt).date()
+        except ValueError:
+            raise CommandError(f"Kỳ hóa đơn không hợp lệ: {period}")
+
+        path = options['file']
+        with open(path, 'rb') as f:
+            if path.lower().endswith('.json'):
+                readings = json.load(f)
+            else:
+                readings = invoice_service.read_csv_readings(f)
+
+        try:
+            summary = invoice_service.generate_invoices(billing_period, readings,
+                                                        batch_size=options['batch_size'],
+                                                        notify=not options['no_notify'])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {summary['invoices_created']} hóa đơn, {summary['details_created']} chi tiết; "
+            f"bỏ qua {summary['skipped_paid']} hóa đơn đã thanh toán; gửi {summary['notified']} thông báo."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from dorms.cache import invalidate_catalog
+from dorms.models import Room, RoomRegistration
+
+
+class Command(BaseCommand):
+    help = 'Đối chiếu Room.occupied với số đăng ký đang active và sửa các phòng bị lệch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ báo cáo, không cập nhật')
+
+    def handle(self, *args, **options):
+        drifted = Room.objects.with_occupancy().exclude(occupied=F('active_students')) \
+            .values_list('id', flat=True)
+        fixed = 0
+
+        for room_id in list(drifted):
+            with transaction.atomic():
+                room = Room.objects.select_for_update().get(pk=room_id)
+                actual = RoomRegistration.objects.filter(room_id=room_id, is_active=True).count()
+                if room.occupied == actual:
+                    continue
+
+                self.stdout.write(f"{room}: occupied={room.occupied}, thực tế={actual}")
+                if not options['dry_run']:
+                    Room.objects.filter(pk=room_id).update(occupied=actual)
+                fixed += 1
+
+        if fixed and not options['dry_run']:
+            # update() không gửi signal nên tự vô hiệu hóa cache danh mục
+            invalidate_catalog('room', 'building')
+
+        action = 'cần sửa' if options['dry_run'] else 'đã sửa'
+        self.stdout.write(self.style.SUCCESS(f"{fixed} phòng {action}."))
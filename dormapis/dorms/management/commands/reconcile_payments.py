@@ -0,0 +1,40 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dorms.services import reconciliation_service
+
+
+class Command(BaseCommand):
+    help = 'Đối soát file sao kê VNPay (CSV) với hóa đơn: báo cáo giao dịch mồ côi, thanh toán trùng, lỡ IPN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='File CSV có các cột vnp_TxnRef,vnp_Amount,vnp_ResponseCode[,vnp_TransactionNo]')
+        parser.add_argument('--report', help='Ghi báo cáo CSV ra file này (mặc định: stdout)')
+        parser.add_argument('--apply', action='store_true',
+                            help='Đánh dấu đã thanh toán các hóa đơn bị lỡ IPN (mặc định chỉ báo cáo)')
+        parser.add_argument('--chunk-size', type=int, default=reconciliation_service.RECONCILE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        report_file = open(options['report'], 'w', newline='', encoding='utf-8') if options['report'] else sys.stdout
+        try:
+            with open(options['file'], 'r', newline='', encoding='utf-8-sig') as f:
+                report = csv.writer(report_file)
+                report.writerow(reconciliation_service.REPORT_FIELDS)
+                summary = reconciliation_service.reconcile(
+                    reconciliation_service.iter_statement(f), report,
+                    apply=options['apply'], chunk_size=options['chunk_size']
+                )
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        finally:
+            if report_file is not sys.stdout:
+                report_file.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"{summary['rows']} dòng: {summary['ok']} khớp, {summary['failed']} thất bại, "
+            f"{summary['orphan']} mồ côi, {summary['amount_mismatch']} lệch số tiền, "
+            f"{summary['double_payment']} thanh toán trùng, {summary['missed_ipn']} lỡ IPN "
+            f"({summary['applied']} đã ghi nhận)."
+        ))
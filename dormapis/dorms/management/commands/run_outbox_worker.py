@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dorms.services import outbox_service
+
+
+class Command(BaseCommand):
+    help = 'Worker gửi email/thông báo đẩy trong outbox, có retry và backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Số thread gửi song song')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=2.0, help='Số giây chờ khi outbox trống')
+        parser.add_argument('--once', action='store_true', help='Gửi hết các tin đến hạn rồi thoát')
+
+    def handle(self, *args, **options):
+        while True:
+            summary = outbox_service.drain(batch_size=options['batch_size'], workers=options['workers'])
+            processed = sum(summary.values())
+            if processed:
+                self.stdout.write(f"Đã gửi {summary['sent']}, chờ gửi lại {summary['retry']}, "
+                                  f"thất bại {summary['failed']}")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
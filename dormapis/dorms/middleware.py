@@ -0,0 +1,160 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .utils.querybudget import QueryStats
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, không có thì chỉ nén gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_BUDGET = {
+    'ENABLED': False,
+    # Số query tối đa cho một request, view có thể đặt riêng bằng thuộc tính query_budget
+    'MAX_QUERIES': 50,
+    # Cùng một hình dạng SQL lặp lại từ N lần trở lên được coi là nghi N+1
+    'REPEAT_THRESHOLD': 10,
+    # True: vượt ngân sách thì raise QueryBudgetExceeded (dùng khi chạy test)
+    'RAISE': False,
+}
+
+
+class QueryBudgetMiddleware:
+    """
+    Đếm số query/thời gian DB của từng request, phát hiện SQL lặp lại (N+1),
+    trả header Server-Timing và ghi log dạng JSON. Bật bằng QUERY_BUDGET['ENABLED'].
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = {**DEFAULT_QUERY_BUDGET, **getattr(settings, 'QUERY_BUDGET', {})}
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+
+        budget = getattr(request, 'query_budget', None) or self.config['MAX_QUERIES']
+        repeated = stats.repeated(self.config['REPEAT_THRESHOLD'])
+        over_budget = stats.count > budget
+
+        response['Server-Timing'] = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(stats.duration * 1000, 1),
+            'budget': budget,
+            'repeated': repeated,
+        }
+        if over_budget or repeated:
+            logger.warning(json.dumps(record, ensure_ascii=False))
+            if self.config['RAISE']:
+                stats.check(budget, self.config['REPEAT_THRESHOLD'])
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF/Django class-based view: đọc ngân sách riêng từ thuộc tính query_budget của class
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        request.query_budget = getattr(view_class, 'query_budget', None)
+        return None
+
+
+# Chỉ nén response của API (không nén HTML của admin có CSRF token, tránh BREACH)
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+# Mức nén brotli cho nội dung động: 11 cho file tĩnh, 4-5 cân bằng tốc độ/kích thước
+BROTLI_QUALITY = 5
+
+
+def accepted_encoding(header, available):
+    """Chọn encoding có q cao nhất trong Accept-Encoding, bằng nhau thì theo thứ tự của available"""
+    weights = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        try:
+            q = float(params.strip()[2:]) if params.strip().startswith('q=') else 1.0
+        except ValueError:
+            q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_stream(encoding, chunks):
+    if encoding == 'gzip':
+        yield from compress_sequence(chunks, max_random_bytes=100)
+        return
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Nén response JSON/CSV bằng brotli (nếu có cài đặt) hoặc gzip theo Accept-Encoding.
+    Response nhỏ hơn COMPRESSION_MIN_SIZE byte được giữ nguyên vì nén không đáng.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.encodings = ('br', 'gzip') if brotli else ('gzip',)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if response.has_header('Content-Encoding') or content_type not in COMPRESSIBLE_TYPES:
+            return response
+        if response.streaming:
+            if response.is_async:
+                return response
+        elif len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request.headers.get('Accept-Encoding', ''), self.encodings)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(encoding, response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'gzip':
+                compressed = compress_string(response.content, max_random_bytes=100)
+            else:
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # Nội dung đã khác byte gốc nên ETag chỉ còn là weak ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 00:30
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_occupied(apps, schema_editor):
+    Room = apps.get_model('dorms', 'Room')
+    RoomRegistration = apps.get_model('dorms', 'RoomRegistration')
+    active_count = RoomRegistration.objects.filter(room=OuterRef('pk'), is_active=True) \
+        .order_by().values('room').annotate(c=Count('pk')).values('c')
+    Room.objects.update(occupied=Coalesce(Subquery(active_count, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0009_alter_user_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='occupied',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_occupied, migrations.RunPython.noop),
+    ]
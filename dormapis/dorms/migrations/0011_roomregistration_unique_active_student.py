@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0010_room_occupied'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='roomregistration',
+            constraint=models.UniqueConstraint(models.Case(models.When(is_active=True, then=models.F('student')), default=None), name='unique_active_registration_per_student'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 00:34
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_amount(apps, schema_editor):
+    Invoice = apps.get_model('dorms', 'Invoice')
+    InvoiceDetail = apps.get_model('dorms', 'InvoiceDetail')
+    detail_sum = InvoiceDetail.objects.filter(invoice=OuterRef('pk')).order_by() \
+        .values('invoice').annotate(total=Sum('amount')).values('total')
+    Invoice.objects.update(total_amount=Coalesce(Subquery(detail_sum), Value(Decimal('0.00'))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0011_roomregistration_unique_active_student'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_total_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0013_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='channel',
+            field=models.CharField(choices=[('email', 'Email'), ('push', 'Push (FCM)'), ('broadcast', 'Push tới người nhận của Notification')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 00:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0014_alter_outboxmessage_channel'),
+    ]
+
+    operations = [
+        # Dùng lại bảng M2M tự sinh dorms_notification_target_users làm bảng trung gian,
+        # chỉ thay đổi state, không tạo/copy dữ liệu sang bảng mới.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='NotificationRecipient',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='dorms.notification')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_receipts', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'dorms_notification_target_users',
+                        'unique_together': {('notification', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='notification',
+                    name='target_users',
+                    field=models.ManyToManyField(related_name='notifications', through='dorms.NotificationRecipient', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name='notificationrecipient',
+            name='is_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='notificationrecipient',
+            name='read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['-created_at', '-id'], name='notification_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationrecipient',
+            index=models.Index(fields=['user', 'notification'], name='recipient_user_notif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationrecipient',
+            index=models.Index(fields=['user', 'is_read'], name='recipient_user_read_idx'),
+        ),
+    ]
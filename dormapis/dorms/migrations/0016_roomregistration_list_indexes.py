@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0015_notificationrecipient'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roomregistration',
+            index=models.Index(fields=['is_active', 'registered_at'], name='registration_active_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomregistration',
+            index=models.Index(fields=['room', 'registered_at'], name='registration_room_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0017_paymenttransaction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='supportrequest',
+            index=models.Index(fields=['-created_at', '-id'], name='support_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportrequest',
+            index=models.Index(fields=['student', '-created_at', '-id'], name='support_student_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportrequest',
+            index=models.Index(fields=['is_resolved', '-created_at', '-id'], name='support_resolved_created_idx'),
+        ),
+    ]
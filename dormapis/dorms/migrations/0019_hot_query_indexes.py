@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dorms', '0018_supportrequest_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fcmdevice',
+            index=models.Index(fields=['user', 'id'], name='fcm_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['room', 'is_paid'], name='invoice_room_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomregistration',
+            index=models.Index(fields=['student', 'is_active'], name='registration_student_act_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomregistration',
+            index=models.Index(fields=['room', 'is_active'], name='registration_room_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomswap',
+            index=models.Index(fields=['student', 'is_approved'], name='roomswap_student_approved_idx'),
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from decimal import Decimal
 from ckeditor.fields import RichTextField
 from cloudinary.models import CloudinaryField
+from .cache import invalidate_catalog
 # Create your models here.
 
 
@@ -15,14 +19,17 @@ class User(AbstractUser):
     student_code = models.CharField(max_length=100, blank=True, null=True, unique=True)
     avatar = models.ImageField(upload_to='users/%Y/%m', null=True)
     # models.ImageField(upload_to='uploads/avatars/%Y/%m', null=True, blank=True)
+    # Các bản thu nhỏ của avatar do image_service tạo: {'source': tên ảnh gốc, 'sizes': {...}}
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     updated_profile = models.DateTimeField(null=True, blank=True)
+    GENDER_CHOICES = [
+        ('male', 'Nam'),
+        ('female', 'Nữ'),
+        ('other', 'Khác')
+    ]
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='student')
     gender = models.CharField(max_length=20,
-                              choices=[
-                                  ('male', 'Nam'),
-                                  ('female', 'Nữ'),
-                                  ('other', 'Khác')
-                              ],
+                              choices=GENDER_CHOICES,
                             null = True,
                             blank = True
                         )
@@ -39,6 +46,12 @@ class FCMDevice(models.Model):
     token = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # firebase_service.iter_tokens: lọc theo user, duyệt keyset theo id
+            models.Index(fields=['user', 'id'], name='fcm_user_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.token[:10]}..."
 
@@ -51,6 +64,14 @@ class Building(models.Model):
         return self.name
 
 
+class RoomQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        # Đếm số sinh viên đang ở ngay trong SQL thay vì mỗi phòng một câu COUNT
+        return self.annotate(
+            active_students=Count('roomregistration', filter=Q(roomregistration__is_active=True))
+        )
+
+
 class Room(models.Model):
     GENDER_CHOICES = [
         ('male', 'Nam'),
@@ -61,19 +82,39 @@ class Room(models.Model):
     name = models.CharField(max_length=100)
     description = RichTextField(null=True, blank=True)
     image = models.ImageField(upload_to='rooms/%Y/%m', null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     capacity = models.PositiveIntegerField()
     gender_restriction = models.CharField(
         max_length=30,
         choices=GENDER_CHOICES,
         default='all'
     )
+    # Số sinh viên đang ở, được cập nhật cùng transaction với RoomRegistration
+    occupied = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RoomQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} - {self.building.name}"
 
+    @staticmethod
+    def occupy(room_id):
+        """Tăng occupied nếu phòng còn chỗ, trả về False khi phòng đã đầy"""
+        occupied = Room.objects.filter(pk=room_id, occupied__lt=F('capacity')) \
+            .update(occupied=F('occupied') + 1) == 1
+        if occupied:
+            # update() không gửi signal nên tự vô hiệu hóa cache danh mục
+            invalidate_catalog('room', 'building')
+        return occupied
+
+    @staticmethod
+    def release(room_id):
+        if Room.objects.filter(pk=room_id, occupied__gt=0).update(occupied=F('occupied') - 1):
+            invalidate_catalog('room', 'building')
+
     @property
     def current_students(self):
-        return RoomRegistration.objects.filter(room=self, is_active=True).count()
+        return self.occupied
 
     @property
     def is_full(self):
@@ -93,6 +134,24 @@ class RoomRegistration(models.Model):
     end_date = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Danh sách/export đăng ký cho admin: lọc theo trạng thái hoặc phòng, sắp theo ngày đăng ký
+            models.Index(fields=['is_active', 'registered_at'], name='registration_active_date_idx'),
+            models.Index(fields=['room', 'registered_at'], name='registration_room_date_idx'),
+            # Đăng ký đang hiệu lực của một sinh viên / của các phòng (quyền truy cập, gửi thông báo)
+            models.Index(fields=['student', 'is_active'], name='registration_student_act_idx'),
+            models.Index(fields=['room', 'is_active'], name='registration_room_active_idx'),
+        ]
+        constraints = [
+            # Mỗi sinh viên chỉ có một đăng ký active. Dùng unique index trên biểu thức
+            # (NULL khi inactive) vì MySQL không hỗ trợ partial index.
+            models.UniqueConstraint(
+                Case(When(is_active=True, then=F('student')), default=None),
+                name='unique_active_registration_per_student',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.student.username} - {self.room.name} ({'Active' if self.is_active else 'Inactive'})"
 
@@ -100,9 +159,24 @@ class RoomRegistration(models.Model):
         if not self.room:
             raise ValueError("Phòng không hợp lệ.")
 
-        if self.room.is_full:
-            raise ValueError(f"Phòng {self.room.name} đã đầy, không thể đăng ký thêm")
-        super(RoomRegistration, self).save(*args, **kwargs)
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                # Khóa dòng cũ để hai lần cập nhật đồng thời không cùng trả chỗ cho phòng cũ
+                previous = RoomRegistration.objects.select_for_update().filter(pk=self.pk) \
+                    .values('room_id', 'is_active').first()
+            was_counted = previous is not None and previous['is_active']
+            moved = previous is not None and previous['room_id'] != self.room_id
+
+            # Chỉ giữ chỗ khi đăng ký trở thành active hoặc chuyển sang phòng khác
+            if self.is_active and (not was_counted or moved):
+                if not Room.occupy(self.room_id):
+                    raise ValueError(f"Phòng {self.room.name} đã đầy, không thể đăng ký thêm")
+
+            super(RoomRegistration, self).save(*args, **kwargs)
+
+            if was_counted and (not self.is_active or moved):
+                Room.release(previous['room_id'])
 
 
 class RoomSwap(models.Model):
@@ -118,6 +192,11 @@ class RoomSwap(models.Model):
                                      limit_choices_to={'role__in': ['admin', 'manager']})
     processed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'is_approved'], name='roomswap_student_approved_idx'),
+        ]
+
     def __str__(self):
         return f"Yêu cầu đổi phòng của {self.student.username} - {self.created_at.strftime('%d/%m/%Y')}"
 
@@ -140,6 +219,14 @@ class PaymentMethod(models.Model):
         return self.name
 
 
+class InvoiceQuerySet(models.QuerySet):
+    def update_totals(self):
+        # Tính lại tổng tiền bằng một câu UPDATE ... SET = (SELECT SUM(...)) cho cả tập hóa đơn
+        detail_sum = InvoiceDetail.objects.filter(invoice=OuterRef('pk')).order_by() \
+            .values('invoice').annotate(total=Sum('amount')).values('total')
+        return self.update(total_amount=Coalesce(Subquery(detail_sum), Value(Decimal('0.00'))))
+
+
 class Invoice(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     billing_period = models.DateField()
@@ -152,19 +239,20 @@ class Invoice(models.Model):
         null=True,
         blank=True
     )
+    # Tổng tiền các InvoiceDetail, được cập nhật mỗi khi chi tiết hóa đơn thay đổi
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
+
+    objects = InvoiceQuerySet.as_manager()
 
     class Meta:
         unique_together = ('room', 'billing_period')  # Mỗi phòng chỉ có 1 hóa đơn/tháng
+        indexes = [
+            models.Index(fields=['room', 'is_paid'], name='invoice_room_paid_idx'),
+        ]
 
     def __str__(self):
         return f"Hóa đơn phòng {self.room.name} - {self.billing_period.strftime('%m/%Y')}"
 
-    @property
-    def total_amount(self):
-        return sum(
-            (detail.amount or Decimal('0.00')) for detail in self.invoice_details.all()
-        )
-
 
 class InvoiceDetail(models.Model):
     UNIT_CHOICES = [
@@ -212,6 +300,37 @@ class InvoiceDetail(models.Model):
     class Meta:
         unique_together = ('invoice', 'fee_type')
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous_invoice_id = None
+            if self.pk:
+                previous_invoice_id = InvoiceDetail.objects.filter(pk=self.pk) \
+                    .values_list('invoice_id', flat=True).first()
+            super(InvoiceDetail, self).save(*args, **kwargs)
+            Invoice.objects.filter(pk__in={self.invoice_id, previous_invoice_id} - {None}).update_totals()
+
+
+class PaymentTransaction(models.Model):
+    """Sổ giao dịch thanh toán online, mỗi vnp_TxnRef một dòng, dùng để xử lý callback đúng một lần"""
+    STATUS_CHOICES = [
+        ('pending', 'Chờ thanh toán'),
+        ('success', 'Thành công'),
+        ('failed', 'Thất bại'),
+    ]
+    txn_ref = models.CharField(max_length=100, unique=True)
+    invoice = models.ForeignKey(Invoice, on_delete=models.PROTECT, related_name='transactions')
+    payment_method = models.ForeignKey(PaymentMethod, on_delete=models.SET_NULL, null=True, blank=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    response_code = models.CharField(max_length=10, blank=True, null=True)
+    transaction_no = models.CharField(max_length=50, blank=True, null=True)
+    payload = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.txn_ref} - {self.status}"
+
 
 class NotificationType(models.Model):
     name = models.CharField(max_length=100)
@@ -227,13 +346,73 @@ class Notification(models.Model):
     notification_type = models.ForeignKey(NotificationType, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     sent_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='sent_notifications')
-    target_users = models.ManyToManyField(User, related_name='notifications')
+    target_users = models.ManyToManyField(User, related_name='notifications', through='NotificationRecipient')
     is_urgent = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='notification_created_idx'),
+        ]
+
     def __str__(self):
         return f"[{self.notification_type}] {self.title}"
 
 
+class NotificationRecipient(models.Model):
+    # Bảng trung gian của Notification.target_users, lưu trạng thái đã đọc cho từng người nhận
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='recipients')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_receipts')
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'dorms_notification_target_users'
+        unique_together = ('notification', 'user')
+        indexes = [
+            # Feed: WHERE user_id = ? rồi join notification theo khóa chính
+            models.Index(fields=['user', 'notification'], name='recipient_user_notif_idx'),
+            # unread-count: WHERE user_id = ? AND is_read = false
+            models.Index(fields=['user', 'is_read'], name='recipient_user_read_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.notification_id} ({'Đã đọc' if self.is_read else 'Chưa đọc'})"
+
+
+class OutboxMessage(models.Model):
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('push', 'Push (FCM)'),
+        ('broadcast', 'Push tới người nhận của Notification'),
+        ('image', 'Tạo ảnh thu nhỏ'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Đang chờ'),
+        ('processing', 'Đang gửi'),
+        ('sent', 'Đã gửi'),
+        ('failed', 'Thất bại'),
+    ]
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    recipient = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='outbox_messages')
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.channel}] {self.recipient} - {self.status}"
+
+
 class SupportRequest(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'student'})
     room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True)
@@ -242,6 +421,14 @@ class SupportRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_resolved = models.BooleanField(default=False)
 
+    class Meta:
+        # Khớp với thứ tự phân trang (-created_at, -id) của hộp thư hỗ trợ
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='support_created_idx'),
+            models.Index(fields=['student', '-created_at', '-id'], name='support_student_created_idx'),
+            models.Index(fields=['is_resolved', '-created_at', '-id'], name='support_resolved_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.student.username}"
 
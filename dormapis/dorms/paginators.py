@@ -1,5 +1,22 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class ItemPaginator(PageNumberPagination):
-    page_size = 4
\ No newline at end of file
+    page_size = 4
+
+
+class RegistrationPaginator(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class NotificationCursorPaginator(CursorPagination):
+    # Phân trang theo con trỏ (created_at, id): không dùng OFFSET, ổn định khi có thông báo mới
+    page_size = 20
+    ordering = ('-created_at', '-id')
+
+
+class SupportRequestCursorPaginator(CursorPagination):
+    page_size = 20
+    ordering = ('-created_at', '-id')
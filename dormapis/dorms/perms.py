@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .context import get_student_context
+
 
 class OwnerPerms(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, obj):
@@ -18,9 +20,9 @@ class RoomSwapOwner(permissions.IsAuthenticated):
 
 class IsStudent(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.role == 'student'
+        return get_student_context(request).is_student
 
 
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and request.user.role == 'admin'
+        return get_student_context(request).is_admin
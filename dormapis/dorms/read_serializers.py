@@ -0,0 +1,202 @@
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers as drf_serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import serializers
+from .models import InvoiceDetail
+from .utils.media import get_media_resolver
+
+# Field của DRF trả nguyên giá trị đọc từ DB (.values()), không cần gọi to_representation
+PASSTHROUGH_FIELDS = (
+    drf_serializers.CharField, drf_serializers.IntegerField, drf_serializers.BooleanField,
+    drf_serializers.FloatField, drf_serializers.ChoiceField, drf_serializers.JSONField,
+    drf_serializers.PrimaryKeyRelatedField,
+)
+
+
+def _iso_datetime(value, tz):
+    # Giống DateTimeField.to_representation (ISO 8601, USE_TZ) với giá trị có timezone đọc từ DB
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _is_plain_iso_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return settings.USE_TZ and not hasattr(field, 'timezone') and \
+        isinstance(output_format, str) and output_format.lower() == ISO_8601
+
+
+def _passthrough_getter(source):
+    return lambda s, media, tz, memos: itemgetter(source)
+
+
+def _media_getter(source, method):
+    def build(s, media, tz, memos):
+        convert = getattr(media, method)
+        return lambda row: convert(row[source])
+    return build
+
+
+def _iso_getter(source):
+    def build(s, media, tz, memos):
+        return lambda row: None if (value := row[source]) is None else _iso_datetime(value, tz)
+    return build
+
+
+def _memo_getter(source, index):
+    def build(s, media, tz, memos):
+        memo = memos[index]
+        return lambda row: None if (value := row[source]) is None else memo[value]
+    return build
+
+
+class _Memo(dict):
+    # Ngày, số tiền lặp lại nhiều trong một trang (kỳ hóa đơn, đơn giá): mỗi giá trị chỉ format một lần
+    def __init__(self, convert):
+        super().__init__()
+        self.convert = convert
+
+    def __missing__(self, value):
+        result = self[value] = self.convert(value)
+        return result
+
+
+class ReadSerializer:
+    """
+    Serializer chỉ đọc cho các API danh sách lớn: đọc dict từ .values() thay vì dựng model instance,
+    mỗi dòng được chuyển bằng một hàm dựng sẵn từ danh sách field của serializer_class (cùng thứ tự,
+    cùng định dạng giá trị). Field SerializerMethodField/nested được thay bằng get_<tên field>(row).
+    """
+    serializer_class = None
+    # Cột/annotation thêm cần cho các get_<field>
+    extra_values = ()
+    # Annotation chỉ có ở một số queryset (vd. trạng thái đã đọc khi xem với tư cách người nhận)
+    optional_values = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+
+    @classmethod
+    def _compiled(cls):
+        if '_getters' not in cls.__dict__:
+            cls._getters, cls._converters, cls._paths = cls._compile()
+        return cls._getters, cls._converters, cls._paths
+
+    @classmethod
+    def _compile(cls):
+        # Mỗi field là (tên, hàm dựng getter(s, media, tz, memos) -> getter(row)); getter gắn với
+        # request/timezone được dựng một lần cho mỗi lần serialize, không phải mỗi dòng
+        paths, getters, converters = [], [], []
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            if hasattr(cls, f'get_{name}'):
+                getters.append((name, lambda s, media, tz, memos, name=name: getattr(s, f'get_{name}')))
+                continue
+
+            if isinstance(field, serializers.MediaImageField):
+                build = _media_getter(source, 'url')
+            elif isinstance(field, serializers.MediaSrcsetField):
+                build = _media_getter(source, 'srcset')
+            elif isinstance(field, PASSTHROUGH_FIELDS):
+                build = _passthrough_getter(source)
+            elif isinstance(field, drf_serializers.DateTimeField) and _is_plain_iso_datetime(field):
+                build = _iso_getter(source)
+            elif isinstance(field, (drf_serializers.DateTimeField, drf_serializers.DateField,
+                                    drf_serializers.DecimalField)):
+                build = _memo_getter(source, len(converters))
+                converters.append(field.to_representation)
+            else:
+                raise ImproperlyConfigured(f"{cls.__name__} cần get_{name}(row) cho field {type(field).__name__}.")
+
+            paths.append(source)
+            getters.append((name, build))
+
+        return tuple(getters), converters, tuple(dict.fromkeys(paths + list(cls.extra_values)))
+
+    def values(self, queryset):
+        _, _, paths = self._compiled()
+        optional = [name for name in self.optional_values if name in queryset.query.annotations]
+        return queryset.prefetch_related(None).values(*paths, *optional)
+
+    def prepare(self, rows):
+        """Tải dữ liệu lồng nhau cho cả lô trước khi chuyển từng dòng"""
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        builders, converters, _ = self._compiled()
+        media = get_media_resolver(self.context.get('request'))
+        tz = timezone.get_current_timezone()
+        memos = [_Memo(convert) for convert in converters]
+        getters = [(name, build(self, media, tz, memos)) for name, build in builders]
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+class RoomReadSerializer(ReadSerializer):
+    serializer_class = serializers.RoomSerializer
+    extra_values = ('active_students',)
+
+    def get_current_students(self, row):
+        return row['active_students']
+
+    def get_is_full(self, row):
+        return row['active_students'] >= row['capacity']
+
+    def get_available_capacity(self, row):
+        return max(row['capacity'] - max(row['active_students'], 0), 0)
+
+
+class InvoiceDetailReadSerializer(ReadSerializer):
+    serializer_class = serializers.InvoiceDetailSerializer
+
+
+class InvoiceReadSerializer(ReadSerializer):
+    serializer_class = serializers.InvoiceSerializer
+
+    def prepare(self, rows):
+        details = InvoiceDetailReadSerializer(self.context)
+        queryset = InvoiceDetail.objects.filter(invoice_id__in=[row['id'] for row in rows])
+        self._details = {}
+        for detail in details.serialize(details.values(queryset)):
+            self._details.setdefault(detail['invoice'], []).append(detail)
+
+    def get_invoice_details(self, row):
+        return self._details.get(row['id'], [])
+
+
+class NotificationReadSerializer(ReadSerializer):
+    serializer_class = serializers.NotificationSerializer
+    optional_values = ('is_read', 'read_at')
+
+    def get_is_read(self, row):
+        return row.get('is_read')
+
+    def get_read_at(self, row):
+        read_at = row.get('read_at')
+        return _iso_datetime(read_at, timezone.get_current_timezone()) if read_at else None
+
+
+class ReadSerializerListMixin:
+    """list() của viewset đi qua read_serializer_class, phân trang trên queryset .values()"""
+    read_serializer_class = None
+
+    def get_read_serializer(self):
+        return self.read_serializer_class(self.get_serializer_context())
+
+    def get_rows(self, serializer):
+        return serializer.values(self.filter_queryset(self.get_queryset()))
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_read_serializer()
+        rows = self.get_rows(serializer)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
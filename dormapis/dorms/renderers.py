@@ -0,0 +1,36 @@
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, không có thì dùng json của thư viện chuẩn
+    orjson = None
+
+# datetime/date/time đi qua encoder của DRF để định dạng giống hệt JSONRenderer (vd. hậu tố Z)
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer dùng orjson khi có cài đặt, kết quả giống JSONRenderer ở chế độ mặc định
+    (compact, UTF-8). Trường hợp có indent hoặc orjson không encode được thì dùng lại JSONRenderer.
+    """
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or not self.compact or self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._encoder.default, option=ORJSON_OPTIONS)
+        except (orjson.JSONEncodeError, ValueError):
+            # Số nguyên quá 64 bit, key không phải chuỗi...
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Giống JSONRenderer: escape U+2028/U+2029 để JSON là tập con hợp lệ của JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,4 +1,8 @@
+from django.db import models
 from rest_framework import serializers
+from .context import get_student_context
+from .services import notification_service
+from .utils.media import get_media_resolver
 from .models import User, Room, RoomRegistration, RoomSwap, Building, Invoice, InvoiceDetail, PaymentMethod, FCMDevice, \
     Notification, SupportRequest, SupportResponse
 import re
@@ -7,27 +11,32 @@ from datetime import date
 from decimal import Decimal
 
 
-class BaseSerializer(serializers.ModelSerializer):
-    def to_representation(self, instance):
-        d = super().to_representation(instance)
+class MediaImageField(serializers.ImageField):
+    # URL tuyệt đối (hoặc CDN) ghép từ base của request, '' nếu chưa có ảnh
+    def to_representation(self, value):
+        return get_media_resolver(self.context.get('request')).url(value.name if value else '')
 
-        request = self.context.get('request')
-        if instance.image:
-            # Tự build đường dẫn có /static/ nếu ảnh nằm trong static files
-            image_path = instance.image.name  # VD: 'rooms/2025/05/room1.jpg'
-            static_url = '/static/'  # Hoặc settings.STATIC_URL nếu đã cấu hình
-            full_url = request.build_absolute_uri(static_url + image_path) if request else static_url + image_path
-            d['image'] = full_url
-        else:
-            d['image'] = ''
 
-        return d
+class MediaSrcsetField(serializers.ReadOnlyField):
+    # Các bản thu nhỏ WebP/JPEG theo kích thước (image_service), client tự chọn bản phù hợp
+    def to_representation(self, value):
+        return get_media_resolver(self.context.get('request')).srcset(value)
+
+
+class BaseSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.ImageField: MediaImageField,
+    }
+
 
+class UserSerializer(BaseSerializer):
+    avatar_srcset = MediaSrcsetField(source='avatar_variants')
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'first_name', 'last_name', 'username', 'password', 'avatar', 'role', 'gender', 'email']
+        fields = ['id', 'first_name', 'last_name', 'username', 'password', 'avatar', 'role', 'gender', 'email',
+                  'avatar_srcset']
         extra_kwargs = {
             'password': {
                 'write_only': True
@@ -43,23 +52,6 @@ class UserSerializer(serializers.ModelSerializer):
 
         return u
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        request = self.context.get('request')
-
-        if instance.avatar:
-            # Dùng avatar.url => luôn là đường dẫn tương đối (/static/...)
-            avatar_url = instance.avatar.url
-            static_url = '/static/'
-            # build absolute url: https://... nếu có request
-            if request is not None:
-                avatar_url = request.build_absolute_uri(static_url + avatar_url)
-            data['avatar'] = avatar_url
-        else:
-            data['avatar'] = ''
-
-        return data
-
 
 class UpdateProfileSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False, min_length=6)
@@ -109,14 +101,32 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
 
 
 class RoomSerializer(BaseSerializer):
-    current_students = serializers.IntegerField(read_only=True)
-    is_full = serializers.BooleanField(read_only=True)
-    available_capacity = serializers.IntegerField(read_only=True)
+    image_srcset = MediaSrcsetField(source='image_variants')
+    current_students = serializers.SerializerMethodField()
+    is_full = serializers.SerializerMethodField()
+    available_capacity = serializers.SerializerMethodField()
 
     class Meta:
         model = Room
         fields = ['id', 'name', 'building', 'description', 'image', 'capacity', 'gender_restriction',
-                  'current_students', 'is_full', 'available_capacity']
+                  'current_students', 'is_full', 'available_capacity', 'image_srcset']
+
+    def _occupancy(self, room):
+        # Ưu tiên giá trị annotate từ Room.objects.with_occupancy(), tránh COUNT cho từng phòng
+        occupancy = getattr(room, 'active_students', None)
+        if occupancy is None:
+            occupancy = room.current_students
+        return occupancy
+
+    def get_current_students(self, room):
+        return self._occupancy(room)
+
+    def get_is_full(self, room):
+        return self._occupancy(room) >= room.capacity
+
+    def get_available_capacity(self, room):
+        return max(room.capacity - max(self._occupancy(room), 0), 0)
+
 
 class RoomRegistrationAdminSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source="student.get_full_name", read_only=True)
@@ -144,12 +154,8 @@ class RegisterRoomSerializer(serializers.ModelSerializer):
         if room.is_full:
             raise serializers.ValidationError("{room.name} đã đầy")
 
-        already_registered = RoomRegistration.objects.filter(
-            student=user,
-            is_active=True
-        ).exists()
-
-        if already_registered:
+        # Ràng buộc unique_active_registration_per_student vẫn chặn các request đồng thời
+        if get_student_context(self.context['request']).has_room:
             raise serializers.ValidationError(
                 "Bạn đã đăng ký phòng rồi. Nếu muốn chuyển phòng, hãy gửi yêu cầu chuyển phòng để được duyệt."
             )
@@ -179,11 +185,7 @@ class RoomSwapSerializer(serializers.ModelSerializer):
         if desired_room.is_full:
             raise serializers.ValidationError(f"Phòng {desired_room.name} đã đầy, vui lòng chọn phòng khác.")
 
-        current_registration = RoomRegistration.objects.filter(
-            student=student, is_active=True
-        ).first()
-
-        if current_registration and current_registration.room == desired_room:
+        if get_student_context(request).owns_room(desired_room.pk):
             raise serializers.ValidationError("Bạn đang ở phòng này rồi.")
 
         # ✅ Kiểm tra giới tính phòng và sinh viên
@@ -239,6 +241,24 @@ class InvoiceSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class InvoiceBulkGenerateSerializer(serializers.Serializer):
+    billing_period = serializers.DateField()
+    readings = serializers.ListField(child=serializers.DictField(), required=False)
+    file = serializers.FileField(required=False)
+    notify = serializers.BooleanField(default=True)
+
+    def validate(self, attrs):
+        if not attrs.get('readings') and not attrs.get('file'):
+            raise serializers.ValidationError("Cần gửi danh sách readings hoặc file CSV.")
+        return attrs
+
+
+class PaymentMethodSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentMethod
+        fields = ['id', 'name', 'description']
+
+
 class InvoicePaySerializer(serializers.Serializer):
     payment_method = serializers.PrimaryKeyRelatedField(queryset=PaymentMethod.objects.filter(active=True))
 
@@ -250,17 +270,41 @@ class FCMDeviceSerializer(serializers.ModelSerializer):
 
 
 class NotificationSerializer(serializers.ModelSerializer):
+    audience = serializers.ChoiceField(choices=notification_service.AUDIENCE_CHOICES, write_only=True, required=False)
+    building = serializers.PrimaryKeyRelatedField(queryset=Building.objects.all(), write_only=True, required=False)
+    room = serializers.PrimaryKeyRelatedField(queryset=Room.objects.all(), write_only=True, required=False)
+    gender = serializers.ChoiceField(choices=User.GENDER_CHOICES, write_only=True, required=False)
+    # Không trả về danh sách người nhận (có thể hàng chục nghìn id) trong feed
+    target_users = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), many=True, write_only=True,
+                                                      required=False)
+    is_read = serializers.SerializerMethodField()
+    read_at = serializers.SerializerMethodField()
+
     class Meta:
         model = Notification
         fields = "__all__"
         read_only_fields = ['sent_by', 'created_at']
 
+    def get_is_read(self, notification):
+        # Giá trị annotate từ NotificationViewSet, None khi không xem với tư cách người nhận
+        return getattr(notification, 'is_read', None)
 
-class SupportRequestSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = SupportRequest
-        fields = "__all__"
-        read_only_fields = ['student', 'created_at']
+    def get_read_at(self, notification):
+        read_at = getattr(notification, 'read_at', None)
+        return serializers.DateTimeField().to_representation(read_at) if read_at else None
+
+    def validate(self, attrs):
+        audience = attrs.get('audience')
+        if not audience and not attrs.get('target_users'):
+            raise serializers.ValidationError("Cần chọn target_users hoặc audience.")
+        if audience in ('building', 'room', 'gender') and not attrs.get(audience):
+            raise serializers.ValidationError({audience: "Trường này là bắt buộc với audience đã chọn."})
+        return attrs
+
+    def create(self, validated_data):
+        for key in ('audience', 'building', 'room', 'gender'):
+            validated_data.pop(key, None)
+        return super().create(validated_data)
 
 
 class SupportResponseSerializer(serializers.ModelSerializer):
@@ -269,3 +313,14 @@ class SupportResponseSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ['responder', 'responded_at']
 
+
+class SupportRequestSerializer(serializers.ModelSerializer):
+    responses = SupportResponseSerializer(many=True, read_only=True)
+    # Được annotate trong queryset của hộp thư, yêu cầu vừa tạo chưa có phản hồi
+    response_count = serializers.IntegerField(read_only=True, default=0)
+
+    class Meta:
+        model = SupportRequest
+        fields = "__all__"
+        read_only_fields = ['student', 'created_at']
+
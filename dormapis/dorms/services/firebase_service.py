@@ -1,7 +1,15 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
 from firebase_admin import messaging
-from ..utils.firebase import *
+from ..utils.firebase import get_app
 from ..models import FCMDevice
 
+# Giới hạn số token cho một lần gọi send_each_for_multicast của FCM
+MULTICAST_BATCH_SIZE = 500
+
+# Các lỗi cho biết token đã chết (gỡ app, đổi project...) và nên xóa khỏi DB
+DEAD_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+
 
 def send_push_notification(token: str, title: str, body: str, data: dict = None):
     message = messaging.Message(
@@ -14,25 +22,110 @@ def send_push_notification(token: str, title: str, body: str, data: dict = None)
     )
 
     try:
-        response = messaging.send(message)
+        response = messaging.send(message, app=get_app())
         print("✅ Push notification sent:", response)
         return response
     except messaging.UnregisteredError:
         # Token không hợp lệ (user gỡ cài app chẳng hạn)
         print(f"⚠️ Token không còn hợp lệ: {token}")
-        # Optional: Có thể xóa token này khỏi DB ở đây nếu muốn
+        FCMDevice.objects.filter(token=token).delete()
         return False
     except Exception as e:
         print("❌ Failed to send push notification:", e)
         return None
 
 
-def notify_user(user, title: str, body: str, data: dict = None):
-    devices = FCMDevice.objects.filter(user=user)
-    for device in devices:
-        send_push_notification(
-            token=device.token,
-            title=title,
-            body=body,
+def local_send_each_for_multicast(multicast_message, dry_run=False, app=None):
+    """
+    Stand-in cho messaging.send_each_for_multicast để chạy offline (dev/test/benchmark).
+    Token bắt đầu bằng 'dead' được coi là đã hủy đăng ký.
+    """
+    responses = []
+    for i, token in enumerate(multicast_message.tokens):
+        if token.startswith('dead'):
+            responses.append(messaging.SendResponse(None, messaging.UnregisteredError('Requested entity was not found.')))
+        else:
+            responses.append(messaging.SendResponse({'name': f'projects/local/messages/{i}'}, None))
+    return messaging.BatchResponse(responses)
+
+
+def get_multicast_sender():
+    path = getattr(settings, 'FCM_MULTICAST_SENDER', None)
+    if path:
+        return import_string(path)
+
+    app = get_app()
+    return lambda multicast_message: messaging.send_each_for_multicast(multicast_message, app=app)
+
+
+def send_multicast(tokens, title: str, body: str, data: dict = None, send=None):
+    """
+    Gửi tới danh sách token theo lô MULTICAST_BATCH_SIZE, xóa token chết theo lô.
+    Trả về thống kê từng lô: success, failure, pruned và retry (token lỗi tạm thời, nên gửi lại).
+    """
+    send = send or get_multicast_sender()
+    tokens = list(tokens)
+    reports = []
+
+    for start in range(0, len(tokens), MULTICAST_BATCH_SIZE):
+        batch = tokens[start:start + MULTICAST_BATCH_SIZE]
+        message = messaging.MulticastMessage(
+            tokens=batch,
+            notification=messaging.Notification(title=title, body=body),
             data=data or {}
-        )
\ No newline at end of file
+        )
+        response = send(message)
+
+        dead_tokens, retry_tokens = [], []
+        for token, resp in zip(batch, response.responses):
+            if isinstance(resp.exception, DEAD_TOKEN_ERRORS):
+                dead_tokens.append(token)
+            elif resp.exception is not None:
+                retry_tokens.append(token)
+        if dead_tokens:
+            FCMDevice.objects.filter(token__in=dead_tokens).delete()
+
+        reports.append({
+            'success': response.success_count,
+            'failure': response.failure_count,
+            'pruned': len(dead_tokens),
+            'retry': retry_tokens,
+        })
+
+    return reports
+
+
+def token_page(user_ids, last_id, chunk_size=MULTICAST_BATCH_SIZE):
+    return FCMDevice.objects.filter(user_id__in=user_ids, id__gt=last_id) \
+        .order_by('id').values_list('id', 'token')[:chunk_size]
+
+
+def iter_tokens(user_ids, chunk_size=MULTICAST_BATCH_SIZE):
+    """
+    Lấy token của nhiều user theo từng lô (keyset theo id), không nạp toàn bộ danh sách vào bộ nhớ.
+    user_ids có thể là list hoặc queryset (sẽ thành subquery).
+    """
+    last_id = 0
+    while True:
+        rows = list(token_page(user_ids, last_id, chunk_size))
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [token for _, token in rows]
+
+
+def notify_users(user_ids, title: str, body: str, data: dict = None, send=None):
+    """Gửi một thông báo tới nhiều user (có thể là queryset id) bằng multicast"""
+    send = send or get_multicast_sender()
+    reports = []
+    for tokens in iter_tokens(user_ids):
+        reports.extend(send_multicast(tokens, title, body, data, send=send))
+    return reports
+
+
+def notify_user(user, title: str, body: str, data: dict = None):
+    return notify_users([user.pk], title, body, data)
+
+
+def notify_user_id(user_id, title: str, body: str, data: dict = None):
+    return notify_users([user_id], title, body, data)
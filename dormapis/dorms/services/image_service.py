@@ -0,0 +1,118 @@
+import io
+import os
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from ..cache import invalidate_catalog
+
+# Cạnh dài tối đa (px) và chất lượng nén của từng bản, ảnh nhỏ hơn không bị phóng to
+VARIANTS = {
+    'thumb': (160, 70),
+    'card': (480, 78),
+    'full': (1280, 82),
+}
+FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+
+# Model có ảnh cần tạo bản thu nhỏ: (trường ảnh, trường lưu thông tin các bản)
+IMAGE_FIELDS = {
+    'dorms.room': ('image', 'image_variants'),
+    'dorms.user': ('avatar', 'avatar_variants'),
+}
+# Tên namespace cache danh mục cần xóa khi ảnh của model thay đổi
+CATALOG_NAMESPACES = {
+    'dorms.room': ('room', 'building'),
+}
+
+
+def variant_name(source_name, variant, fmt):
+    """rooms/2025/05/p101.jpg -> rooms/2025/05/p101__thumb.webp (nằm cạnh ảnh gốc)"""
+    base, _ = os.path.splitext(source_name)
+    return f"{base}__{variant}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def variant_files(variants):
+    """Tên các file bản thu nhỏ đang được tham chiếu, gồm cả các bản của ảnh cũ chờ xóa"""
+    variants = variants or {}
+    files = [entry[fmt] for entry in variants.get('sizes', {}).values() for fmt, _ in FORMATS if entry.get(fmt)]
+    return files + [name for name in variants.get('stale', []) if name not in files]
+
+
+def _delete(names, storage=default_storage):
+    for name in names:
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def _has_alpha(img):
+    return img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def _encode(img, fmt, quality, has_alpha):
+    if fmt == 'WEBP':
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    elif has_alpha:
+        # JPEG không có kênh alpha: đặt lên nền trắng
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img.convert('RGBA'), mask=img.convert('RGBA').split()[-1])
+        img = background
+    else:
+        img = img.convert('RGB')
+
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=quality, **({'method': 4} if fmt == 'WEBP' else {'optimize': True}))
+    return out.getvalue()
+
+
+def render_variants(source_name, storage=default_storage):
+    """Tạo các bản thumb/card/full dạng WebP và JPEG cạnh ảnh gốc, trả về thông tin để lưu vào model"""
+    with storage.open(source_name, 'rb') as f:
+        with Image.open(f) as img:
+            img = ImageOps.exif_transpose(img)
+            img.load()
+
+    has_alpha = _has_alpha(img)
+    sizes = {}
+    for variant, (edge, quality) in VARIANTS.items():
+        resized = img.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for fmt, pil_format in FORMATS:
+            name = variant_name(source_name, variant, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            entry[fmt] = storage.save(name, ContentFile(_encode(resized, pil_format, quality, has_alpha)))
+        sizes[variant] = entry
+
+    return {'source': source_name, 'sizes': sizes}
+
+
+def process(label, pk):
+    """
+    Tạo bản thu nhỏ cho ảnh hiện tại của một object và xóa các bản của ảnh cũ (variants['stale']).
+    Trả về False nếu object không còn hoặc ảnh đã bị thay trong lúc đang xử lý.
+    """
+    image_field, variants_field = IMAGE_FIELDS[label]
+    model = apps.get_model(label)
+    row = model._default_manager.filter(pk=pk).values_list(image_field, variants_field).first()
+    if row is None:
+        return False
+    source_name, current = row
+    if not source_name and not (current or {}).get('stale'):
+        return False
+
+    variants = render_variants(source_name) if source_name else {}
+    # Chỉ ghi nếu ảnh chưa bị thay trong lúc đang xử lý
+    updated = model._default_manager.filter(pk=pk, **{image_field: source_name}) \
+        .update(**{variants_field: variants})
+    if not updated:
+        # Các bản vừa tạo thuộc về ảnh cũ, không model nào tham chiếu tới
+        _delete(variant_files(variants))
+        return False
+
+    _delete(set(current.get('stale', [])) - set(variant_files(variants)))
+    if label in CATALOG_NAMESPACES:
+        invalidate_catalog(*CATALOG_NAMESPACES[label])
+    return True
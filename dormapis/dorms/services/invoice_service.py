@@ -0,0 +1,206 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import Room, FeeType, Invoice, InvoiceDetail, RoomRegistration
+from ..utils.email import send_invoice_email, send_invoice_payment_success_email
+from . import outbox_service
+
+# Danh sách loại phí (có thể tùy chỉnh nếu có thay đổi về gói dịch vụ)
+REQUIRED_FEE_TYPES = {'Tiền phòng', 'Điện', 'Nước', 'Internet'}
+
+
+def period_invoices(room_ids, billing_period):
+    return Invoice.objects.filter(room_id__in=room_ids, billing_period=billing_period)
+
+
+def active_registrations(room_ids):
+    """Đăng ký đang hiệu lực (kèm sinh viên) của các phòng, dùng để gửi thông báo hóa đơn"""
+    return RoomRegistration.objects.filter(room_id__in=room_ids, is_active=True).select_related('student')
+
+
+def read_csv_readings(stream):
+    """Đọc chỉ số từ CSV với header room,fee_type,quantity,unit,unit_price,description"""
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.StringIO(stream.decode('utf-8-sig'))
+    elif not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    return [dict(row) for row in csv.DictReader(stream)]
+
+
+def _to_decimal(value, field, line):
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise ValueError(f"Dòng {line}: {field} không hợp lệ ({value}).")
+    return number
+
+
+def _check_field(name, value, line):
+    """bulk_create không validate model: kiểm tra choices, max_digits/decimal_places của InvoiceDetail trước"""
+    field = InvoiceDetail._meta.get_field(name)
+    try:
+        if name == 'amount':
+            # Như khi lưu qua serializer: DB làm tròn thành tiền theo decimal_places
+            value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+        field.clean(value, None)
+    except (ValidationError, InvalidOperation):
+        raise ValueError(f"Dòng {line}: {name} không hợp lệ ({value}).")
+    return value
+
+
+def _normalize(readings):
+    fee_types = list(FeeType.objects.only('id', 'name'))
+    fee_type_ids = {ft.id for ft in fee_types}
+    fee_type_by_name = {ft.name: ft.id for ft in fee_types}
+
+    room_ids = set()
+    rows = {}
+    for line, reading in enumerate(readings, start=1):
+        room = str(reading.get('room', '')).strip()
+        fee_type = str(reading.get('fee_type', '')).strip()
+        if not room.isdigit():
+            raise ValueError(f"Dòng {line}: mã phòng không hợp lệ ({room}).")
+
+        if fee_type.isdigit() and int(fee_type) in fee_type_ids:
+            fee_type_id = int(fee_type)
+        elif fee_type in fee_type_by_name:
+            fee_type_id = fee_type_by_name[fee_type]
+        else:
+            raise ValueError(f"Dòng {line}: loại phí không tồn tại ({fee_type}).")
+
+        quantity = _to_decimal(reading.get('quantity'), 'quantity', line)
+        unit_price = _check_field('unit_price', _to_decimal(reading.get('unit_price'), 'unit_price', line), line)
+        unit = _check_field('unit', reading.get('unit') or None, line)
+        # Cùng công thức với InvoiceDetailSerializer
+        amount = _check_field('amount', (quantity or Decimal('0')) * (unit_price or Decimal('0.0')), line)
+
+        room_ids.add(int(room))
+        rows[(int(room), fee_type_id)] = {
+            'quantity': float(quantity) if quantity is not None else None,
+            'unit': unit,
+            'unit_price': unit_price,
+            'amount': amount,
+            'description': reading.get('description') or None,
+        }
+
+    missing = room_ids - set(Room.objects.filter(pk__in=room_ids).values_list('id', flat=True))
+    if missing:
+        raise ValueError(f"Phòng không tồn tại: {', '.join(map(str, sorted(missing)))}.")
+
+    return rows
+
+
+def generate_invoices(billing_period, readings, batch_size=500, notify=True):
+    """
+    Tạo hóa đơn và chi tiết hóa đơn cho cả kỳ bằng bulk_create, mỗi lô phòng một transaction.
+    Chạy lại với cùng dữ liệu không tạo trùng: hóa đơn/chi tiết đã có được giữ nguyên,
+    hóa đơn đã thanh toán bị bỏ qua.
+    """
+    rows = _normalize(readings)
+    details_by_room = {}
+    for (room_id, fee_type_id), values in rows.items():
+        details_by_room.setdefault(room_id, {})[fee_type_id] = values
+
+    room_ids = sorted(details_by_room)
+    summary = {'invoices_created': 0, 'details_created': 0, 'skipped_paid': 0, 'notified': 0}
+    touched = []
+
+    for start in range(0, len(room_ids), batch_size):
+        batch = room_ids[start:start + batch_size]
+        with transaction.atomic():
+            # Khóa các phòng của lô trước khi đọc: hai lần chạy cùng kỳ xử lý lô lần lượt, lần sau thấy dữ liệu
+            # lần trước đã commit (READ COMMITTED) nên số đếm và danh sách hóa đơn cần thông báo là chính xác
+            list(Room.objects.select_for_update().filter(pk__in=batch).order_by('pk').values_list('pk', flat=True))
+            existing = set(period_invoices(batch, billing_period).values_list('room_id', flat=True))
+            new_invoices = [Invoice(room_id=room_id, billing_period=billing_period)
+                            for room_id in batch if room_id not in existing]
+            Invoice.objects.bulk_create(new_invoices, batch_size=batch_size, ignore_conflicts=True)
+
+            # ignore_conflicts vẫn bỏ qua hóa đơn tạo tay qua API (không khóa phòng): đếm lại để chỉ tính
+            # dòng thực sự thêm vào
+            invoices = list(period_invoices(batch, billing_period).only('id', 'room_id', 'is_paid'))
+            summary['invoices_created'] += len(invoices) - len(existing)
+            open_invoices = {}
+            for invoice in invoices:
+                if invoice.is_paid:
+                    summary['skipped_paid'] += 1
+                else:
+                    open_invoices[invoice.room_id] = invoice.id
+
+            existing_details = set(InvoiceDetail.objects.filter(invoice_id__in=open_invoices.values())
+                                   .values_list('invoice_id', 'fee_type_id'))
+            new_details = [
+                InvoiceDetail(invoice_id=invoice_id, fee_type_id=fee_type_id, **values)
+                for room_id, invoice_id in open_invoices.items()
+                for fee_type_id, values in details_by_room[room_id].items()
+                if (invoice_id, fee_type_id) not in existing_details
+            ]
+            InvoiceDetail.objects.bulk_create(new_details, batch_size=batch_size, ignore_conflicts=True)
+
+            if new_details:
+                summary['details_created'] += InvoiceDetail.objects \
+                    .filter(invoice_id__in=open_invoices.values()).count() - len(existing_details)
+                # bulk_create bỏ qua InvoiceDetail.save() nên cập nhật tổng tiền cho cả lô
+                invoice_ids = {d.invoice_id for d in new_details}
+                Invoice.objects.filter(pk__in=invoice_ids).update_totals()
+                touched.extend(invoice_ids)
+
+    if notify and touched:
+        summary['notified'] = notify_new_invoices(touched)
+
+    return summary
+
+
+def notify_new_invoices(invoice_ids):
+    """Gửi thông báo một lần cho các hóa đơn đã đủ các loại phí bắt buộc"""
+    fee_types = {}
+    for invoice_id, name in InvoiceDetail.objects.filter(invoice_id__in=invoice_ids) \
+            .values_list('invoice_id', 'fee_type__name'):
+        fee_types.setdefault(invoice_id, set()).add(name)
+    complete_ids = [invoice_id for invoice_id, names in fee_types.items() if REQUIRED_FEE_TYPES.issubset(names)]
+    complete = {invoice.room_id: invoice
+                for invoice in Invoice.objects.filter(pk__in=complete_ids).select_related('room')}
+
+    registrations = active_registrations(complete)
+    sent = 0
+    for reg in registrations:
+        invoice = complete[reg.room_id]
+        send_invoice_email(reg.student, invoice)
+        outbox_service.enqueue_push(
+            user=reg.student,
+            title="Hóa đơn mới",
+            body=f"{invoice} đã được tạo, tổng tiền: {invoice.total_amount} VNĐ",
+            data={
+                "invoice_id": str(invoice.id),
+                "type": "new_invoice"
+            }
+        )
+        sent += 1
+    return sent
+
+
+def notify_invoice_paid(invoice):
+    """Gửi email + push thanh toán thành công cho sinh viên đang ở phòng của hóa đơn"""
+    registrations = active_registrations([invoice.room_id])
+    sent = 0
+    for reg in registrations:
+        send_invoice_payment_success_email(reg.student, invoice)
+        outbox_service.enqueue_push(
+            user=reg.student,
+            title="Thanh toán thành công",
+            body=f"{invoice} đã được thanh toán thành công.",
+            data={
+                "invoice_id": str(invoice.id),
+                "type": "invoice_paid"
+            }
+        )
+        sent += 1
+    return sent
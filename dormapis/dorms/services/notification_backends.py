@@ -0,0 +1,99 @@
+import threading
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils.module_loading import import_string
+
+from ..models import Notification
+from . import firebase_service
+
+
+class NotificationDeliveryError(Exception):
+    pass
+
+
+class LiveBackend:
+    """Gửi thật qua SMTP (EMAIL_BACKEND của Django) và Firebase Cloud Messaging"""
+
+    def send_email(self, payload):
+        send_mail(payload['subject'], payload['message'], settings.DEFAULT_FROM_EMAIL, payload['recipient_list'])
+
+    def send_push(self, user_id, payload):
+        reports = firebase_service.notify_user_id(user_id, payload['title'], payload['body'], payload.get('data'))
+        self._check(reports)
+
+    def send_broadcast(self, payload, checkpoint=None):
+        """
+        Gửi theo từng lô thiết bị (keyset theo FCMDevice.id) và ghi tiến độ vào payload sau mỗi lô:
+        last_device_id là thiết bị cuối đã gửi, retry_tokens là các token lỗi tạm thời.
+        Lần retry chỉ gửi lại retry_tokens và các thiết bị chưa tới lượt, không gửi trùng cho ai.
+        """
+        send = firebase_service.get_multicast_sender()
+        message = (payload['title'], payload['body'], payload.get('data'))
+        failed = []
+
+        if payload.get('retry_tokens'):
+            reports = firebase_service.send_multicast(payload['retry_tokens'], *message, send=send)
+            failed = [token for report in reports for token in report['retry']]
+            payload['retry_tokens'] = failed
+            if checkpoint:
+                checkpoint(payload)
+
+        recipients = Notification.target_users.through.objects \
+            .filter(notification_id=payload['notification_id']).values('user_id')
+        while True:
+            rows = list(firebase_service.token_page(recipients, payload.get('last_device_id', 0)))
+            if not rows:
+                break
+            reports = firebase_service.send_multicast([token for _, token in rows], *message, send=send)
+            failed += [token for report in reports for token in report['retry']]
+            payload['last_device_id'] = rows[-1][0]
+            payload['retry_tokens'] = failed
+            if checkpoint:
+                checkpoint(payload)
+
+        if failed:
+            raise NotificationDeliveryError(f"Gửi FCM thất bại cho {len(failed)} thiết bị.")
+
+    def _check(self, reports):
+        # Token chết đã được xóa, chỉ retry khi còn lỗi tạm thời
+        failed = sum(report['failure'] - report['pruned'] for report in reports)
+        if failed:
+            raise NotificationDeliveryError(f"Gửi FCM thất bại cho {failed} thiết bị.")
+
+
+class FakeBackend:
+    """
+    Backend giả lập để chạy pipeline offline (dev/test): lưu lại các tin đã "gửi" trong bộ nhớ.
+    Đặt FakeBackend.fail_next = n để n lần gửi tiếp theo bị lỗi (kiểm tra retry).
+    """
+    sent = []
+    fail_next = 0
+    _lock = threading.Lock()
+
+    def _deliver(self, channel, recipient, payload):
+        with self._lock:
+            if FakeBackend.fail_next > 0:
+                FakeBackend.fail_next -= 1
+                raise NotificationDeliveryError("Lỗi giả lập.")
+            FakeBackend.sent.append({'channel': channel, 'recipient': recipient, 'payload': payload})
+
+    def send_email(self, payload):
+        self._deliver('email', payload['recipient_list'], payload)
+
+    def send_push(self, user_id, payload):
+        self._deliver('push', user_id, payload)
+
+    def send_broadcast(self, payload, checkpoint=None):
+        self._deliver('broadcast', payload['notification_id'], payload)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent = []
+            cls.fail_next = 0
+
+
+def get_backend():
+    path = getattr(settings, 'NOTIFICATION_BACKEND', 'dorms.services.notification_backends.LiveBackend')
+    return import_string(path)()
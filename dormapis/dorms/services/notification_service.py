@@ -0,0 +1,88 @@
+from ..models import User, Notification, NotificationRecipient
+from . import outbox_service
+
+AUDIENCE_CHOICES = [
+    ('all', 'Tất cả sinh viên'),
+    ('building', 'Sinh viên trong tòa nhà'),
+    ('room', 'Sinh viên trong phòng'),
+    ('gender', 'Sinh viên theo giới tính'),
+]
+
+FANOUT_CHUNK_SIZE = 2000
+
+
+def resolve_audience(audience, building=None, room=None, gender=None):
+    """Trả về queryset id người nhận, được tính hoàn toàn trong SQL"""
+    students = User.objects.filter(role='student', is_active=True)
+
+    if audience == 'building':
+        students = students.filter(roomregistration__is_active=True, roomregistration__room__building=building)
+    elif audience == 'room':
+        students = students.filter(roomregistration__is_active=True, roomregistration__room=room)
+    elif audience == 'gender':
+        students = students.filter(gender=gender)
+    elif audience != 'all':
+        raise ValueError(f"Đối tượng nhận không hợp lệ: {audience}")
+
+    return students.values_list('id', flat=True).distinct()
+
+
+def iter_ids(id_queryset, chunk_size=FANOUT_CHUNK_SIZE):
+    """Duyệt queryset id theo từng lô (keyset), không nạp toàn bộ danh sách người nhận"""
+    last_id = 0
+    while True:
+        ids = list(id_queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield ids
+
+
+def add_recipients(notification, id_queryset, chunk_size=FANOUT_CHUNK_SIZE):
+    """Ghi các dòng target_users bằng bulk_create theo lô, trả về số người nhận"""
+    through = Notification.target_users.through
+    total = 0
+    for ids in iter_ids(id_queryset, chunk_size):
+        through.objects.bulk_create(
+            [through(notification_id=notification.pk, user_id=user_id) for user_id in ids],
+            batch_size=chunk_size,
+            ignore_conflicts=True
+        )
+        total += len(ids)
+    return total
+
+
+def fan_out(notification_id, audience, building=None, room=None, gender=None):
+    """Worker ghi người nhận theo audience, trả về số người nhận (0 nếu thông báo đã bị xóa)"""
+    notification = Notification.objects.filter(pk=notification_id).first()
+    if notification is None:
+        return 0
+    return add_recipients(notification, resolve_audience(audience, building=building, room=room, gender=gender))
+
+
+def unread_receipts(user_id):
+    return NotificationRecipient.objects.filter(user_id=user_id, is_read=False)
+
+
+def recipient_ids(notification):
+    through = Notification.target_users.through
+    return through.objects.filter(notification_id=notification.pk).values('user_id')
+
+
+def broadcast(notification, audience=None):
+    """
+    Đưa thông báo vào outbox, worker sẽ gửi FCM multicast tới toàn bộ target_users.
+    audience ({'audience': ..., 'building'/'room'/'gender': ...}) được worker fan-out thành target_users
+    trước khi gửi, request tạo thông báo không phải ghi hàng chục nghìn dòng người nhận.
+    """
+    return outbox_service.enqueue_broadcast(
+        notification_id=notification.pk,
+        title=notification.title,
+        body=notification.content,
+        data={
+            "type": "notification",
+            "notification_id": notification.pk,
+            "is_urgent": notification.is_urgent,
+        },
+        audience=audience
+    )
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import OutboxMessage
+from . import image_service, notification_service
+from .notification_backends import get_backend
+
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 30)
+RETRY_MAX_SECONDS = 6 * 60 * 60
+# Tin ở trạng thái processing quá lâu (worker chết giữa chừng) sẽ được nhận lại
+LOCK_TIMEOUT_SECONDS = 10 * 60
+
+
+def enqueue_email(user, subject, message, recipient_list=None):
+    return OutboxMessage.objects.create(
+        channel='email',
+        recipient=user,
+        payload={
+            'subject': subject,
+            'message': message,
+            'recipient_list': recipient_list or [user.email],
+        }
+    )
+
+
+def enqueue_push(user, title, body, data=None):
+    return OutboxMessage.objects.create(
+        channel='push',
+        recipient=user,
+        payload={
+            'title': title,
+            'body': body,
+            # FCM chỉ nhận data dạng chuỗi
+            'data': {key: str(value) for key, value in (data or {}).items()},
+        }
+    )
+
+
+def enqueue_broadcast(notification_id, title, body, data=None, audience=None):
+    payload = {
+        'notification_id': notification_id,
+        'title': title,
+        'body': body,
+        'data': {key: str(value) for key, value in (data or {}).items()},
+    }
+    if audience:
+        payload['audience'] = audience
+    return OutboxMessage.objects.create(channel='broadcast', payload=payload)
+
+
+def enqueue_image(label, pk):
+    # Tạo ảnh thu nhỏ chạy nền trong worker của outbox, request upload không phải chờ
+    return OutboxMessage.objects.create(channel='image', payload={'model': label, 'pk': pk})
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+def due_messages(now):
+    """Tin đến hạn gửi, gồm cả tin processing bị bỏ dở quá LOCK_TIMEOUT_SECONDS"""
+    due = Q(status='pending', next_attempt_at__lte=now) | \
+        Q(status='processing', locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT_SECONDS))
+    return OutboxMessage.objects.filter(due).order_by('next_attempt_at', 'id')
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(due_messages(now).select_for_update(skip_locked=True)[:batch_size])
+        OutboxMessage.objects.filter(pk__in=[m.pk for m in messages]) \
+            .update(status='processing', locked_at=now, attempts=F('attempts') + 1)
+
+    for message in messages:
+        message.attempts += 1
+    return messages
+
+
+def _save_payload(message):
+    return lambda payload: OutboxMessage.objects.filter(pk=message.pk).update(payload=payload)
+
+
+def _deliver(backend, message):
+    try:
+        if message.channel == 'email':
+            backend.send_email(message.payload)
+        elif message.channel == 'broadcast':
+            if 'audience' in message.payload:
+                # Ghi người nhận một lần rồi bỏ audience khỏi payload, lần retry chỉ gửi lại
+                notification_service.fan_out(message.payload['notification_id'], **message.payload.pop('audience'))
+                _save_payload(message)(message.payload)
+            # Tiến độ gửi được lưu sau mỗi lô, retry không gửi lại cho thiết bị đã nhận
+            backend.send_broadcast(message.payload, checkpoint=_save_payload(message))
+        elif message.channel == 'image':
+            image_service.process(message.payload['model'], message.payload['pk'])
+        else:
+            backend.send_push(message.recipient_id, message.payload)
+        return None
+    except Exception as ex:
+        return f"{type(ex).__name__}: {ex}"
+    finally:
+        # Mỗi thread trong pool có connection riêng, đóng lại sau khi dùng
+        connection.close()
+
+
+def drain(batch_size=100, workers=8, backend=None):
+    """Lấy một lô tin đến hạn, gửi song song bằng thread pool và ghi lại kết quả từng tin"""
+    backend = backend or get_backend()
+    messages = claim_batch(batch_size)
+    summary = {'sent': 0, 'retry': 0, 'failed': 0}
+    if not messages:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = list(pool.map(lambda m: _deliver(backend, m), messages))
+
+    now = timezone.now()
+    sent_ids = [m.pk for m, error in zip(messages, errors) if error is None]
+    OutboxMessage.objects.filter(pk__in=sent_ids).update(status='sent', sent_at=now, locked_at=None, last_error=None)
+    summary['sent'] = len(sent_ids)
+
+    for message, error in zip(messages, errors):
+        if error is None:
+            continue
+        if message.attempts >= MAX_ATTEMPTS:
+            OutboxMessage.objects.filter(pk=message.pk).update(status='failed', locked_at=None, last_error=error)
+            summary['failed'] += 1
+        else:
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                status='pending', locked_at=None, last_error=error,
+                next_attempt_at=now + retry_delay(message.attempts)
+            )
+            summary['retry'] += 1
+
+    return summary
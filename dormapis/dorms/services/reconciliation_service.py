@@ -0,0 +1,111 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from ..models import Invoice, PaymentTransaction
+from .vnpay_service import VNPayService
+
+RECONCILE_CHUNK_SIZE = 1000
+
+# Cột bắt buộc trong file sao kê xuất từ cổng VNPay (vnp_Amount nhân 100 như trong API)
+STATEMENT_FIELDS = ('vnp_TxnRef', 'vnp_Amount', 'vnp_ResponseCode')
+REPORT_FIELDS = ['category', 'txn_ref', 'invoice_id', 'amount', 'detail']
+
+
+def iter_statement(stream):
+    """Đọc từng dòng sao kê, không nạp cả file vào bộ nhớ"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(stream)
+    missing = set(STATEMENT_FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"File sao kê thiếu cột: {', '.join(sorted(missing))}.")
+    for row in reader:
+        yield {key: (value or '').strip() for key, value in row.items() if key}
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _invoice_id(txn_ref):
+    invoice_id = txn_ref.split('_')[0]
+    return int(invoice_id) if invoice_id.isdigit() else None
+
+
+def _amount(row):
+    try:
+        return Decimal(row['vnp_Amount']) / 100
+    except InvalidOperation:
+        return None
+
+
+def successful_payments(invoice_ids):
+    return PaymentTransaction.objects.filter(invoice_id__in=invoice_ids, status='success') \
+        .values_list('invoice_id', 'txn_ref')
+
+
+def reconcile(rows, report, apply=False, chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Đối chiếu sao kê VNPay với hóa đơn theo từng lô (in_bulk), ghi các dòng lệch vào report (csv.writer).
+    apply=True ghi nhận các giao dịch thành công bị lỡ IPN, mỗi lô một transaction.
+    """
+    summary = {'rows': 0, 'ok': 0, 'failed': 0, 'orphan': 0, 'amount_mismatch': 0,
+               'double_payment': 0, 'missed_ipn': 0, 'applied': 0}
+
+    for chunk in _chunks(rows, chunk_size):
+        summary['rows'] += len(chunk)
+        invoice_ids = {_invoice_id(row['vnp_TxnRef']) for row in chunk}
+        invoice_ids.discard(None)
+        invoices = Invoice.objects.only('id', 'room_id', 'is_paid', 'total_amount').in_bulk(invoice_ids)
+
+        # Các giao dịch thành công đã có trong sổ của những hóa đơn này
+        paid_refs = {}
+        for invoice_id, txn_ref in successful_payments(invoices):
+            paid_refs.setdefault(invoice_id, set()).add(txn_ref)
+
+        missed = []
+        for row in chunk:
+            txn_ref = row['vnp_TxnRef']
+            amount = _amount(row)
+            invoice = invoices.get(_invoice_id(txn_ref))
+
+            if row['vnp_ResponseCode'] != '00':
+                summary['failed'] += 1
+                continue
+            elif invoice is None:
+                category, detail = 'orphan', 'Không tìm thấy hóa đơn'
+            elif amount != int(invoice.total_amount):
+                category, detail = 'amount_mismatch', f"Hóa đơn {invoice.total_amount}"
+            elif paid_refs.get(invoice.pk, set()) - {txn_ref}:
+                category = 'double_payment'
+                detail = f"Đã thanh toán bởi {', '.join(sorted(paid_refs[invoice.pk] - {txn_ref}))}"
+            elif not invoice.is_paid:
+                category, detail = 'missed_ipn', 'Hóa đơn chưa được đánh dấu đã thanh toán'
+                missed.append((invoice, row))
+            else:
+                summary['ok'] += 1
+                paid_refs.setdefault(invoice.pk, set()).add(txn_ref)
+                continue
+
+            if category in ('missed_ipn', 'double_payment'):
+                paid_refs.setdefault(invoice.pk, set()).add(txn_ref)
+            summary[category] += 1
+            report.writerow([category, txn_ref, invoice.pk if invoice else '', amount, detail])
+
+        if apply and missed:
+            with transaction.atomic():
+                for invoice, row in missed:
+                    response, _ = VNPayService.apply_result(invoice, row)
+                    if response['RspCode'] == '00':
+                        summary['applied'] += 1
+
+    return summary
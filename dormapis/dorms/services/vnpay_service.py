@@ -1,8 +1,12 @@
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from ..models import Invoice
+from ..models import Invoice, PaymentMethod, PaymentTransaction
 from ..utils.vnpay import VNPay
+from . import invoice_service
 
 
 class VNPayService:
@@ -29,28 +33,83 @@ class VNPayService:
         return vnp.get_payment_url(settings.VNPAY_PAYMENT_URL, settings.VNPAY_HASH_SECRET_KEY)
 
     @staticmethod
-    def handle_ipn(input_data: dict):
+    def start_transaction(invoice, payment_method, amount, order_id):
+        """Ghi giao dịch chờ thanh toán vào sổ trước khi chuyển sinh viên sang VNPay"""
+        txn, _ = PaymentTransaction.objects.update_or_create(
+            txn_ref=order_id,
+            defaults={'invoice': invoice, 'payment_method': payment_method, 'amount': amount}
+        )
+        return txn
+
+    @staticmethod
+    def process_payment(input_data: dict):
+        """
+        Xử lý callback (IPN hoặc return URL) đúng một lần cho mỗi vnp_TxnRef.
+        Trả về (phản hồi cho VNPay, giao dịch trong sổ hoặc None).
+        """
         vnp = VNPay()
         vnp.responseData = input_data
-        order_id = input_data.get('vnp_TxnRef')
-        response_code = input_data.get('vnp_ResponseCode')
-
         if not vnp.validate_response(settings.VNPAY_HASH_SECRET_KEY):
-            return {'RspCode': '97', 'Message': 'Invalid Signature'}
+            return {'RspCode': '97', 'Message': 'Invalid Signature'}, None
 
+        order_id = input_data.get('vnp_TxnRef') or ''
         invoice_id = order_id.split("_")[0]
-
-        invoice = Invoice.objects.filter(pk=invoice_id).first()
+        invoice = Invoice.objects.filter(pk=invoice_id).first() if invoice_id.isdigit() else None
         if not invoice:
-            return {'RspCode': '01', 'Message': 'Invoice not found'}
+            return {'RspCode': '01', 'Message': 'Invoice not found'}, None
 
-        if invoice.is_paid:
-            return {'RspCode': '02', 'Message': 'Order Already Updated'}
+        return VNPayService.apply_result(invoice, input_data)
+
+    @staticmethod
+    def apply_result(invoice, input_data: dict):
+        """
+        Ghi nhận kết quả thanh toán (đã xác thực) của một vnp_TxnRef, chỉ lần đầu tiên có hiệu lực.
+        Dùng chung cho callback và đối soát sao kê.
+        """
+        order_id = input_data.get('vnp_TxnRef') or ''
+        try:
+            paid_amount = Decimal(input_data.get('vnp_Amount', '')) / 100
+        except InvalidOperation:
+            paid_amount = None
 
-        if response_code == '00':
-            invoice.is_paid = True
-            invoice.paid_at = timezone.now()
-            invoice.payment_method = 'VNPay'
-            invoice.save()
+        succeeded = input_data.get('vnp_ResponseCode') == '00'
+        now = timezone.now()
 
-        return {'RspCode': '00', 'Message': 'Confirm Success'}
+        with transaction.atomic():
+            txn, _ = PaymentTransaction.objects.get_or_create(
+                txn_ref=order_id,
+                defaults={'invoice': invoice, 'amount': int(invoice.total_amount)}
+            )
+            if txn.invoice_id != invoice.pk or paid_amount != txn.amount:
+                return {'RspCode': '04', 'Message': 'Invalid amount'}, txn
+
+            # Chỉ request đổi được trạng thái pending mới được xử lý, các lần gửi lại sẽ nhận 0 dòng
+            claimed = PaymentTransaction.objects.filter(pk=txn.pk, status='pending').update(
+                status='success' if succeeded else 'failed',
+                response_code=input_data.get('vnp_ResponseCode'),
+                transaction_no=input_data.get('vnp_TransactionNo'),
+                payload=input_data,
+                processed_at=now
+            )
+            txn.refresh_from_db()
+            if not claimed:
+                return {'RspCode': '02', 'Message': 'Order already confirmed'}, txn
+
+            if succeeded:
+                payment_method = txn.payment_method or PaymentMethod.objects.filter(name__iexact='VNPay').first()
+                paid = Invoice.objects.filter(pk=invoice.pk, is_paid=False) \
+                    .update(is_paid=True, paid_at=now, payment_method=payment_method)
+                if not paid:
+                    # Hóa đơn đã được thanh toán bằng giao dịch khác
+                    return {'RspCode': '02', 'Message': 'Order already confirmed'}, txn
+
+                # Email/push đi qua outbox trong cùng transaction nên chỉ được tạo đúng một lần
+                invoice.refresh_from_db()
+                invoice_service.notify_invoice_paid(invoice)
+
+        return {'RspCode': '00', 'Message': 'Confirm Success'}, txn
+
+    @staticmethod
+    def handle_ipn(input_data: dict):
+        response, _ = VNPayService.process_payment(input_data)
+        return response
@@ -0,0 +1,62 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog
+from .context import invalidate_student_context
+from .models import Building, Room, RoomRegistration, Invoice, InvoiceDetail, PaymentMethod, User
+from .services import image_service, outbox_service
+
+
+@receiver([post_save, post_delete], sender=Building)
+def invalidate_building_cache(sender, **kwargs):
+    invalidate_catalog('building')
+
+
+@receiver([post_save, post_delete], sender=Room)
+@receiver([post_save, post_delete], sender=RoomRegistration)
+def invalidate_room_cache(sender, **kwargs):
+    # Chi tiết tòa nhà chứa danh sách phòng kèm số sinh viên đang ở
+    invalidate_catalog('room', 'building')
+
+
+@receiver(post_delete, sender=RoomRegistration)
+def release_room_on_delete(sender, instance, **kwargs):
+    if instance.is_active:
+        Room.release(instance.room_id)
+
+
+@receiver(post_delete, sender=InvoiceDetail)
+def update_invoice_total_on_delete(sender, instance, **kwargs):
+    Invoice.objects.filter(pk=instance.invoice_id).update_totals()
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=User)
+def enqueue_image_variants(sender, instance, **kwargs):
+    label = sender._meta.label_lower
+    image_field, variants_field = image_service.IMAGE_FIELDS[label]
+    source_name = getattr(instance, image_field).name or None
+    current = getattr(instance, variants_field) or {}
+    if current.get('source') == source_name:
+        return
+
+    # Đánh dấu ảnh đã được xếp hàng để lần lưu sau không tạo thêm tin.
+    # Ảnh bị thay hoặc bị xóa: các bản thu nhỏ cũ được worker xóa khỏi storage.
+    variants = {'source': source_name} if source_name else {}
+    stale = image_service.variant_files(current)
+    if stale:
+        variants['stale'] = stale
+    setattr(instance, variants_field, variants)
+    sender.objects.filter(pk=instance.pk).update(**{variants_field: variants})
+    if source_name or stale:
+        outbox_service.enqueue_image(label, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=RoomRegistration)
+def invalidate_student_context_cache(sender, instance, **kwargs):
+    invalidate_student_context(instance.student_id)
+
+
+@receiver([post_save, post_delete], sender=PaymentMethod)
+def invalidate_payment_method_cache(sender, **kwargs):
+    invalidate_catalog('payment-method')
@@ -1,3 +1,1589 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import hmac
+import importlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection, IntegrityError
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from firebase_admin import exceptions as firebase_exceptions, messaging
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import User, Building, Room, RoomRegistration, OutboxMessage, FCMDevice, Notification, FeeType, \
+    NotificationRecipient, Invoice, InvoiceDetail, PaymentMethod, PaymentTransaction, SupportRequest, SupportResponse, Survey, \
+    SurveyQuestion, SurveyResponse
+from .services import firebase_service, image_service, invoice_service, notification_service, outbox_service, \
+    reconciliation_service
+from .services.notification_backends import FakeBackend, LiveBackend
+from .services.vnpay_service import VNPayService
+from . import middleware, read_serializers, serializers
+from .cache import catalog_version
+from .renderers import FastJSONRenderer
+from .utils import query_audit, uploads
+from .utils.querybudget import QueryBudgetExceeded, normalize_sql, query_budget
+from .utils.media import get_media_resolver
+from .utils.vnpay import VNPay, VNPaySigner
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class RoomRegistrationConcurrencyTest(TransactionTestCase):
+    students = 20
+    capacity = 4
+
+    def setUp(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        self.room = Room.objects.create(building=building, name='P101', capacity=self.capacity,
+                                        gender_restriction='male')
+        self.users = [User.objects.create(username=f'sv{i}', role='student', gender='male')
+                      for i in range(self.students)]
+
+    def _register(self, user, barrier, results, errors):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        barrier.wait()
+        try:
+            response = client.post('/register-room/', {'room': self.room.pk}, format='json')
+            results.append(response.status_code)
+        except Exception as ex:
+            errors.append(ex)
+        finally:
+            connection.close()
+
+    def test_parallel_registrations_never_exceed_capacity(self):
+        barrier = threading.Barrier(self.students)
+        results, errors = [], []
+        threads = [threading.Thread(target=self._register, args=(user, barrier, results, errors))
+                   for user in self.users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        # Mỗi request hoặc giữ được chỗ hoặc bị từ chối vì phòng đầy, không có lỗi nào khác
+        self.assertEqual(sorted(set(results)), [201, 400])
+        self.assertEqual(len(results), self.students)
+
+        self.room.refresh_from_db()
+        active = RoomRegistration.objects.filter(room=self.room, is_active=True).count()
+        self.assertEqual(active, self.capacity)
+        self.assertEqual(self.room.occupied, active)
+        self.assertEqual(results.count(201), active)
+
+
+class RoomRegistrationConstraintTest(TestCase):
+    def test_one_active_registration_per_student(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        room = Room.objects.create(building=building, name='P101', capacity=4)
+        student = User.objects.create(username='sv', role='student')
+
+        RoomRegistration.objects.create(student=student, room=room, is_active=False)
+        RoomRegistration.objects.create(student=student, room=room)
+        with self.assertRaises(IntegrityError):
+            RoomRegistration.objects.create(student=student, room=room)
+
+
+class RoomOccupancyTest(TestCase):
+    def setUp(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        self.room = Room.objects.create(building=building, name='P101', capacity=2)
+        self.other = Room.objects.create(building=building, name='P102', capacity=2)
+        self.students = [User.objects.create(username=f'sv{i}', role='student') for i in range(3)]
+
+    def occupied(self, room):
+        room.refresh_from_db()
+        return room.occupied
+
+    def test_occupy_at_capacity_fails(self):
+        self.assertTrue(Room.occupy(self.room.pk))
+        self.assertTrue(Room.occupy(self.room.pk))
+        self.assertFalse(Room.occupy(self.room.pk))
+        self.assertEqual(self.occupied(self.room), 2)
+
+    def test_registration_beyond_capacity_is_rejected(self):
+        RoomRegistration.objects.create(student=self.students[0], room=self.room)
+        RoomRegistration.objects.create(student=self.students[1], room=self.room)
+        with self.assertRaises(ValueError):
+            RoomRegistration.objects.create(student=self.students[2], room=self.room)
+        self.assertEqual(self.occupied(self.room), 2)
+
+    def test_deactivate_and_delete_release_the_room(self):
+        first = RoomRegistration.objects.create(student=self.students[0], room=self.room)
+        second = RoomRegistration.objects.create(student=self.students[1], room=self.room)
+        self.assertEqual(self.occupied(self.room), 2)
+
+        first.is_active = False
+        first.save()
+        first.save()  # Lưu lại đăng ký đã inactive không trả chỗ lần nữa
+        self.assertEqual(self.occupied(self.room), 1)
+
+        second.delete()
+        first.delete()
+        self.assertEqual(self.occupied(self.room), 0)
+
+    def test_moving_between_rooms(self):
+        registration = RoomRegistration.objects.create(student=self.students[0], room=self.room)
+        registration.room = self.other
+        registration.save()
+        self.assertEqual(self.occupied(self.room), 0)
+        self.assertEqual(self.occupied(self.other), 1)
+
+        # Phòng mới đầy thì giữ nguyên phòng cũ
+        for student in self.students[1:]:
+            RoomRegistration.objects.create(student=student, room=self.room)
+        registration.room = self.room
+        with self.assertRaises(ValueError):
+            registration.save()
+        self.assertEqual(self.occupied(self.room), 2)
+        self.assertEqual(self.occupied(self.other), 1)
+
+    def test_reconcile_occupancy_repairs_drift(self):
+        RoomRegistration.objects.create(student=self.students[0], room=self.room)
+        Room.objects.filter(pk=self.room.pk).update(occupied=2)
+        Room.objects.filter(pk=self.other.pk).update(occupied=1)
+
+        out = io.StringIO()
+        call_command('reconcile_occupancy', '--dry-run', stdout=out)
+        self.assertIn('2 phòng cần sửa', out.getvalue())
+        self.assertEqual(self.occupied(self.room), 2)
+
+        call_command('reconcile_occupancy', stdout=io.StringIO())
+        self.assertEqual(self.occupied(self.room), 1)
+        self.assertEqual(self.occupied(self.other), 0)
+
+
+class InvoiceGenerationTest(TestCase):
+    period = date(2025, 6, 1)
+
+    def setUp(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        self.rooms = [Room.objects.create(building=building, name=f'P10{i}', capacity=4) for i in range(2)]
+        self.fee_types = {name: FeeType.objects.create(name=name).pk
+                          for name in ('Tiền phòng', 'Điện', 'Nước', 'Internet')}
+        self.readings = [
+            {'room': room.pk, 'fee_type': name, 'quantity': '1', 'unit': 'tháng', 'unit_price': '100000'}
+            for room in self.rooms for name in ('Tiền phòng', 'Internet')
+        ] + [{'room': room.pk, 'fee_type': self.fee_types['Điện'], 'quantity': 120, 'unit': 'kWh',
+              'unit_price': '3500'} for room in self.rooms]
+
+    def generate(self, readings=None, **kwargs):
+        kwargs.setdefault('notify', False)
+        return invoice_service.generate_invoices(self.period, readings or self.readings, **kwargs)
+
+    def test_rerun_creates_no_duplicates(self):
+        summary = self.generate(batch_size=1)
+        self.assertEqual((summary['invoices_created'], summary['details_created']), (2, 6))
+        self.assertEqual(Invoice.objects.get(room=self.rooms[0]).total_amount, Decimal('620000.00'))
+
+        summary = self.generate()
+        self.assertEqual((summary['invoices_created'], summary['details_created']), (0, 0))
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(InvoiceDetail.objects.count(), 6)
+
+        # Chạy lại với thêm loại phí mới chỉ thêm đúng chi tiết còn thiếu
+        water = [{'room': room.pk, 'fee_type': 'Nước', 'quantity': '5', 'unit_price': '15000'} for room in self.rooms]
+        summary = self.generate(self.readings + water)
+        self.assertEqual((summary['invoices_created'], summary['details_created']), (0, 2))
+        self.assertEqual(Invoice.objects.get(room=self.rooms[0]).total_amount, Decimal('695000.00'))
+
+    def test_paid_invoices_are_skipped(self):
+        self.generate()
+        Invoice.objects.filter(room=self.rooms[0]).update(is_paid=True)
+
+        water = [{'room': room.pk, 'fee_type': 'Nước', 'quantity': '5', 'unit_price': '15000'} for room in self.rooms]
+        summary = self.generate(water)
+        self.assertEqual(summary['skipped_paid'], 1)
+        self.assertEqual(summary['details_created'], 1)
+        self.assertFalse(InvoiceDetail.objects.filter(invoice__room=self.rooms[0],
+                                                      fee_type_id=self.fee_types['Nước']).exists())
+
+    def test_notifies_complete_invoices_once(self):
+        student = User.objects.create(username='sv', role='student', email='sv@ou.edu.vn')
+        RoomRegistration.objects.create(student=student, room=self.rooms[0])
+        water = [{'room': room.pk, 'fee_type': 'Nước', 'quantity': '5', 'unit_price': '15000'} for room in self.rooms]
+
+        self.assertEqual(self.generate(notify=True)['notified'], 0)
+        self.assertEqual(self.generate(self.readings + water, notify=True)['notified'], 1)
+        self.assertEqual(self.generate(self.readings + water, notify=True)['notified'], 0)
+
+    def test_csv_readings(self):
+        content = ('﻿room,fee_type,quantity,unit,unit_price,description\n'
+                   f'{self.rooms[0].pk},Điện,120,kWh,3500,Tháng 6\n'
+                   f'{self.rooms[0].pk},Nước,5,m³,,\n').encode('utf-8')
+        readings = invoice_service.read_csv_readings(content)
+        self.assertEqual(readings, invoice_service.read_csv_readings(io.BytesIO(content)))
+        self.assertEqual(readings[0]['room'], str(self.rooms[0].pk))
+
+        self.generate(readings)
+        details = {d.fee_type_id: d for d in InvoiceDetail.objects.all()}
+        self.assertEqual(details[self.fee_types['Điện']].amount, Decimal('420000.00'))
+        self.assertEqual(details[self.fee_types['Điện']].description, 'Tháng 6')
+        self.assertEqual(details[self.fee_types['Nước']].amount, Decimal('0.00'))
+        self.assertIsNone(details[self.fee_types['Nước']].unit_price)
+
+    def test_bad_rows_are_rejected_before_writing(self):
+        room = self.rooms[0].pk
+        cases = [
+            ({'room': 'P101', 'fee_type': 'Điện'}, 'mã phòng'),
+            ({'room': room, 'fee_type': 'Gas'}, 'loại phí'),
+            ({'room': room, 'fee_type': 'Điện', 'quantity': 'abc'}, 'quantity'),
+            ({'room': room, 'fee_type': 'Điện', 'unit_price': '3,500'}, 'unit_price'),
+            ({'room': room, 'fee_type': 'Điện', 'quantity': 'NaN'}, 'Dòng 7: quantity'),
+            ({'room': room, 'fee_type': 'Điện', 'unit': 'lít'}, 'Dòng 7: unit'),
+            ({'room': room, 'fee_type': 'Điện', 'unit_price': '123456789'}, 'Dòng 7: unit_price'),
+            ({'room': room, 'fee_type': 'Điện', 'unit_price': '3500.125'}, 'Dòng 7: unit_price'),
+            ({'room': room, 'fee_type': 'Điện', 'quantity': '1000', 'unit_price': '999999'}, 'Dòng 7: amount'),
+            ({'room': 999999, 'fee_type': 'Điện'}, 'Phòng không tồn tại'),
+        ]
+        for row, message in cases:
+            with self.subTest(row=row), self.assertRaisesMessage(ValueError, message):
+                self.generate(self.readings + [row])
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_bulk_generate_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='admin', role='admin'))
+        url = '/invoice/bulk-generate/'
+
+        response = client.post(url, {'billing_period': '2025-06-01', 'readings': self.readings, 'notify': False},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['invoices_created'], 2)
+        self.assertEqual(response.data['details_created'], 6)
+
+        content = (f'room,fee_type,quantity,unit,unit_price\n{self.rooms[1].pk},Nước,5,m³,15000\n').encode('utf-8')
+        response = client.post(url, {'billing_period': '2025-06-01', 'notify': False,
+                                     'file': SimpleUploadedFile('readings.csv', content, 'text/csv')})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['invoices_created'], response.data['details_created']), (0, 1))
+
+        response = client.post(url, {'billing_period': '2025-06-01', 'readings': [{'room': 'x', 'fee_type': 'Điện'}]},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post(url, {'billing_period': '2025-06-01'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        client.force_authenticate(User.objects.create(username='sv', role='student'))
+        response = client.post(url, {'billing_period': '2025-06-01', 'readings': self.readings}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class InvoiceGenerationConcurrencyTest(TransactionTestCase):
+    runs = 4
+
+    def setUp(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        rooms = [Room.objects.create(building=building, name=f'P10{i}', capacity=4) for i in range(2)]
+        RoomRegistration.objects.create(student=User.objects.create(username='sv', email='sv@ou.edu.vn'),
+                                        room=rooms[0])
+        for name in invoice_service.REQUIRED_FEE_TYPES:
+            FeeType.objects.create(name=name)
+        self.readings = [{'room': room.pk, 'fee_type': name, 'quantity': '1', 'unit_price': '100000'}
+                         for room in rooms for name in invoice_service.REQUIRED_FEE_TYPES]
+
+    def _generate(self, barrier, results, errors):
+        barrier.wait()
+        try:
+            results.append(invoice_service.generate_invoices(date(2025, 6, 1), self.readings))
+        except Exception as ex:
+            errors.append(ex)
+        finally:
+            connection.close()
+
+    def test_concurrent_runs_count_and_notify_once(self):
+        barrier = threading.Barrier(self.runs)
+        results, errors = [], []
+        threads = [threading.Thread(target=self._generate, args=(barrier, results, errors))
+                   for _ in range(self.runs)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(r['invoices_created'] for r in results), 2)
+        self.assertEqual(sum(r['details_created'] for r in results), 8)
+        self.assertEqual(sum(r['notified'] for r in results), 1)
+        self.assertEqual(OutboxMessage.objects.filter(channel='push').count(), 1)
+
+
+class InvoiceTotalTest(TestCase):
+    def setUp(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        room = Room.objects.create(building=building, name='P101', capacity=4)
+        self.invoice = Invoice.objects.create(room=room, billing_period=date(2025, 6, 1))
+        self.other = Invoice.objects.create(room=room, billing_period=date(2025, 7, 1))
+        self.rent = FeeType.objects.create(name='Tiền phòng')
+        self.power = FeeType.objects.create(name='Điện')
+
+    def total(self, invoice):
+        invoice.refresh_from_db()
+        return invoice.total_amount
+
+    def test_total_follows_detail_changes(self):
+        self.assertEqual(self.total(self.invoice), Decimal('0.00'))
+        rent = InvoiceDetail.objects.create(invoice=self.invoice, fee_type=self.rent, amount=Decimal('500000'))
+        power = InvoiceDetail.objects.create(invoice=self.invoice, fee_type=self.power, amount=Decimal('120000'))
+        self.assertEqual(self.total(self.invoice), Decimal('620000.00'))
+
+        power.amount = Decimal('150000')
+        power.save()
+        self.assertEqual(self.total(self.invoice), Decimal('650000.00'))
+
+        # Chuyển chi tiết sang hóa đơn khác cập nhật cả hai hóa đơn
+        rent.invoice = self.other
+        rent.save()
+        self.assertEqual(self.total(self.invoice), Decimal('150000.00'))
+        self.assertEqual(self.total(self.other), Decimal('500000.00'))
+
+        power.delete()
+        self.assertEqual(self.total(self.invoice), Decimal('0.00'))
+
+    def test_update_totals_and_backfill(self):
+        InvoiceDetail.objects.bulk_create([
+            InvoiceDetail(invoice=self.invoice, fee_type=self.rent, amount=Decimal('500000')),
+            InvoiceDetail(invoice=self.invoice, fee_type=self.power, amount=Decimal('120000.50')),
+        ])
+        self.assertEqual(self.total(self.invoice), Decimal('0.00'))
+
+        Invoice.objects.filter(pk=self.invoice.pk).update_totals()
+        self.assertEqual(self.total(self.invoice), Decimal('620000.50'))
+
+        Invoice.objects.update(total_amount=Decimal('1.00'))
+        migration = importlib.import_module('dorms.migrations.0012_invoice_total_amount')
+        migration.backfill_total_amount(django_apps, None)
+        self.assertEqual(self.total(self.invoice), Decimal('620000.50'))
+        self.assertEqual(self.total(self.other), Decimal('0.00'))
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        FakeBackend.reset()
+        self.backend = FakeBackend()
+        self.user = User.objects.create(username='sv', email='sv@ou.edu.vn')
+
+    def test_drain_delivers_queued_messages(self):
+        outbox_service.enqueue_email(self.user, 'Hóa đơn', 'Nội dung')
+        outbox_service.enqueue_push(self.user, 'Hóa đơn mới', 'Nội dung', {'invoice_id': 1})
+
+        summary = outbox_service.drain(backend=self.backend, workers=2)
+
+        self.assertEqual(summary['sent'], 2)
+        self.assertEqual(len(FakeBackend.sent), 2)
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+        push = next(m for m in FakeBackend.sent if m['channel'] == 'push')
+        self.assertEqual(push['payload']['data'], {'invoice_id': '1'})
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        message = outbox_service.enqueue_email(self.user, 'Hóa đơn', 'Nội dung')
+        FakeBackend.fail_next = 1
+
+        summary = outbox_service.drain(backend=self.backend)
+        message.refresh_from_db()
+        self.assertEqual(summary['retry'], 1)
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertIsNotNone(message.last_error)
+
+        # Chưa đến hạn gửi lại
+        self.assertEqual(outbox_service.drain(backend=self.backend)['sent'], 0)
+
+        OutboxMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox_service.drain(backend=self.backend)['sent'], 1)
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'sent')
+
+    def test_gives_up_after_max_attempts(self):
+        message = outbox_service.enqueue_email(self.user, 'Hóa đơn', 'Nội dung')
+        FakeBackend.fail_next = outbox_service.MAX_ATTEMPTS
+
+        for _ in range(outbox_service.MAX_ATTEMPTS):
+            OutboxMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+            outbox_service.drain(backend=self.backend)
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(FakeBackend.sent, [])
+
+
+class FCMMulticastTest(TestCase):
+    def test_multicast_batches_and_prunes_dead_tokens(self):
+        User.objects.bulk_create([User(username=f'sv{i}') for i in range(60)])
+        users = list(User.objects.all())
+        FCMDevice.objects.bulk_create([
+            FCMDevice(user=users[i % len(users)], token=f"{'dead' if i % 10 == 0 else 'live'}-{i}")
+            for i in range(1200)
+        ])
+
+        reports = firebase_service.notify_users(
+            User.objects.values('id'), 'Thông báo', 'Nội dung',
+            send=firebase_service.local_send_each_for_multicast
+        )
+
+        self.assertEqual([r['success'] + r['failure'] for r in reports], [500, 500, 200])
+        self.assertEqual(sum(r['success'] for r in reports), 1080)
+        self.assertEqual(sum(r['pruned'] for r in reports), 120)
+        self.assertFalse(FCMDevice.objects.filter(token__startswith='dead').exists())
+        self.assertEqual(FCMDevice.objects.count(), 1080)
+
+
+class NotificationFanOutTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.b1 = Building.objects.create(name='B1', address='Nhà Bè')
+        b2 = Building.objects.create(name='B2', address='Nhà Bè')
+        r1 = Room.objects.create(building=self.b1, name='P101', capacity=10)
+        r2 = Room.objects.create(building=b2, name='P201', capacity=10)
+        for i in range(5):
+            RoomRegistration.objects.create(student=User.objects.create(username=f'a{i}', gender='male'), room=r1)
+            RoomRegistration.objects.create(student=User.objects.create(username=f'b{i}', gender='female'), room=r2)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_building_audience_is_queued_for_the_worker(self):
+        # Request chỉ tạo thông báo và tin outbox, không phụ thuộc số người nhận
+        with self.assertNumQueries(5):
+            response = self.client.post('/notifications/', {
+                'title': 'Cúp nước', 'content': 'Tòa B1 cúp nước sáng mai', 'audience': 'building',
+                'building': self.b1.pk
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        notif = Notification.objects.get()
+        self.assertFalse(notif.target_users.exists())
+        message = OutboxMessage.objects.get(channel='broadcast')
+        self.assertEqual(message.payload['notification_id'], notif.pk)
+        self.assertEqual(message.payload['audience'], {'audience': 'building', 'building': self.b1.pk})
+
+        self.assertEqual(notification_service.fan_out(notif.pk, **message.payload['audience']), 5)
+        self.assertEqual(set(notif.target_users.values_list('username', flat=True)), {f'a{i}' for i in range(5)})
+
+    def test_chunked_fan_out(self):
+        notif = Notification.objects.create(title='Thông báo', content='Nội dung')
+        recipients = notification_service.resolve_audience('gender', gender='female')
+        self.assertEqual(notification_service.add_recipients(notif, recipients, chunk_size=2), 5)
+        self.assertEqual(notif.target_users.count(), 5)
+
+    def test_audience_requires_target(self):
+        response = self.client.post('/notifications/', {'title': 't', 'content': 'c', 'audience': 'room'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_gender_choices_follow_user_model(self):
+        response = self.client.post('/notifications/', {'title': 't', 'content': 'c', 'audience': 'gender',
+                                                        'gender': 'unknown'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(serializers.NotificationSerializer().fields['gender'].choices),
+                         {value for value, _ in User._meta.get_field('gender').choices})
+
+
+class NotificationFanOutWorkerTest(TransactionTestCase):
+    def test_worker_writes_recipients_once_then_broadcasts(self):
+        FakeBackend.reset()
+        for i in range(3):
+            User.objects.create(username=f'sv{i}', role='student', gender='female')
+        User.objects.create(username='nam', role='student', gender='male')
+        notif = Notification.objects.create(title='Thông báo', content='Nội dung')
+        notification_service.broadcast(notif, audience={'audience': 'gender', 'gender': 'female'})
+
+        FakeBackend.fail_next = 1
+        self.assertEqual(outbox_service.drain(backend=FakeBackend(), workers=1)['retry'], 1)
+        message = OutboxMessage.objects.get()
+        self.assertNotIn('audience', message.payload)
+        self.assertEqual(notif.target_users.count(), 3)
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        with mock.patch.object(notification_service, 'fan_out') as fan_out:
+            self.assertEqual(outbox_service.drain(backend=FakeBackend(), workers=1)['sent'], 1)
+        fan_out.assert_not_called()
+        self.assertEqual([m['payload']['notification_id'] for m in FakeBackend.sent], [notif.pk])
+
+
+class FlakyMulticastSender:
+    """Sender giả: token trong flaky lỗi tạm thời ở lần đầu, lô thứ fail_call ném lỗi một lần"""
+    def __init__(self, flaky=(), fail_call=None):
+        self.flaky = set(flaky)
+        self.fail_call = fail_call
+        self.calls = 0
+        self.delivered = []
+
+    def __call__(self, multicast_message):
+        self.calls += 1
+        if self.calls == self.fail_call:
+            raise firebase_exceptions.UnavailableError('FCM không phản hồi.')
+        responses = []
+        for token in multicast_message.tokens:
+            if token in self.flaky:
+                self.flaky.discard(token)
+                responses.append(messaging.SendResponse(None, firebase_exceptions.UnavailableError('Thử lại sau.')))
+            else:
+                self.delivered.append(token)
+                responses.append(messaging.SendResponse({'name': token}, None))
+        return messaging.BatchResponse(responses)
+
+
+class BroadcastRetryTest(TransactionTestCase):
+    def test_retry_only_resends_failed_and_remaining_tokens(self):
+        users = [User.objects.create(username=f'sv{i}') for i in range(3)]
+        FCMDevice.objects.bulk_create([FCMDevice(user=users[i % 3], token=f'live-{i}') for i in range(1100)])
+        notif = Notification.objects.create(title='Thông báo', content='Nội dung')
+        notif.target_users.set(users)
+        message = outbox_service.enqueue_broadcast(notif.pk, 'Thông báo', 'Nội dung')
+
+        # Lô 1 có token lỗi tạm thời, lô 3 ném lỗi: hai lô đầu đã gửi không được gửi lại
+        sender = FlakyMulticastSender(flaky={'live-5'}, fail_call=3)
+        with mock.patch.object(firebase_service, 'get_multicast_sender', return_value=sender):
+            self.assertEqual(outbox_service.drain(backend=LiveBackend(), workers=1)['retry'], 1)
+            message.refresh_from_db()
+            self.assertEqual(message.payload['retry_tokens'], ['live-5'])
+            self.assertEqual(len(sender.delivered), 999)
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox_service.drain(backend=LiveBackend(), workers=1)['sent'], 1)
+
+        self.assertEqual(sorted(sender.delivered), sorted(f'live-{i}' for i in range(1100)))
+        message.refresh_from_db()
+        self.assertEqual(message.payload['retry_tokens'], [])
+
+
+class NotificationFeedTest(TestCase):
+    def setUp(self):
+        self.student = User.objects.create(username='sv', role='student')
+        other = User.objects.create(username='sv2', role='student')
+        self.notifications = []
+        for i in range(25):
+            notif = Notification.objects.create(title=f'Thông báo {i}', content='Nội dung')
+            notif.target_users.add(self.student, other)
+            self.notifications.append(notif)
+        Notification.objects.create(title='Không liên quan', content='Nội dung').target_users.add(other)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student)
+
+    def test_cursor_pagination_walks_feed_without_duplicates(self):
+        seen = []
+        url = '/notifications/'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, [n.pk for n in reversed(self.notifications)])
+        self.assertNotIn('target_users', response.data['results'][0])
+
+    def test_read_state_and_unread_count(self):
+        self.assertEqual(self.client.get('/notifications/unread-count/').data['unread'], 25)
+
+        response = self.client.post(f'/notifications/{self.notifications[-1].pk}/read/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/notifications/unread-count/').data['unread'], 24)
+
+        first = self.client.get('/notifications/').data['results'][0]
+        self.assertTrue(first['is_read'])
+        self.assertIsNotNone(first['read_at'])
+
+        self.client.post('/notifications/read-all/')
+        self.assertEqual(self.client.get('/notifications/unread-count/').data['unread'], 0)
+
+        self.assertEqual(self.client.post('/notifications/abc/read/').status_code, 404)
+        self.assertEqual(self.client.post('/notifications/999999/read/').status_code, 404)
+
+    def test_feed_page_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.client.get('/notifications/')
+
+
+class RoomRegistrationListTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='admin')
+        b1 = Building.objects.create(name='B1', address='Nhà Bè')
+        b2 = Building.objects.create(name='B2', address='Nhà Bè')
+        self.r1 = Room.objects.create(building=b1, name='P101', capacity=100)
+        r2 = Room.objects.create(building=b2, name='P201', capacity=100)
+        for i in range(60):
+            RoomRegistration.objects.create(student=User.objects.create(username=f'sv{i}', first_name='Nguyễn'),
+                                            room=self.r1 if i % 2 else r2, is_active=i % 3 != 0)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_paginated_and_filtered_list(self):
+        response = self.client.get('/register-room/')
+        self.assertEqual(response.data['count'], 60)
+        self.assertEqual(len(response.data['results']), 50)
+
+        response = self.client.get('/register-room/', {'room_id': self.r1.pk, 'is_active': 'true', 'page_size': 100})
+        expected = RoomRegistration.objects.filter(room=self.r1, is_active=True).count()
+        self.assertEqual(response.data['count'], expected)
+        self.assertTrue(all(row['room_name'] == 'P101' and row['is_active'] for row in response.data['results']))
+
+        today = timezone.localdate().isoformat()
+        self.assertEqual(self.client.get('/register-room/', {'registered_from': today}).data['count'], 60)
+        self.assertEqual(self.client.get('/register-room/', {'registered_to': '2000-01-01'}).data['count'], 0)
+        self.assertEqual(self.client.get('/register-room/', {'registered_to': '01/01/2000'}).status_code, 400)
+
+        # Id không phải số trả về danh sách rỗng thay vì lỗi 500
+        for param in ('room_id', 'building_id'):
+            response = self.client.get('/register-room/', {param: 'abc'})
+            self.assertEqual((response.status_code, response.data['count']), (200, 0))
+        response = self.client.get('/register-room/export/', {'fmt': 'csv', 'room_id': '1 OR 1=1'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()), 1)
+
+    def test_streaming_export(self):
+        response = self.client.get('/register-room/export/', {'fmt': 'csv', 'is_active': 'false'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'student_username'])
+        self.assertEqual(len(lines) - 1, RoomRegistration.objects.filter(is_active=False).count())
+
+        response = self.client.get('/register-room/export/', {'fmt': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 60)
+        self.assertEqual(rows[0]['student_first_name'], 'Nguyễn')
+
+
+class RoomFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        b1 = Building.objects.create(name='B1', address='Nhà Bè')
+        b2 = Building.objects.create(name='B2', address='Nhà Bè')
+        self.full = Room.objects.create(building=b1, name='P101', capacity=2, gender_restriction='male')
+        self.partial = Room.objects.create(building=b1, name='P102', capacity=2, gender_restriction='male')
+        self.empty = Room.objects.create(building=b1, name='P103', capacity=3, gender_restriction='female')
+        self.other = Room.objects.create(building=b2, name='P201', capacity=1)
+        for i, room in enumerate([self.full, self.full, self.partial]):
+            RoomRegistration.objects.create(student=User.objects.create(username=f'sv{i}'), room=room)
+        # Đăng ký đã kết thúc không tính vào số người đang ở
+        RoomRegistration.objects.create(student=User.objects.create(username='cu'), room=self.partial,
+                                        is_active=False)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='sv', role='student'))
+
+    def room_ids(self, **params):
+        response = self.client.get('/room/', params)
+        self.assertEqual(response.status_code, 200)
+        return [room['id'] for room in response.data['results']]
+
+    def test_is_full(self):
+        self.assertEqual(self.room_ids(is_full='true'), [self.full.pk])
+        self.assertEqual(self.room_ids(is_full='false'), [self.partial.pk, self.empty.pk, self.other.pk])
+        self.assertEqual(self.room_ids(is_full='FALSE', gender_restriction='male'), [self.partial.pk])
+
+    def test_gender_restriction(self):
+        self.assertEqual(self.room_ids(gender_restriction='male'), [self.full.pk, self.partial.pk])
+        self.assertEqual(self.room_ids(gender_restriction='female'), [self.empty.pk])
+        self.assertEqual(self.room_ids(gender_restriction='all'), [self.other.pk])
+
+    def test_building_id(self):
+        self.assertEqual(self.room_ids(building_id=self.other.building_id), [self.other.pk])
+        self.assertEqual(self.room_ids(building_id=self.full.building_id, is_full='false'),
+                         [self.partial.pk, self.empty.pk])
+        self.assertEqual(self.room_ids(building_id='abc'), [])
+
+
+class QueryCountTest(TestCase):
+    """Số câu SQL của các endpoint đọc không được tăng theo số dòng"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', role='admin')
+        cls.student = User.objects.create(username='sv', role='student')
+        cls.building = Building.objects.create(name='B1', address='Nhà Bè')
+        fee_types = [FeeType.objects.create(name=name) for name in ('Tiền phòng', 'Điện', 'Nước')]
+        for i in range(10):
+            room = Room.objects.create(building=cls.building, name=f'P{i}', capacity=4)
+            invoice = Invoice.objects.create(room=room, billing_period=date(2025, 6, 1))
+            for fee_type in fee_types:
+                InvoiceDetail.objects.create(invoice=invoice, fee_type=fee_type, amount=Decimal('100000'))
+            if i == 0:
+                RoomRegistration.objects.create(student=cls.student, room=room)
+        for i in range(10, 200):
+            Room.objects.create(building=cls.building, name=f'P{i}', capacity=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_building_list(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/building/').status_code, 200)
+
+    def test_building_detail(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/building/{self.building.pk}/')
+        self.assertEqual(len(response.data['rooms']), 200)
+        self.assertEqual(response.data['rooms'][0]['current_students'], 1)
+
+    def test_room_list(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/room/', {'is_full': 'false'}).status_code, 200)
+
+    def test_invoice_list_admin(self):
+        self.client.force_authenticate(user=self.admin)
+        with self.assertNumQueries(2):
+            response = self.client.get('/invoice/')
+        self.assertEqual(len(response.data), 10)
+
+    def test_invoice_list_student(self):
+        self.client.force_authenticate(user=self.student)
+        with self.assertNumQueries(3):
+            response = self.client.get('/invoice/')
+        self.assertEqual(len(response.data), 1)
+
+
+@override_settings(QUERY_BUDGET={'ENABLED': True, 'MAX_QUERIES': 5, 'REPEAT_THRESHOLD': 3, 'RAISE': True})
+class QueryBudgetMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        for i in range(5):
+            Room.objects.create(building=building, name=f'P{i}', capacity=4)
+        self.client = APIClient()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/room/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('2 queries', response['Server-Timing'])
+
+    def test_repeated_sql_shape_is_flagged(self):
+        # Room.__str__ truy cập building: mỗi phòng một query
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(repeat_threshold=3):
+                [str(room) for room in Room.objects.all()]
+
+        with query_budget(max_queries=1, repeat_threshold=3):
+            [str(room) for room in Room.objects.select_related('building')]
+
+    @override_settings(QUERY_BUDGET={'ENABLED': True, 'MAX_QUERIES': 1, 'RAISE': True})
+    def test_over_budget_fails_request(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/room/')
+
+    def test_normalize_sql(self):
+        self.assertEqual(normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+                         "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?")
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.building = Building.objects.create(name='B1', address='Nhà Bè')
+        self.room = Room.objects.create(building=self.building, name='P101', capacity=1)
+        PaymentMethod.objects.create(name='VNPay')
+        self.client = APIClient()
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get('/room/', {'page': 1})
+        with self.assertNumQueries(0):
+            response = self.client.get('/room/', {'page': 1})
+        self.assertEqual(response.data['results'][0]['name'], 'P101')
+
+        # Query params khác nhau là các entry khác nhau
+        with self.assertNumQueries(2):
+            self.client.get('/room/', {'is_full': 'false'})
+
+    def test_occupancy_change_invalidates_room_and_building(self):
+        self.assertFalse(self.client.get('/room/').data['results'][0]['is_full'])
+        self.client.get(f'/building/{self.building.pk}/')
+
+        RoomRegistration.objects.create(student=User.objects.create(username='sv'), room=self.room)
+
+        self.assertTrue(self.client.get('/room/').data['results'][0]['is_full'])
+        rooms = self.client.get(f'/building/{self.building.pk}/').data['rooms']
+        self.assertEqual(rooms[0]['current_students'], 1)
+
+    def test_payment_method_invalidated_on_save(self):
+        self.assertEqual(len(self.client.get('/payment-method/').data), 1)
+        PaymentMethod.objects.create(name='Tiền mặt')
+        self.assertEqual(len(self.client.get('/payment-method/').data), 2)
+
+    def test_conditional_get(self):
+        response = self.client.get('/building/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get('/building/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/building/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.building.name = 'B1 mới'
+        self.building.save()
+        self.assertEqual(self.client.get('/building/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_invalidated_again_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomRegistration.objects.create(student=User.objects.create(username='sv'), room=self.room)
+            # Response dựng trong lúc transaction chưa commit được cache với phiên bản hiện tại
+            during = catalog_version('room')
+        self.assertNotEqual(catalog_version('room'), during)
+
+    def test_counter_updates_invalidate_without_signals(self):
+        before = catalog_version('room'), catalog_version('building')
+        self.assertTrue(Room.occupy(self.room.pk))
+        after_occupy = catalog_version('room'), catalog_version('building')
+        self.assertTrue(all(a != b for a, b in zip(before, after_occupy)))
+
+        Room.release(self.room.pk)
+        self.assertNotEqual(catalog_version('room'), after_occupy[0])
+
+        version = catalog_version('room')
+        Room.objects.filter(pk=self.room.pk).update(occupied=1)
+        call_command('reconcile_occupancy', stdout=io.StringIO())
+        self.assertNotEqual(catalog_version('room'), version)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_cache_key_includes_scheme_and_host(self):
+        Room.objects.filter(pk=self.room.pk).update(image='rooms/2025/06/p101.jpg')
+        for i in range(2, 13):
+            Room.objects.create(building=self.building, name=f'P1{i:02d}', capacity=1)
+
+        http = self.client.get('/room/')
+        https = self.client.get('/room/', secure=True)
+        other = self.client.get('/room/', HTTP_HOST='api.example.com')
+        self.assertTrue(http.data['results'][0]['image'].startswith('http://testserver/'))
+        self.assertTrue(https.data['results'][0]['image'].startswith('https://testserver/'))
+        self.assertTrue(https.data['next'].startswith('https://testserver/'))
+        self.assertTrue(other.data['next'].startswith('http://api.example.com/'))
+
+
+class StudentContextTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create(username='sv', role='student')
+        self.room = Room.objects.create(building=Building.objects.create(name='B1', address='Nhà Bè'),
+                                        name='P101', capacity=4)
+        self.registration = RoomRegistration.objects.create(student=self.student, room=self.room)
+        self.invoice = Invoice.objects.create(room=self.room, billing_period=date(2025, 6, 1))
+        self.method = PaymentMethod.objects.create(name='VNPay')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student)
+
+    def _registration_queries(self, queries):
+        return [q for q in queries if 'dorms_roomregistration' in q['sql']]
+
+    def test_pay_resolves_active_room_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/invoice/{self.invoice.pk}/pay/', {'payment_method': self.method.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self._registration_queries(queries)), 1)
+
+    def test_room_is_cached_across_requests_until_registration_changes(self):
+        self.client.get('/invoice/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.client.get('/invoice/').data), 1)
+        self.assertEqual(self._registration_queries(queries), [])
+
+        self.registration.is_active = False
+        self.registration.save()
+
+        self.assertEqual(self.client.get('/invoice/').data, [])
+        self.assertEqual(self.client.get(f'/invoice/{self.invoice.pk}/').status_code, 403)
+
+    def test_other_room_invoice_is_not_payable(self):
+        other = Invoice.objects.create(room=Room.objects.create(building=self.room.building, name='P102', capacity=4),
+                                       billing_period=date(2025, 6, 1))
+        response = self.client.patch(f'/invoice/{other.pk}/pay/', {'payment_method': self.method.pk})
+        self.assertEqual(response.status_code, 404)
+
+
+def signed_vnpay_callback(txn_ref, amount, response_code='00'):
+    vnp = VNPay()
+    vnp.responseData = {
+        'vnp_TxnRef': txn_ref,
+        'vnp_Amount': str(int(amount) * 100),
+        'vnp_ResponseCode': response_code,
+        'vnp_TransactionNo': '14000001',
+        'vnp_TmnCode': settings.VNPAY_TMN_CODE,
+    }
+    return vnp.sign_response(settings.VNPAY_HASH_SECRET_KEY)
+
+
+class VNPaySignerTest(TestCase):
+    def test_matches_reference_hmac_and_rejects_tampering(self):
+        data = {'vnp_TxnRef': '1_1', 'vnp_Amount': '150000000', 'vnp_OrderInfo': 'Hóa đơn 06/2025'}
+        expected = hmac.new(b'secret', urllib.parse.urlencode(sorted(data.items())).encode(),
+                            hashlib.sha512).hexdigest()
+        signer = VNPaySigner('secret')
+        self.assertEqual(signer.sign(data), expected)
+        self.assertEqual(signer.sign_many([data, data]), [expected, expected])
+
+        signed = dict(data, vnp_SecureHash=expected, vnp_SecureHashType='HmacSHA512')
+        tampered = dict(signed, vnp_Amount='100')
+        self.assertEqual(signer.verify_many([signed, tampered, data]), [True, False, False])
+        self.assertFalse(signer.verify(dict(data, vnp_SecureHash='không hợp lệ')))
+
+
+class PaymentCallbackTest(TestCase):
+    def setUp(self):
+        self.student = User.objects.create(username='sv', role='student', email='sv@example.com')
+        room = Room.objects.create(building=Building.objects.create(name='B1', address='Nhà Bè'),
+                                   name='P101', capacity=4)
+        RoomRegistration.objects.create(student=self.student, room=room)
+        self.invoice = Invoice.objects.create(room=room, billing_period=date(2025, 6, 1))
+        InvoiceDetail.objects.create(invoice=self.invoice, fee_type=FeeType.objects.create(name='Tiền phòng'),
+                                     amount=Decimal('1500000'))
+        self.method = PaymentMethod.objects.create(name='VNPay')
+        self.txn = VNPayService.start_transaction(self.invoice, self.method, 1500000, f'{self.invoice.pk}_1')
+
+    def test_ipn_marks_invoice_paid_exactly_once(self):
+        payload = signed_vnpay_callback(self.txn.txn_ref, 1500000)
+
+        self.assertEqual(self.client.get('/payment-ipn/', payload).json()['RspCode'], '00')
+        self.assertEqual(self.client.get('/payment-ipn/', payload).json()['RspCode'], '02')
+
+        self.invoice.refresh_from_db()
+        self.txn.refresh_from_db()
+        self.assertTrue(self.invoice.is_paid)
+        self.assertEqual(self.invoice.payment_method, self.method)
+        self.assertEqual(self.txn.status, 'success')
+        self.assertEqual(OutboxMessage.objects.count(), 2)  # email + push
+
+        # Tải lại return URL sau IPN vẫn thấy thành công, không gửi thêm thông báo
+        response = self.client.get('/payment-return/', payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['invoice_data']['status'], 'Paid')
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_failed_payment_is_recorded_without_paying(self):
+        payload = signed_vnpay_callback(self.txn.txn_ref, 1500000, response_code='24')
+        self.assertEqual(self.client.get('/payment-return/', payload).status_code, 400)
+
+        self.invoice.refresh_from_db()
+        self.txn.refresh_from_db()
+        self.assertFalse(self.invoice.is_paid)
+        self.assertEqual(self.txn.status, 'failed')
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_rejects_tampered_payload(self):
+        payload = signed_vnpay_callback(self.txn.txn_ref, 1500000)
+        payload['vnp_ResponseCode'] = '01'
+        self.assertEqual(self.client.get('/payment-ipn/', payload).json()['RspCode'], '97')
+
+        payload = signed_vnpay_callback(self.txn.txn_ref, 1000)
+        self.assertEqual(self.client.get('/payment-ipn/', payload).json()['RspCode'], '04')
+        self.assertFalse(Invoice.objects.get(pk=self.invoice.pk).is_paid)
+
+
+# SQLite khóa cả database: các thread gặp 'database table is locked' thay vì chờ khóa dòng
+@skipUnlessDBFeature('has_select_for_update')
+class PaymentCallbackConcurrencyTest(TransactionTestCase):
+    replays = 12
+
+    def setUp(self):
+        student = User.objects.create(username='sv', role='student', email='sv@example.com')
+        room = Room.objects.create(building=Building.objects.create(name='B1', address='Nhà Bè'),
+                                   name='P101', capacity=4)
+        RoomRegistration.objects.create(student=student, room=room)
+        self.invoice = Invoice.objects.create(room=room, billing_period=date(2025, 6, 1))
+        InvoiceDetail.objects.create(invoice=self.invoice, fee_type=FeeType.objects.create(name='Tiền phòng'),
+                                     amount=Decimal('1500000'))
+
+    def _replay(self, payload, barrier, results, errors):
+        barrier.wait()
+        try:
+            results.append(VNPayService.handle_ipn(payload)['RspCode'])
+        except Exception as ex:
+            errors.append(ex)
+        finally:
+            connection.close()
+
+    def test_concurrent_replays_are_processed_once(self):
+        # Không có giao dịch chờ sẵn: các request đồng thời cùng tạo dòng trong sổ
+        payload = signed_vnpay_callback(f'{self.invoice.pk}_1', 1500000)
+        barrier = threading.Barrier(self.replays)
+        results, errors = [], []
+        threads = [threading.Thread(target=self._replay, args=(payload, barrier, results, errors))
+                   for _ in range(self.replays)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results.count('00'), 1)
+        self.assertEqual(results.count('02'), self.replays - 1)
+        self.assertTrue(Invoice.objects.get(pk=self.invoice.pk).is_paid)
+        self.assertEqual(PaymentTransaction.objects.get().status, 'success')
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+
+class PaymentReconciliationTest(TestCase):
+    def setUp(self):
+        student = User.objects.create(username='sv', role='student', email='sv@example.com')
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        fee_type = FeeType.objects.create(name='Tiền phòng')
+        self.invoices = []
+        for i in range(4):
+            room = Room.objects.create(building=building, name=f'P{i}', capacity=4)
+            invoice = Invoice.objects.create(room=room, billing_period=date(2025, 6, 1))
+            InvoiceDetail.objects.create(invoice=invoice, fee_type=fee_type, amount=Decimal('1500000'))
+            invoice.refresh_from_db()
+            self.invoices.append(invoice)
+        RoomRegistration.objects.create(student=student, room=self.invoices[1].room)
+
+        # Hóa đơn 0 đã thanh toán qua IPN bình thường
+        VNPayService.apply_result(self.invoices[0], {'vnp_TxnRef': f'{self.invoices[0].pk}_1',
+                                                     'vnp_Amount': '150000000', 'vnp_ResponseCode': '00'})
+
+    def _statement(self, rows):
+        lines = ['vnp_TxnRef,vnp_Amount,vnp_ResponseCode,vnp_TransactionNo']
+        lines += [f'{ref},{amount},{code},1400{i}' for i, (ref, amount, code) in enumerate(rows)]
+        return reconciliation_service.iter_statement(io.StringIO('\n'.join(lines) + '\n'))
+
+    def _reconcile(self, apply):
+        a, b, c, d = (invoice.pk for invoice in self.invoices)
+        rows = self._statement([
+            (f'{a}_1', 150000000, '00'),   # khớp
+            (f'{a}_2', 150000000, '00'),   # thanh toán trùng
+            (f'{b}_1', 150000000, '00'),   # lỡ IPN
+            (f'{c}_1', 100000, '00'),      # lệch số tiền
+            (f'{d}_1', 150000000, '24'),   # giao dịch thất bại
+            ('999999_1', 150000000, '00'),  # mồ côi
+        ])
+        out = io.StringIO()
+        summary = reconciliation_service.reconcile(rows, csv.writer(out), apply=apply, chunk_size=2)
+        return summary, [line.split(',')[0] for line in out.getvalue().splitlines()]
+
+    def test_report_only(self):
+        summary, categories = self._reconcile(apply=False)
+        self.assertEqual(categories, ['double_payment', 'missed_ipn', 'amount_mismatch', 'orphan'])
+        self.assertEqual((summary['ok'], summary['failed'], summary['applied']), (1, 1, 0))
+        self.assertFalse(Invoice.objects.get(pk=self.invoices[1].pk).is_paid)
+
+    def test_apply_marks_missed_payments_once(self):
+        summary, _ = self._reconcile(apply=True)
+        self.assertEqual(summary['applied'], 1)
+        self.assertTrue(Invoice.objects.get(pk=self.invoices[1].pk).is_paid)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+        summary, categories = self._reconcile(apply=True)
+        self.assertEqual(summary['applied'], 0)
+        self.assertEqual(summary['ok'], 2)
+        self.assertNotIn('missed_ipn', categories)
+
+
+class AdminChangelistQueryTest(TestCase):
+    """Số câu SQL của mỗi trang danh sách trong admin không tăng theo số dòng hiển thị"""
+    models = [Room, RoomRegistration, Invoice, InvoiceDetail, Notification, NotificationRecipient, SupportRequest,
+              SupportResponse, Survey, SurveyQuestion, SurveyResponse, FCMDevice, OutboxMessage, PaymentTransaction]
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', password='x', role='admin')
+        self.client.force_login(self.admin)
+        self.fee_type = FeeType.objects.create(name='Tiền phòng')
+        self._seed(0, 2)
+
+    def _seed(self, start, stop):
+        for i in range(start, stop):
+            building = Building.objects.create(name=f'B{i}', address='Nhà Bè')
+            room = Room.objects.create(building=building, name=f'P{i}', capacity=4)
+            student = User.objects.create(username=f'sv{i}', role='student')
+            RoomRegistration.objects.create(student=student, room=room)
+            invoice = Invoice.objects.create(room=room, billing_period=date(2025, 6, 1))
+            InvoiceDetail.objects.create(invoice=invoice, fee_type=self.fee_type, amount=Decimal('100000'))
+            PaymentTransaction.objects.create(txn_ref=f'{invoice.pk}_1', invoice=invoice, amount=100000)
+            notif = Notification.objects.create(title=f'TB {i}', content='...', sent_by=self.admin)
+            notification_service.add_recipients(notif, User.objects.filter(pk=student.pk).values_list('id', flat=True))
+            request = SupportRequest.objects.create(student=student, room=room, title=f'YC {i}', description='...')
+            SupportResponse.objects.create(request=request, responder=self.admin, content='OK')
+            survey = Survey.objects.create(title=f'KS {i}', created_by=self.admin,
+                                           start_date=timezone.now(), end_date=timezone.now())
+            question = SurveyQuestion.objects.create(survey=survey, question_text=f'Câu {i}')
+            SurveyResponse.objects.create(student=student, question=question, answer='Tốt')
+            FCMDevice.objects.create(user=student, token=f'token-{i}')
+            outbox_service.enqueue_push(student, 'Tiêu đề', 'Nội dung')
+
+    def _changelist_queries(self):
+        counts = {}
+        for model in self.models:
+            url = f'/admin/dorms/{model._meta.model_name}/'
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+            counts[model._meta.model_name] = len(queries)
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        before = self._changelist_queries()
+        self._seed(2, 8)
+        self.assertEqual(self._changelist_queries(), before)
+
+    def test_notification_form_links_to_recipients_instead_of_rendering_them(self):
+        notif = Notification.objects.create(title='Cúp nước', content='...', sent_by=self.admin)
+        url = f'/admin/dorms/notification/{notif.pk}/change/'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        notification_service.add_recipients(notif, User.objects.values_list('id', flat=True))
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertContains(response, f'/admin/dorms/notificationrecipient/?notification__id__exact={notif.pk}')
+        self.assertContains(response, '3 người nhận (0 đã đọc)')
+        self.assertNotContains(response, 'recipients-TOTAL_FORMS')
+        # Thêm người nhận qua form của NotificationRecipient (autocomplete, không nạp toàn bộ user)
+        response = self.client.get('/admin/dorms/notificationrecipient/add/')
+        self.assertContains(response, 'admin-autocomplete')
+
+
+class SupportInboxTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', role='admin')
+        cls.student = User.objects.create(username='sv', role='student')
+        other = User.objects.create(username='sv2', role='student')
+        b1 = Building.objects.create(name='B1', address='Nhà Bè')
+        cls.b2 = Building.objects.create(name='B2', address='Thủ Đức')
+        rooms = [Room.objects.create(building=b, name=f'P{b.pk}', capacity=4) for b in (b1, cls.b2)]
+        for i in range(30):
+            request = SupportRequest.objects.create(student=cls.student if i % 2 else other, room=rooms[i % 2],
+                                                    title=f'YC {i}', description='...', is_resolved=i % 3 == 0)
+            for _ in range(i % 3):
+                SupportResponse.objects.create(request=request, responder=cls.admin, content='Đã xử lý')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _all_pages(self, params=None):
+        results, url = [], '/support-request/'
+        while url:
+            response = self.client.get(url, params)
+            results += response.data['results']
+            url, params = response.data['next'], None
+        return results
+
+    def test_admin_inbox_is_paginated_with_embedded_responses(self):
+        self.client.force_authenticate(user=self.admin)
+        with self.assertNumQueries(2):
+            response = self.client.get('/support-request/')
+        self.assertEqual(len(response.data['results']), 20)
+        first = response.data['results'][0]
+        self.assertEqual(first['title'], 'YC 29')
+        self.assertEqual(first['response_count'], 2)
+        self.assertEqual(len(first['responses']), 2)
+
+        results = self._all_pages()
+        self.assertEqual(len(results), 30)
+        self.assertEqual(len({r['id'] for r in results}), 30)
+
+    def test_filters(self):
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(len(self._all_pages({'is_resolved': 'true'})), 10)
+        self.assertEqual(len(self._all_pages({'building_id': self.b2.pk})), 15)
+        self.assertEqual(self.client.get('/support-request/', {'is_resolved': 'x'}).status_code, 400)
+
+        self.client.force_authenticate(user=self.student)
+        results = self._all_pages({'is_resolved': 'false'})
+        self.assertTrue(all(r['student'] == self.student.pk and not r['is_resolved'] for r in results))
+        self.assertEqual(len(results), 10)
+
+    def test_create_returns_empty_responses(self):
+        self.client.force_authenticate(user=self.student)
+        response = self.client.post('/support-request/', {'title': 'Hỏng đèn', 'description': 'Phòng tối'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['responses'], response.data['response_count']), ([], 0))
+
+
+class QueryPlanAuditTest(TestCase):
+    def test_hot_queries_use_indexes(self):
+        for name, source, scans, plan in query_audit.audit():
+            with self.subTest(name):
+                self.assertEqual(scans, [], f"{source}: {plan}")
+
+    def test_command_fails_on_full_scan(self):
+        shape = ('support_by_title', 'test', lambda: SupportRequest.objects.filter(title='x'), set())
+        out = io.StringIO()
+        call_command('audit_query_plans', '--fail', stdout=out)
+        with mock.patch.object(query_audit, 'QUERY_SHAPES', query_audit.QUERY_SHAPES + [shape]):
+            with self.assertRaises(CommandError):
+                call_command('audit_query_plans', '--fail', stdout=out)
+        self.assertIn('[FULL SCAN] support_by_title (test): dorms_supportrequest', out.getvalue())
+
+    def test_shapes_follow_the_code(self):
+        # Đổi queryset trong code là đổi luôn câu được audit
+        unindexed = lambda now: OutboxMessage.objects.filter(last_error='x').order_by('id')
+        with mock.patch.object(outbox_service, 'due_messages', unindexed):
+            scans = {name: scans for name, _, scans, _ in query_audit.audit()}
+        self.assertEqual(scans['due_outbox_messages'], ['dorms_outboxmessage'])
+
+        sql = str(query_audit.notification_feed().query)
+        qn = connection.ops.quote_name
+        self.assertIn(f"{qn(NotificationRecipient._meta.db_table)}.{qn('user_id')} = 1", sql)
+        self.assertIn('LIMIT 21', sql)
+
+
+def png_upload(name, size, mode='RGB', fmt='PNG'):
+    out = io.BytesIO()
+    Image.new(mode, size, (200, 80, 40, 128) if mode == 'RGBA' else (200, 80, 40)).save(out, format=fmt)
+    return SimpleUploadedFile(name, out.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class ImageVariantTest(TransactionTestCase):
+    # Worker của outbox đọc DB từ thread khác nên cần dữ liệu đã commit
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        self.building = Building.objects.create(name='B1', address='Nhà Bè')
+
+    def test_upload_enqueues_variants_once(self):
+        room = Room.objects.create(building=self.building, name='P101', capacity=4,
+                                   image=png_upload('p101.png', (2400, 1600)))
+        room.save()
+        self.assertEqual(OutboxMessage.objects.filter(channel='image').count(), 1)
+        room.refresh_from_db()
+        self.assertEqual(room.image_variants, {'source': room.image.name})
+
+    def test_worker_renders_webp_and_jpeg(self):
+        room = Room.objects.create(building=self.building, name='P101', capacity=4,
+                                   image=png_upload('p101.png', (2400, 1600), mode='RGBA'))
+        summary = outbox_service.drain(backend=FakeBackend(), workers=1)
+        self.assertEqual(summary['sent'], 1)
+
+        room.refresh_from_db()
+        sizes = room.image_variants['sizes']
+        self.assertEqual(room.image_variants['source'], room.image.name)
+        self.assertEqual((sizes['thumb']['width'], sizes['thumb']['height']), (160, 107))
+        self.assertEqual(sizes['full']['width'], 1280)
+        for entry in sizes.values():
+            with default_storage.open(entry['webp']) as f, Image.open(f) as img:
+                self.assertEqual((img.format, img.width), ('WEBP', entry['width']))
+            with default_storage.open(entry['jpeg']) as f, Image.open(f) as img:
+                self.assertEqual((img.format, img.mode), ('JPEG', 'RGB'))
+
+        response = APIClient().get(f'/room/{room.pk}/')
+        srcset = response.json()['image_srcset']
+        self.assertEqual(set(srcset), {'thumb', 'card', 'full'})
+        self.assertTrue(srcset['card']['webp'].endswith('/static/' + sizes['card']['webp']))
+
+    def test_small_image_is_not_upscaled(self):
+        room = Room.objects.create(building=self.building, name='P101', capacity=4,
+                                   image=png_upload('p101.png', (300, 200)))
+        image_service.process('dorms.room', room.pk)
+        room.refresh_from_db()
+        self.assertEqual(room.image_variants['sizes']['card']['width'], 300)
+        self.assertEqual(room.image_variants['sizes']['thumb']['width'], 160)
+
+    def test_replaced_image_discards_stale_result(self):
+        room = Room.objects.create(building=self.building, name='P101', capacity=4,
+                                   image=png_upload('p101.png', (800, 600)))
+        render_variants = image_service.render_variants
+        rendered = []
+
+        def swap_during_render(name, *args, **kwargs):
+            # Ảnh bị thay trong lúc worker đang render ảnh cũ
+            result = render_variants(name, *args, **kwargs)
+            rendered.extend(image_service.variant_files(result))
+            room.image = png_upload('p101b.png', (800, 600))
+            room.save()
+            return result
+
+        with mock.patch.object(image_service, 'render_variants', swap_during_render):
+            self.assertFalse(image_service.process('dorms.room', room.pk))
+
+        room.refresh_from_db()
+        self.assertEqual(room.image_variants, {'source': room.image.name})
+        self.assertEqual(len(rendered), 6)
+        self.assertFalse(any(default_storage.exists(name) for name in rendered))
+
+    def test_old_variants_are_deleted_when_image_changes(self):
+        room = Room.objects.create(building=self.building, name='P101', capacity=4,
+                                   image=png_upload('p101.png', (800, 600)))
+        image_service.process('dorms.room', room.pk)
+        room.refresh_from_db()
+        old_files = image_service.variant_files(room.image_variants)
+        self.assertEqual(len(old_files), 6)
+
+        room.image = png_upload('p101b.png', (800, 600))
+        room.save()
+        self.assertEqual(room.image_variants['stale'], old_files)
+        self.assertTrue(image_service.process('dorms.room', room.pk))
+        room.refresh_from_db()
+        self.assertNotIn('stale', room.image_variants)
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+        new_files = image_service.variant_files(room.image_variants)
+        self.assertTrue(all(default_storage.exists(name) for name in new_files))
+
+        # Xóa ảnh: worker chỉ dọn các bản thu nhỏ
+        room.image = None
+        room.save()
+        self.assertEqual(OutboxMessage.objects.filter(channel='image').count(), 3)
+        room.save()
+        self.assertEqual(OutboxMessage.objects.filter(channel='image').count(), 3)
+        self.assertTrue(image_service.process('dorms.room', room.pk))
+        room.refresh_from_db()
+        self.assertEqual(room.image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in new_files))
+        self.assertFalse(image_service.process('dorms.room', room.pk))
+
+    def test_backfill_command(self):
+        user = User.objects.create(username='sv1', role='student', avatar=png_upload('a.png', (640, 640)))
+        User.objects.filter(pk=user.pk).update(avatar_variants={})
+        OutboxMessage.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('generate_image_variants', '--workers', '0', '--model', 'dorms.user', stdout=out)
+        self.assertIn('1/1', out.getvalue())
+        user.refresh_from_db()
+        self.assertEqual(user.avatar_variants['sizes']['card']['width'], 480)
+
+        call_command('generate_image_variants', '--workers', '0', stdout=out)
+        self.assertIn('Không có ảnh nào cần xử lý.', out.getvalue())
+
+
+class ImageUploadHandlerTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create(username='sv1', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, file):
+        return self.client.patch(f'/users/{self.user.pk}/update-profile/', {'avatar': file}, format='multipart')
+
+    def test_oversize_image_is_downscaled_before_saving(self):
+        response = self.upload(png_upload('photo.jpeg', (3000, 2000), fmt='JPEG'))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.endswith('.jpg'))
+        with Image.open(self.user.avatar.path) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (2560, 1707)))
+
+    def test_jpeg_is_decoded_at_reduced_scale(self):
+        from PIL.JpegImagePlugin import JpegImageFile
+        draft, decoded = JpegImageFile.draft, []
+
+        def record_draft(img, mode, size):
+            result = draft(img, mode, size)
+            decoded.append(img.size)
+            return result
+
+        # Ảnh ngang: khung vuông MAX_EDGE x MAX_EDGE khiến cạnh ngắn không đạt nên giải mã cả ảnh gốc
+        self.assertEqual(uploads.draft_size((5200, 3900)), (2560, 1920))
+        with mock.patch.object(uploads, 'MAX_EDGE', 500), \
+                mock.patch.object(JpegImageFile, 'draft', autospec=True, side_effect=record_draft):
+            response = self.upload(png_upload('photo.jpg', (1040, 780), fmt='JPEG'))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(decoded[0], (520, 390))
+        self.user.refresh_from_db()
+        with Image.open(self.user.avatar.path) as img:
+            self.assertEqual(img.size, (500, 375))
+
+    def test_small_image_is_kept(self):
+        response = self.upload(png_upload('a.png', (400, 300)))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        with Image.open(self.user.avatar.path) as img:
+            self.assertEqual((img.format, img.size), ('PNG', (400, 300)))
+
+    def test_format_is_checked_from_header_bytes(self):
+        fake = SimpleUploadedFile('avatar.jpg', b'<?php echo 1; ?>' * 10, content_type='image/jpeg')
+        response = self.upload(fake)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JPEG, PNG hoặc WebP', response.json()['detail'])
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_size_and_pixel_limits_reject_early(self):
+        with mock.patch.object(uploads, 'MAX_BYTES', 1024):
+            response = self.upload(png_upload('a.jpg', (600, 600), fmt='JPEG'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vượt quá', response.json()['detail'])
+
+        handler = uploads.ImageUploadHandler()
+        handler.new_file('avatar', 'big.png', 'image/png', 0)
+        data = png_upload('big.png', (1200, 1000)).read()
+        with mock.patch.object(uploads, 'MAX_PIXELS', 1_000_000):
+            with self.assertRaisesMessage(uploads.ImageUploadError, '1200x1000'):
+                handler.receive_data_chunk(data[:64], 0)
+        self.assertTrue(handler.file.closed)
+
+
+class MediaURLTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='sv1', role='student', avatar='users/2025/06/a b.jpg')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_avatar_url_has_single_prefix(self):
+        data = self.client.get('/users/current-user/').json()
+        self.assertEqual(data['avatar'], 'http://testserver/static/users/2025/06/a%20b.jpg')
+        self.assertEqual(data['avatar_srcset'], {})
+
+    def test_base_is_computed_once_per_request(self):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        for i in range(5):
+            thumb = {'width': 160, 'webp': f'rooms/p{i}__thumb.webp', 'jpeg': f'rooms/p{i}__thumb.jpg'}
+            Room.objects.create(building=building, name=f'P{i}', capacity=4, image=f'rooms/p{i}.jpg',
+                                image_variants={'source': f'rooms/p{i}.jpg', 'sizes': {'thumb': thumb}})
+        cache.clear()
+        with mock.patch('django.http.request.HttpRequest.build_absolute_uri', autospec=True,
+                        side_effect=lambda request, location: 'http://testserver' + location) as build:
+            rooms = self.client.get(f'/building/{building.pk}/').json()['rooms']
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(rooms[0]['image_srcset']['thumb']['webp'], 'http://testserver/static/rooms/p0__thumb.webp')
+
+    @override_settings(MEDIA_CDN_URL='https://cdn.example.com/media')
+    def test_cdn_base_url(self):
+        data = self.client.get('/users/current-user/').json()
+        self.assertEqual(data['avatar'], 'https://cdn.example.com/media/users/2025/06/a%20b.jpg')
+        self.assertEqual(get_media_resolver().url(''), '')
+
+
+class ReadSerializerParityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        building = Building.objects.create(name='B1', address='Nhà Bè')
+        variants = {'source': 'rooms/p1.jpg', 'sizes': {
+            'thumb': {'width': 160, 'height': 120, 'webp': 'rooms/p1__thumb.webp', 'jpeg': 'rooms/p1__thumb.jpg'}}}
+        rooms = [
+            Room.objects.create(building=building, name='P1', capacity=1, image='rooms/p1.jpg',
+                                image_variants=variants, description='<p>Phòng <b>đơn</b></p>'),
+            Room.objects.create(building=building, name='P2', capacity=4, gender_restriction='female'),
+        ]
+        cls.student = User.objects.create(username='sv1', role='student')
+        RoomRegistration.objects.create(student=cls.student, room=rooms[0])
+
+        fee_type, room_fee = FeeType.objects.create(name='Điện'), FeeType.objects.create(name='Tiền phòng')
+        method = PaymentMethod.objects.create(name='VNPay')
+        paid = Invoice.objects.create(room=rooms[0], billing_period=date(2025, 5, 1), is_paid=True,
+                                      paid_at=timezone.now(), payment_method=method)
+        Invoice.objects.create(room=rooms[1], billing_period=date(2025, 6, 1))
+        InvoiceDetail.objects.create(invoice=paid, fee_type=fee_type, quantity=12.5, unit='kWh',
+                                     unit_price=Decimal('3500.50'), amount=Decimal('43756.25'))
+        InvoiceDetail.objects.create(invoice=paid, fee_type=room_fee, amount=Decimal('100000'))
+
+        for i in range(3):
+            notif = Notification.objects.create(title=f'Thông báo {i}', content='Cúp điện', is_urgent=i == 0)
+            NotificationRecipient.objects.create(notification=notif, user=cls.student)
+        NotificationRecipient.objects.filter(notification=notif).update(is_read=True, read_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.request = Request(APIRequestFactory().get('/'))
+        self.request.user = self.student
+
+    def assertParity(self, read_serializer_class, serializer_class, queryset):
+        fast = read_serializer_class({'request': self.request})
+        expected = serializer_class(queryset, many=True, context={'request': self.request}).data
+        self.assertEqual(JSONRenderer().render(fast.serialize(fast.values(queryset))), JSONRenderer().render(expected))
+
+    def test_rooms(self):
+        self.assertParity(read_serializers.RoomReadSerializer, serializers.RoomSerializer,
+                          Room.objects.with_occupancy().order_by('id'))
+
+    def test_invoices_with_details(self):
+        self.assertParity(read_serializers.InvoiceReadSerializer, serializers.InvoiceSerializer,
+                          Invoice.objects.prefetch_related('invoice_details').order_by('id'))
+
+    def test_notifications_for_admin_and_recipient(self):
+        feed = Notification.objects.select_related('notification_type').order_by('-created_at', '-id')
+        self.assertParity(read_serializers.NotificationReadSerializer, serializers.NotificationSerializer, feed)
+        self.assertParity(read_serializers.NotificationReadSerializer, serializers.NotificationSerializer,
+                          feed.filter(recipients__user=self.student)
+                          .annotate(is_read=F('recipients__is_read'), read_at=F('recipients__read_at')))
+
+    def test_list_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        feed = client.get('/notifications/').json()
+        self.assertEqual([n['is_read'] for n in feed['results']], [True, False, False])
+        self.assertIsNotNone(feed['results'][0]['read_at'])
+
+        invoices = client.get('/invoice/').json()
+        self.assertEqual([len(i['invoice_details']) for i in invoices], [2])
+        self.assertEqual(invoices[0]['total_amount'], '143756.25')
+
+
+class FastJSONRendererTest(TestCase):
+    def test_output_matches_json_renderer(self):
+        data = {
+            'price': Decimal('3500.50'),
+            'created_at': datetime(2025, 6, 1, 8, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'local': datetime(2025, 6, 1, 15, 30, tzinfo=dt_timezone(timedelta(hours=7))),
+            'period': date(2025, 6, 1),
+            'html': '<p>Phòng <b>đơn</b> có máy lạnh\u2028mới</p>',
+            'label': gettext_lazy('Điện'),
+            'method': serializers.PaymentMethodSerializer(PaymentMethod(id=1, name='VNPay')).data,
+            'nested': [{'ok': True, 'none': None, 'float': 0.1}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_falls_back_to_json_renderer(self):
+        data = {'big': 2 ** 70, 1: 'key không phải chuỗi'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+                         JSONRenderer().render({'a': 1}, 'application/json; indent=2'))
+
+
+class CompressionMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.building = Building.objects.create(name='B1', address='Nhà Bè')
+        for i in range(20):
+            Room.objects.create(building=cls.building, name=f'P{i}', capacity=4,
+                                description='<p>Phòng <b>4 người</b>, có máy lạnh và ban công</p>')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_gzip_when_accepted(self):
+        plain = self.client.get(f'/building/{self.building.pk}/')
+        response = self.client.get(f'/building/{self.building.pk}/', HTTP_ACCEPT_ENCODING='br;q=0, gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        # ETag thành weak nhưng GET có điều kiện vẫn trả 304
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        cached = self.client.get(f'/building/{self.building.pk}/', HTTP_ACCEPT_ENCODING='gzip',
+                                 HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/payment-method/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(response.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_accepted_encoding(self):
+        available = ('br', 'gzip')
+        self.assertEqual(middleware.accepted_encoding('gzip, deflate, br', available), 'br')
+        self.assertEqual(middleware.accepted_encoding('br;q=0.5, gzip;q=0.8', available), 'gzip')
+        self.assertEqual(middleware.accepted_encoding('*;q=0.1', available), 'br')
+        self.assertEqual(middleware.accepted_encoding('identity', available), None)
+        self.assertEqual(middleware.accepted_encoding('', available), None)
+        self.assertEqual(middleware.accepted_encoding('br', ('gzip',)), None)
+
+    def test_streaming_gzip(self):
+        chunks = [f'{i},Nguyễn Văn {i}\n'.encode() for i in range(500)]
+        self.assertEqual(gzip.decompress(b''.join(middleware.compress_stream('gzip', iter(chunks)))),
+                         b''.join(chunks))
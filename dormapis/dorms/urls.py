@@ -9,6 +9,7 @@ router.register('room', views.RoomViewSet, basename='room')
 router.register('register-room', views.RoomRegisterViewSet, basename='register-room')
 router.register('room-swap', views.RoomSwapViewSet, basename='swap-room')
 router.register('invoice', views.InvoiceViewSet, basename='invoice')
+router.register('payment-method', views.PaymentMethodViewSet, basename='payment-method')
 router.register('invoice-detail', views.InvoiceDetailViewSet, basename='invoice-detail')
 router.register('fcm', views.FCMTokenViewSet, basename='firebase-cloud-message')
 router.register('notifications', views.NotificationViewSet, basename='notifications')
@@ -16,4 +17,5 @@ router.register('support-request', views.SupportRequestViewSet, basename='suppor
 urlpatterns = [
     path('', include(router.urls)),
     path('payment-return/', views.payment_return, name='payment_return'),
+    path('payment-ipn/', views.payment_ipn, name='payment_ipn'),
 ]
\ No newline at end of file
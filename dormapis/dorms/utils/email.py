@@ -1,14 +1,14 @@
-from django.core.mail import send_mail
-from django.conf import settings
 from datetime import timedelta
 from django.utils.timezone import localtime
+from ..services import outbox_service
+
+# Email không gửi trực tiếp trong request mà được đưa vào outbox, worker run_outbox_worker sẽ gửi
 
 
 def send_invoice_email(user, invoice):
     due_date = invoice.billing_period + timedelta(days=7)
     formatted_due_date = due_date.strftime('%d/%m/%Y')
-    total_amount = sum([detail.amount or 0 for detail in invoice.invoice_details.all()])
-    formatted_amount = "{:,.0f} VND".format(total_amount)
+    formatted_amount = "{:,.0f} VND".format(invoice.total_amount)
     subject = f"Hóa đơn tiền phòng {invoice.billing_period.strftime('%d/%m/%Y')} từ ký túc xá"
     message = f"""
         Xin chào {user.last_name},
@@ -21,8 +21,7 @@ def send_invoice_email(user, invoice):
         Trân trọng,
         Ban quản lý ký túc xá
         """
-    recipient = [user.email]
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient)
+    outbox_service.enqueue_email(user, subject, message)
 
 
 def send_invoice_payment_success_email(user, invoice):
@@ -46,5 +45,4 @@ def send_invoice_payment_success_email(user, invoice):
         Trân trọng,
         Ban quản lý ký túc xá
     """
-    recipient = [user.email]
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient)
\ No newline at end of file
+    outbox_service.enqueue_email(user, subject, message)
\ No newline at end of file
@@ -8,11 +8,12 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 FIREBASE_CREDENTIAL_PATH = BASE_DIR / 'firebase' / 'dormapp-11c0b-firebase-adminsdk-fbsvc-a17d1982ce.json'
 
-if not os.path.exists(FIREBASE_CREDENTIAL_PATH):
-    raise FileNotFoundError(f"Firebase credentials file not found at: {FIREBASE_CREDENTIAL_PATH}")
-print("Firebase JSON path:", FIREBASE_CREDENTIAL_PATH)
 
-# Khởi tạo Firebase app (chỉ chạy một lần)
-if not firebase_admin._apps:
-    cred = credentials.Certificate(FIREBASE_CREDENTIAL_PATH)
-    firebase_admin.initialize_app(cred)
\ No newline at end of file
+def get_app():
+    # Khởi tạo Firebase app khi gửi lần đầu (chỉ chạy một lần), không khởi tạo lúc import module
+    if not firebase_admin._apps:
+        if not os.path.exists(FIREBASE_CREDENTIAL_PATH):
+            raise FileNotFoundError(f"Firebase credentials file not found at: {FIREBASE_CREDENTIAL_PATH}")
+        cred = credentials.Certificate(FIREBASE_CREDENTIAL_PATH)
+        firebase_admin.initialize_app(cred)
+    return firebase_admin.get_app()
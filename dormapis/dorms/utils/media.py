@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+
+# Ảnh upload (MEDIA_ROOT) nằm trong static/ nên được phục vụ dưới /static/
+# (Django không cho MEDIA_URL trùng STATIC_URL nên không dùng MEDIA_URL)
+MEDIA_PATH = '/static/'
+
+
+class MediaURLResolver:
+    """Ghép URL ảnh từ một base đã tính sẵn, không gọi build_absolute_uri cho từng object"""
+
+    def __init__(self, base):
+        self.base = base if base.endswith('/') else base + '/'
+
+    def url(self, name):
+        return self.base + filepath_to_uri(name) if name else ''
+
+    def srcset(self, variants):
+        """{'thumb': {'width': 160, 'webp': url, 'jpeg': url}, ...}, rỗng nếu các bản chưa được tạo"""
+        return {
+            variant: {'width': entry['width'], 'webp': self.url(entry['webp']), 'jpeg': self.url(entry['jpeg'])}
+            for variant, entry in (variants or {}).get('sizes', {}).items()
+        }
+
+
+@lru_cache(maxsize=8)
+def _resolver_for(base):
+    return MediaURLResolver(base)
+
+
+def get_media_resolver(request=None):
+    """
+    MEDIA_CDN_URL nếu có cấu hình, ngược lại /static/ ghép với scheme/host của request.
+    Base được tính một lần mỗi request và dùng chung cho mọi trường ảnh.
+    """
+    cdn_url = getattr(settings, 'MEDIA_CDN_URL', '')
+    if cdn_url:
+        return _resolver_for(cdn_url)
+    if request is None:
+        return _resolver_for(MEDIA_PATH)
+
+    http_request = getattr(request, '_request', request)
+    resolver = getattr(http_request, 'media_resolver', None)
+    if resolver is None:
+        resolver = MediaURLResolver(http_request.build_absolute_uri(MEDIA_PATH))
+        http_request.media_resolver = resolver
+    return resolver
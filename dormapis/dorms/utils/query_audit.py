@@ -0,0 +1,192 @@
+import re
+from datetime import date
+
+from django.apps import apps
+from django.db import connection
+from django.utils import timezone
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .. import views
+from ..context import StudentContext, active_registration
+from ..models import User, PaymentTransaction
+from ..services import firebase_service, invoice_service, notification_service, outbox_service, \
+    reconciliation_service
+
+# (tên, nơi dùng trong code, hàm tạo queryset, các bảng được phép quét toàn bộ)
+QUERY_SHAPES = []
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def query_shape(source, allow=()):
+    def register(func):
+        QUERY_SHAPES.append((func.__name__, source, func, set(allow)))
+        return func
+    return register
+
+
+def explain(queryset):
+    """Chạy EXPLAIN cho câu SQL của queryset, trả về danh sách dòng (dict theo tên cột)"""
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [col[0].lower() for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Các bảng của app bị quét toàn bộ trong kế hoạch thực thi"""
+    tables = {model._meta.db_table for model in apps.get_app_config('dorms').get_models()}
+    scanned = set()
+    for row in plan:
+        if connection.vendor == 'sqlite':
+            match = _SQLITE_SCAN.match(row.get('detail', ''))
+            if match:
+                scanned.add(match.group(1))
+        elif connection.vendor == 'mysql':
+            if row.get('type') == 'ALL':
+                scanned.add(row.get('table'))
+        else:
+            scanned.update(_POSTGRES_SCAN.findall(' '.join(str(v) for v in row.values())))
+
+    # Alias của SQLite/MySQL có thể khác tên bảng thật, chỉ giữ các bảng của dorms
+    return scanned & tables
+
+
+def audit():
+    """Trả về [(tên, nơi dùng, các bảng bị quét toàn bộ ngoài danh sách cho phép, plan)]"""
+    results = []
+    for name, source, factory, allow in QUERY_SHAPES:
+        plan = explain(factory())
+        results.append((name, source, sorted(full_scans(plan) - allow), plan))
+    return results
+
+
+def _view(view_class, user, params=None, action='list'):
+    """Viewset thật với một request GET giả, để lấy đúng queryset mà request đó chạy"""
+    request = Request(APIRequestFactory().get('/', params or {}))
+    request.user = user
+    return view_class(request=request, args=(), kwargs={}, format_kwarg=None, action=action)
+
+
+def _admin():
+    return User(pk=1, role='admin')
+
+
+def _student(view_class, params=None, room_id=1):
+    view = _view(view_class, User(pk=1, role='student'), params)
+    # Đặt sẵn đăng ký đang hiệu lực cho context của request, không đọc DB/cache
+    context = StudentContext(view.request.user)
+    context.__dict__['_active'] = (1, room_id)
+    view.request._request.student_context = context
+    return view
+
+
+def _first_page(view, queryset):
+    """Câu truy vấn trang đầu theo paginator của view (giống CursorPagination/PageNumberPagination của DRF)"""
+    paginator = view.paginator
+    if paginator is None:
+        return queryset
+    if isinstance(paginator, CursorPagination):
+        return queryset.order_by(*paginator.ordering)[:paginator.page_size + 1]
+    return queryset[:paginator.page_size]
+
+
+def _read_rows(view):
+    return _first_page(view, view.get_rows(view.get_read_serializer()))
+
+
+# Các id/giá trị cụ thể không ảnh hưởng kế hoạch thực thi, chỉ cần đúng kiểu.
+# Mỗi dạng gọi đúng hàm/viewset tạo queryset trong code, không chép lại điều kiện lọc.
+@query_shape('context.StudentContext._active')
+def active_registration_of_student():
+    # .first() trên queryset chưa sắp xếp
+    return active_registration(1).order_by('pk')[:1]
+
+
+@query_shape('invoice_service.notify_new_invoices / notify_invoice_paid')
+def active_registrations_of_rooms():
+    return invoice_service.active_registrations([1, 2])
+
+
+@query_shape('notification_service.resolve_audience(room)')
+def audience_room():
+    return notification_service.resolve_audience('room', room=1)
+
+
+@query_shape('notification_service.resolve_audience(building)')
+def audience_building():
+    return notification_service.resolve_audience('building', building=1)
+
+
+@query_shape('RoomRegisterViewSet.list')
+def registrations_of_building_by_date():
+    view = _view(views.RoomRegisterViewSet, _admin(),
+                 {'building_id': '1', 'is_active': 'true', 'registered_from': '2025-01-01'})
+    return _first_page(view, view.get_queryset())
+
+
+@query_shape('RoomSwapViewSet.perform_create')
+def pending_swap_of_student():
+    return views.RoomSwapViewSet.pending_swaps(1)
+
+
+@query_shape('RoomViewSet.list (building_id)')
+def rooms_of_building():
+    return _read_rows(_view(views.RoomViewSet, _admin(), {'building_id': '1'}))
+
+
+@query_shape('InvoiceViewSet.list (sinh viên)')
+def invoices_of_room():
+    return _read_rows(_student(views.InvoiceViewSet))
+
+
+@query_shape('invoice_service.generate_invoices')
+def invoices_of_period():
+    return invoice_service.period_invoices([1, 2], date(2025, 6, 1))
+
+
+@query_shape('firebase_service.iter_tokens')
+def tokens_of_users():
+    return firebase_service.token_page([1, 2], 0)
+
+
+@query_shape('NotificationViewSet.list (người nhận)')
+def notification_feed():
+    return _read_rows(_student(views.NotificationViewSet))
+
+
+@query_shape('NotificationViewSet.unread_count')
+def unread_notifications():
+    return notification_service.unread_receipts(1)
+
+
+@query_shape('outbox_service.claim_batch')
+def due_outbox_messages():
+    return outbox_service.due_messages(timezone.now())[:100]
+
+
+@query_shape('SupportRequestViewSet.list (sinh viên)')
+def support_requests_of_student():
+    view = _student(views.SupportRequestViewSet)
+    return _first_page(view, view.filter_queryset(view.get_queryset()))
+
+
+@query_shape('SupportRequestViewSet.list (admin, is_resolved)')
+def unresolved_support_requests():
+    view = _view(views.SupportRequestViewSet, _admin(), {'is_resolved': 'false'})
+    return _first_page(view, view.filter_queryset(view.get_queryset()))
+
+
+@query_shape('VNPayService.apply_result (get_or_create theo txn_ref)')
+def payment_by_txn_ref():
+    return PaymentTransaction.objects.filter(txn_ref='1_1')
+
+
+@query_shape('reconciliation_service.reconcile')
+def successful_payments_of_invoices():
+    return reconciliation_service.successful_payments([1, 2])
@@ -0,0 +1,67 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize_sql(sql):
+    """Đưa câu SQL về "hình dạng": bỏ giá trị cụ thể để các câu giống nhau gom được vào một nhóm"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """execute_wrapper đếm số query, tổng thời gian DB và số lần lặp lại của từng hình dạng SQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[normalize_sql(sql)] += 1
+
+    def repeated(self, threshold):
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+    def check(self, max_queries=None, repeat_threshold=None):
+        problems = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append(f"{self.count} query vượt ngân sách {max_queries}")
+        if repeat_threshold:
+            for shape, n in self.repeated(repeat_threshold).items():
+                problems.append(f"nghi N+1 ({n} lần): {shape[:200]}")
+        if problems:
+            raise QueryBudgetExceeded('; '.join(problems))
+
+
+@contextmanager
+def query_budget(max_queries=None, repeat_threshold=None):
+    """
+    Dùng trong test:
+        with query_budget(max_queries=5, repeat_threshold=3):
+            client.get('/room/')
+    """
+    stats = QueryStats()
+    with connection.execute_wrapper(stats):
+        yield stats
+    stats.check(max_queries, repeat_threshold)
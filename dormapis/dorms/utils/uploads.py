@@ -0,0 +1,148 @@
+import io
+import math
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import parsers
+
+MAX_BYTES = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+# Ảnh có số điểm ảnh lớn hơn bị từ chối ngay khi đọc xong header (chống decompression bomb)
+MAX_PIXELS = getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 50_000_000)
+# Ảnh có cạnh dài hơn được thu nhỏ về kích thước này trước khi lưu
+MAX_EDGE = getattr(settings, 'IMAGE_UPLOAD_MAX_EDGE', 2560)
+# Phần đầu file tối đa dùng để đọc kích thước ảnh (EXIF của JPEG nằm trước header khung ảnh)
+HEADER_PROBE_BYTES = 512 * 1024
+
+# Định dạng được nhận, nhận diện bằng magic bytes chứ không tin content-type client gửi lên
+FORMATS = {
+    'JPEG': ('image/jpeg', '.jpg'),
+    'PNG': ('image/png', '.png'),
+    'WEBP': ('image/webp', '.webp'),
+}
+# Chất lượng nén khi phải lưu lại ảnh đã thu nhỏ
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True},
+    'PNG': {},
+    'WEBP': {'quality': 85},
+}
+
+
+class ImageUploadError(MultiPartParserError):
+    pass
+
+
+def sniff_format(head):
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def draft_size(size):
+    """Kích thước ảnh sau khi thu nhỏ cạnh dài về MAX_EDGE (làm tròn lên để draft không chọn tỉ lệ quá nhỏ)"""
+    scale = MAX_EDGE / max(size)
+    return tuple(max(1, math.ceil(edge * scale)) for edge in size)
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Ghi từng chunk ảnh upload thẳng xuống file tạm, từ chối sớm khi quá dung lượng,
+    sai định dạng hoặc quá nhiều điểm ảnh, và thu nhỏ ảnh quá lớn trước khi lưu.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Content-Length gồm cả các field khác và boundary, chừa thêm một chunk
+        if content_length and content_length > MAX_BYTES + self.chunk_size:
+            raise ImageUploadError(f"Ảnh vượt quá {MAX_BYTES // (1024 * 1024)} MB.")
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.size = 0
+        self.format = None
+        self.header = b''
+        self.dimensions = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > MAX_BYTES:
+            self._reject(f"Ảnh vượt quá {MAX_BYTES // (1024 * 1024)} MB.")
+        if self.dimensions is None:
+            self._probe(raw_data)
+
+        self.file.write(raw_data)
+        return None
+
+    def _probe(self, raw_data):
+        self.header += raw_data
+        if self.format is None:
+            if len(self.header) < 12:
+                return
+            self.format = sniff_format(self.header)
+            if self.format is None:
+                self._reject("Chỉ nhận ảnh JPEG, PNG hoặc WebP.")
+
+        try:
+            # Image.open chỉ đọc header, chưa giải mã điểm ảnh
+            with Image.open(io.BytesIO(self.header)) as img:
+                self.dimensions = img.size
+        except (UnidentifiedImageError, SyntaxError, OSError, EOFError):
+            if len(self.header) > HEADER_PROBE_BYTES:
+                self._reject("Không đọc được kích thước ảnh.")
+            return
+
+        self.header = b''
+        width, height = self.dimensions
+        if width * height > MAX_PIXELS:
+            self._reject(f"Ảnh {width}x{height} quá lớn.")
+
+    def _reject(self, message):
+        self.file.close()
+        raise ImageUploadError(message)
+
+    def file_complete(self, file_size):
+        if self.dimensions is None:
+            self._reject("Không đọc được kích thước ảnh.")
+
+        content_type, extension = FORMATS[self.format]
+        self.file.seek(0)
+        if max(self.dimensions) > MAX_EDGE:
+            self.file = self._downscale(content_type)
+        self.file.seek(0, os.SEEK_END)
+        self.file.size = self.file.tell()
+        self.file.seek(0)
+        self.file.name = os.path.splitext(self.file_name or 'image')[0] + extension
+        self.file.content_type = content_type
+        return self.file
+
+    def _downscale(self, content_type):
+        with Image.open(self.file) as img:
+            # JPEG giải mã thẳng ở tỉ lệ 1/2, 1/4, 1/8 nhỏ nhất mà vẫn không nhỏ hơn kích thước đích ở cả hai cạnh,
+            # nên phải xin đúng kích thước sau thumbnail chứ không phải khung MAX_EDGE x MAX_EDGE.
+            # Giới hạn: ảnh có cạnh dài dưới 2 * MAX_EDGE (vd. 4800px) không giải mã ở 1/2 được vì sẽ nhỏ hơn
+            # đích, vẫn phải dựng ảnh gốc trong RAM (~3 byte/điểm ảnh, xem bench_image_upload)
+            img.draft(img.mode, draft_size(img.size))
+            # Thu nhỏ tại chỗ trước rồi mới xoay theo EXIF để không phải chép ảnh gốc
+            img.thumbnail((MAX_EDGE, MAX_EDGE), Image.LANCZOS)
+            resized = ImageOps.exif_transpose(img)
+
+        out = TemporaryUploadedFile(self.file_name, content_type, 0, self.charset, self.content_type_extra)
+        resized.save(out, format=self.format, **SAVE_OPTIONS[self.format])
+        self.file.close()
+        return out
+
+
+class ImageMultiPartParser(parsers.MultiPartParser):
+    """MultiPartParser cho các API nhận ảnh: file upload đi qua ImageUploadHandler"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request._request.upload_handlers = [ImageUploadHandler(request._request)]
+        return super().parse(stream, media_type, parser_context)
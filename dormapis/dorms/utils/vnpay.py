@@ -2,6 +2,56 @@
 import hashlib
 import hmac
 import urllib.parse
+from functools import lru_cache
+
+# Tên tham số vnp_* lặp lại ở mọi request nên chỉ cần quote một lần
+_quote_key = lru_cache(maxsize=256)(urllib.parse.quote_plus)
+
+
+class VNPaySigner:
+    """
+    Ký và kiểm tra chữ ký HMAC-SHA512 của VNPay. Key được nạp vào HMAC một lần,
+    mỗi chữ ký chỉ copy trạng thái đã khởi tạo thay vì dựng lại key.
+    """
+
+    def __init__(self, hash_secret):
+        self._base = hmac.new(bytes(str(hash_secret), 'utf-8'), digestmod=hashlib.sha512)
+
+    @staticmethod
+    def build_query(data):
+        # Cho kết quả giống urlencode(sorted(...)) nhưng bỏ qua các bước kiểm tra kiểu của nó
+        quote = urllib.parse.quote_plus
+        return '&'.join([f"{_quote_key(str(k))}={quote(str(v))}" for k, v in sorted(data.items())])
+
+    def sign_query(self, query):
+        mac = self._base.copy()
+        mac.update(query.encode('utf-8'))
+        return mac.hexdigest()
+
+    def sign(self, data):
+        return self.sign_query(self.build_query(data))
+
+    def sign_many(self, items):
+        return [self.sign(data) for data in items]
+
+    def payment_url(self, base_url, data):
+        query = self.build_query(data)
+        return f"{base_url}?{query}&vnp_SecureHash={self.sign_query(query)}"
+
+    def verify(self, data):
+        payload = dict(data)
+        secure_hash = payload.pop('vnp_SecureHash', None) or ''
+        payload.pop('vnp_SecureHashType', None)
+        # So sánh thời gian hằng để không lộ thông tin chữ ký qua thời gian phản hồi
+        return hmac.compare_digest(self.sign(payload).encode(), str(secure_hash).encode())
+
+    def verify_many(self, items):
+        return [self.verify(data) for data in items]
+
+
+@lru_cache(maxsize=8)
+def get_signer(hash_secret):
+    return VNPaySigner(hash_secret)
 
 
 class VNPay:
@@ -10,24 +60,13 @@ class VNPay:
         self.responseData = {}
 
     def get_payment_url(self, base_url, hash_secret):
-        query = self._build_query(self.requestData)
-        hash_value = self._hmac_sha512(hash_secret, query)
-        payment_url = f"{base_url}?{query}&vnp_SecureHash={hash_value}"
-        return payment_url
+        return get_signer(hash_secret).payment_url(base_url, self.requestData)
 
     def validate_response(self, hash_secret):
-        response = self.responseData.copy()
-        secure_hash = response.pop('vnp_SecureHash', None)
-        response.pop('vnp_SecureHashType', None)
-        sorted_query = self._build_query(response)
-        expected_hash = self._hmac_sha512(hash_secret, sorted_query)
-        return secure_hash == expected_hash
-
-    def _build_query(self, data):
-        sorted_data = sorted(data.items())
-        return urllib.parse.urlencode(sorted_data)
-
-    def _hmac_sha512(self, key, data):
-        byte_key = bytes(str(key), 'utf-8')
-        message = bytes(data, 'utf-8')
-        return hmac.new(byte_key, message, hashlib.sha512).hexdigest()
+        return get_signer(hash_secret).verify(self.responseData)
+
+    def sign_response(self, hash_secret):
+        """Ký responseData giống cổng VNPay, dùng để giả lập callback khi test"""
+        data = dict(self.responseData)
+        data['vnp_SecureHash'] = get_signer(hash_secret).sign(data)
+        return data
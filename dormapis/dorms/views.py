@@ -1,21 +1,29 @@
-from datetime import datetime
+import csv
+import json
+from datetime import datetime, timedelta
 
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch
 from django.utils import timezone
-from django.http import JsonResponse
-from django.conf import settings
-from .utils.vnpay import VNPay
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets, generics, status, parsers
 from .models import User, Building, Room, RoomRegistration, RoomSwap, Invoice, InvoiceDetail, FCMDevice, SupportRequest, \
-    Notification
+    SupportResponse, Notification, NotificationRecipient, PaymentMethod
 from . import serializers, paginators
+from .cache import CatalogCacheMixin
+from .read_serializers import ReadSerializerListMixin, RoomReadSerializer, InvoiceReadSerializer, \
+    NotificationReadSerializer
+from .context import get_student_context
 from .perms import IsAdmin, OwnerPerms, RoomSwapOwner, IsStudent
 from .services.vnpay_service import VNPayService
-from .services import firebase_service
-from .utils.email import send_invoice_email, send_invoice_payment_success_email
+from .services import invoice_service, notification_service, outbox_service
+from .utils.email import send_invoice_email
+from .utils.uploads import ImageMultiPartParser
 
 
 # Create your views here.
@@ -24,7 +32,7 @@ from .utils.email import send_invoice_email, send_invoice_payment_success_email
 class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
     queryset = User.objects.filter(is_active=True)
     serializer_class = serializers.UserSerializer
-    parser_classes = [parsers.MultiPartParser, ]
+    parser_classes = [ImageMultiPartParser, ]
     permission_classes = [IsAuthenticated, IsAdmin]
 
     @action(methods=['get'], url_path='current-user', detail=False, permission_classes=[IsAuthenticated])
@@ -51,18 +59,24 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
 
     @action(methods=['get'], detail=False, url_path='my-room', permission_classes=[IsAuthenticated])
     def my_room(self, request):
-        try:
-            registration = RoomRegistration.objects.select_related('room', 'room__building') \
-                .get(student=request.user, is_active=True)
-            room = registration.room
-            serializer = serializers.RoomSerializer(room, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except RoomRegistration.DoesNotExist:
+        room_id = get_student_context(request).room_id
+        if room_id is None:
             return Response({"detail": "Bạn chưa ở phòng nào hiện tại."}, status=status.HTTP_404_NOT_FOUND)
+        room = Room.objects.select_related('building').with_occupancy().get(pk=room_id)
+        serializer = serializers.RoomSerializer(room, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class BuildingViewSet(viewsets.ReadOnlyModelViewSet):
+class BuildingViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Building.objects.all()
+    cache_namespace = 'building'
+
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            # Một query cho toàn bộ phòng của tòa nhà, kèm số sinh viên đang ở được annotate sẵn
+            rooms = Room.objects.with_occupancy().order_by('id')
+            return self.queryset.prefetch_related(Prefetch('room_set', queryset=rooms))
+        return self.queryset.all()
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -70,35 +84,80 @@ class BuildingViewSet(viewsets.ReadOnlyModelViewSet):
         return serializers.BuildingSerializer
 
 
-class RoomViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Room.objects.select_related('building').all().order_by('id')
+class RoomViewSet(CatalogCacheMixin, ReadSerializerListMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Room.objects.select_related('building').with_occupancy().order_by('id')
     serializer_class = serializers.RoomSerializer
+    read_serializer_class = RoomReadSerializer
     pagination_class = paginators.ItemPaginator
+    cache_namespace = 'room'
 
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = self.queryset.all()
         is_full = self.request.query_params.get('is_full')
         gender = self.request.query_params.get('gender_restriction')
         building_id = self.request.query_params.get('building_id')
 
         if is_full is not None:
             if is_full.lower() == 'false':
-                queryset = [room for room in queryset if not room.is_full]
+                queryset = queryset.filter(active_students__lt=F('capacity'))
             elif is_full.lower() == 'true':
-                queryset = [room for room in queryset if room.is_full]
+                queryset = queryset.filter(active_students__gte=F('capacity'))
 
         if gender:
-            queryset = [room for room in queryset if room.gender_restriction == gender]
+            queryset = queryset.filter(gender_restriction=gender)
 
         if building_id:
-            queryset = [room for room in queryset if str(room.building.id) == building_id]
+            if not building_id.isdigit():
+                return queryset.none()
+            queryset = queryset.filter(building_id=building_id)
 
         return queryset
 
 
+# Tên cột khi export -> đường dẫn field trong values_list
+EXPORT_FIELDS = {
+    'id': 'id',
+    'student_username': 'student__username',
+    'student_first_name': 'student__first_name',
+    'student_last_name': 'student__last_name',
+    'student_code': 'student__student_code',
+    'room_name': 'room__name',
+    'building_name': 'room__building__name',
+    'registered_at': 'registered_at',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'is_active': 'is_active',
+}
+
+
+class Echo:
+    # File giả cho csv.writer: trả lại dòng vừa ghi thay vì giữ trong bộ nhớ
+    def write(self, value):
+        return value
+
+
+def export_lines(rows, fmt, chunk_size=2000):
+    keys = list(EXPORT_FIELDS)
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield '\ufeff' + writer.writerow(keys)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield writer.writerow(row)
+    else:
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield json.dumps(dict(zip(keys, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class PaymentMethodViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = PaymentMethod.objects.filter(active=True).order_by('id')
+    serializer_class = serializers.PaymentMethodSerializer
+    cache_namespace = 'payment-method'
+
+
 class RoomRegisterViewSet(viewsets.ViewSet,
                           generics.CreateAPIView):
     queryset = RoomRegistration.objects.all()
+    pagination_class = paginators.RegistrationPaginator
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -113,15 +172,76 @@ class RoomRegisterViewSet(viewsets.ViewSet,
         return serializers.RegisterRoomSerializer
 
     def perform_create(self, serializer):
-        serializer.save(student=self.request.user)
+        try:
+            with transaction.atomic():
+                # Khóa dòng phòng để các request đăng ký đồng thời phải xếp hàng
+                room = Room.objects.select_for_update().get(pk=serializer.validated_data['room'].pk)
+                if room.is_full:
+                    raise ValidationError(f"{room.name} đã đầy")
+                serializer.save(student=self.request.user, room=room)
+        except IntegrityError:
+            raise ValidationError(
+                "Bạn đã đăng ký phòng rồi. Nếu muốn chuyển phòng, hãy gửi yêu cầu chuyển phòng để được duyệt."
+            )
+        except ValueError as ex:
+            raise ValidationError(str(ex))
+
+    def get_queryset(self):
+        return self.filter_registrations(
+            RoomRegistration.objects.select_related('student', 'room', 'room__building')
+        )
+
+    def filter_registrations(self, queryset):
+        params = self.request.query_params
+        building_id = params.get('building_id')
+        room_id = params.get('room_id')
+        is_active = params.get('is_active')
+
+        for value, lookup in ((building_id, 'room__building_id'), (room_id, 'room_id')):
+            if value:
+                if not value.isdigit():
+                    return queryset.none()
+                queryset = queryset.filter(**{lookup: value})
+        if is_active is not None:
+            if is_active.lower() not in ('true', 'false'):
+                raise ValidationError({'is_active': "Giá trị phải là true hoặc false."})
+            queryset = queryset.filter(is_active=is_active.lower() == 'true')
+
+        # So sánh trực tiếp với registered_at (không dùng __date) để dùng được index
+        for param, lookup, days in (('registered_from', 'registered_at__gte', 0),
+                                    ('registered_to', 'registered_at__lt', 1)):
+            value = params.get(param)
+            if value:
+                try:
+                    day = datetime.strptime(value, '%Y-%m-%d') + timedelta(days=days)
+                except ValueError:
+                    raise ValidationError({param: "Ngày phải có dạng YYYY-MM-DD."})
+                queryset = queryset.filter(**{lookup: timezone.make_aware(day)})
+
+        return queryset.order_by('-registered_at', '-id')
 
     def list(self, request):
-        if not IsAdmin().has_permission(request, self):
+        if not get_student_context(request).is_admin:
             raise PermissionDenied("Chỉ quản trị viên mới được xem danh sách đăng ký phòng.")
 
-        queryset = RoomRegistration.objects.select_related('student', 'room', 'room__building')
-        serializer = serializers.RoomRegistrationAdminSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = serializers.RoomRegistrationAdminSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=False, url_path='export')
+    def export(self, request):
+        """
+        Admin GET /register-room/export/?fmt=csv|ndjson, cùng bộ lọc với danh sách, trả về dạng stream.
+        """
+        fmt = request.query_params.get('fmt', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            raise ValidationError({'fmt': "Chỉ hỗ trợ csv hoặc ndjson."})
+
+        rows = self.filter_registrations(RoomRegistration.objects.all()).values_list(*EXPORT_FIELDS.values())
+        content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(export_lines(rows, fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="room-registrations.{fmt}"'
+        return response
 
 
 class RoomSwapViewSet(viewsets.ViewSet, generics.ListAPIView, generics.CreateAPIView):
@@ -140,20 +260,24 @@ class RoomSwapViewSet(viewsets.ViewSet, generics.ListAPIView, generics.CreateAPI
         # Trả về danh sách RoomSwap của student hiện tại, sắp xếp theo thời gian giảm dần
         return RoomSwap.objects.filter(student=self.request.user).order_by('-created_at')
 
+    @staticmethod
+    def pending_swaps(student_id):
+        return RoomSwap.objects.filter(student_id=student_id, is_approved=False)
+
     def perform_create(self, serializer):
         student = self.request.user
 
         # Kiểm tra sinh viên đã có yêu cầu chuyển phòng chưa được duyệt chưa
-        pending_swap = RoomSwap.objects.filter(student=student, is_approved=False).exists()
+        pending_swap = self.pending_swaps(student.pk).exists()
         if pending_swap:
             raise ValidationError("Bạn đã có yêu cầu chuyển phòng đang chờ xử lý.")
 
         # Kiểm tra sinh viên hiện có phòng không
-        current_registration = student.roomregistration_set.filter(is_active=True).first()
-        if not current_registration:
+        current_room_id = get_student_context(self.request).room_id
+        if current_room_id is None:
             raise ValidationError("Bạn chưa có phòng hiện tại để chuyển.")
 
-        serializer.save(student=student, current_room=current_registration.room)
+        serializer.save(student=student, current_room_id=current_room_id)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -177,30 +301,45 @@ class RoomSwapViewSet(viewsets.ViewSet, generics.ListAPIView, generics.CreateAPI
         except RoomSwap.DoesNotExist:
             return Response({"detail": "Yêu cầu không tồn tại."}, status=404)
 
-        if swap.is_approved:
-            return Response({"detail": "Yêu cầu này đã được duyệt."}, status=400)
-
-        if swap.desired_room.is_full:
-            return Response({"detail": f"{swap.desired_room.name} đã đầy."}, status=400)
-
-        student = swap.student
-
-        current_reg = RoomRegistration.objects.filter(student=student, is_active=True).first()
-        if current_reg:
-            current_reg.is_active = False
-            current_reg.end_date = timezone.now().date()
-            current_reg.save()
-
-        RoomRegistration.objects.create(
-            student=student,
-            room=swap.desired_room,
-            start_date=timezone.now().date()
-        )
-
-        swap.is_approved = True
-        swap.processed_by = request.user
-        swap.processed_at = timezone.now()
-        swap.save()
+        try:
+            with transaction.atomic():
+                swap = RoomSwap.objects.select_for_update().get(pk=swap.pk)
+                if swap.is_approved:
+                    return Response({"detail": "Yêu cầu này đã được duyệt."}, status=400)
+
+                student = swap.student
+                current_reg = RoomRegistration.objects.select_for_update() \
+                    .filter(student=student, is_active=True).first()
+
+                # Khóa các phòng liên quan theo thứ tự id để tránh deadlock giữa các lần duyệt
+                room_ids = {swap.desired_room_id}
+                if current_reg:
+                    room_ids.add(current_reg.room_id)
+                rooms = {room.pk: room for room in Room.objects.select_for_update().filter(pk__in=room_ids).order_by('pk')}
+                desired_room = rooms.get(swap.desired_room_id)
+
+                if desired_room is None:
+                    return Response({"detail": "Phòng muốn chuyển không tồn tại."}, status=400)
+                if desired_room.is_full:
+                    return Response({"detail": f"{desired_room.name} đã đầy."}, status=400)
+
+                if current_reg:
+                    current_reg.is_active = False
+                    current_reg.end_date = timezone.now().date()
+                    current_reg.save()
+
+                RoomRegistration.objects.create(
+                    student=student,
+                    room=desired_room,
+                    start_date=timezone.now().date()
+                )
+
+                swap.is_approved = True
+                swap.processed_by = request.user
+                swap.processed_at = timezone.now()
+                swap.save()
+        except ValueError as ex:
+            return Response({"detail": str(ex)}, status=400)
 
         serializer = self.get_serializer(swap)
         return Response({
@@ -209,8 +348,10 @@ class RoomSwapViewSet(viewsets.ViewSet, generics.ListAPIView, generics.CreateAPI
         })
 
 
-class InvoiceViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView, generics.CreateAPIView):
+class InvoiceViewSet(ReadSerializerListMixin, viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView,
+                     generics.CreateAPIView):
     serializer_class = serializers.InvoiceSerializer
+    read_serializer_class = InvoiceReadSerializer
     permission_classes = [IsAuthenticated]
 
     def get_permissions(self):
@@ -221,32 +362,51 @@ class InvoiceViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
         return super().get_permissions()
 
     def get_queryset(self):
-        user = self.request.user
-        if IsAdmin().has_permission(self.request, self):
-            return Invoice.objects.all()
-        elif IsStudent().has_permission(self.request, self):
-            reg = RoomRegistration.objects.filter(student=user, is_active=True).first()
-            if reg:
-                return Invoice.objects.filter(room=reg.room)
+        context = get_student_context(self.request)
+        invoices = Invoice.objects.prefetch_related('invoice_details')
+        if context.is_admin:
+            return invoices
+        elif context.is_student and context.has_room:
+            return invoices.filter(room_id=context.room_id)
         return Invoice.objects.none()
 
     def get_object(self):
         invoice = generics.get_object_or_404(Invoice, pk=self.kwargs.get('pk'))
-        user = self.request.user
-        if IsStudent().has_permission(self.request, self):
-            reg = RoomRegistration.objects.filter(student=user, is_active=True).first()
-            if not reg or reg.room != invoice.room:
-                raise PermissionDenied("Hóa đơn không phải của phòng bạn!.")
+        context = get_student_context(self.request)
+        if context.is_student and not context.owns_room(invoice.room_id):
+            raise PermissionDenied("Hóa đơn không phải của phòng bạn!.")
         return invoice
 
     def get_serializer_class(self):
         if self.action == 'pay':
             return serializers.InvoicePaySerializer
+        if self.action == 'bulk_generate':
+            return serializers.InvoiceBulkGenerateSerializer
         return serializers.InvoiceSerializer
 
+    @action(detail=False, methods=['post'], url_path='bulk-generate',
+            parser_classes=[parsers.JSONParser, parsers.MultiPartParser])
+    def bulk_generate(self, request):
+        """
+        Admin POST /invoice/bulk-generate/ để tạo hóa đơn cho cả kỳ từ chỉ số (JSON hoặc file CSV).
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        readings = data.get('readings') or invoice_service.read_csv_readings(data['file'])
+        try:
+            summary = invoice_service.generate_invoices(data['billing_period'], readings, notify=data['notify'])
+        except ValueError as ex:
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(summary, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['patch'])
     def pay(self, request, pk=None):
-        invoice = self.get_queryset().filter(pk=pk).first()
+        context = get_student_context(request)
+        # Không cần chi tiết hóa đơn ở đây nên bỏ prefetch
+        invoice = self.get_queryset().prefetch_related(None).filter(pk=pk).first()
 
         if not invoice:
             return Response({"detail": "Không tìm thấy hóa đơn."}, status=404)
@@ -255,8 +415,7 @@ class InvoiceViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
             return Response({"detail": "Hóa đơn đã thanh toán."}, status=400)
 
         # Check xem sinh viên có phải chủ phòng đang thuê không
-        reg = RoomRegistration.objects.filter(student=request.user, is_active=True).first()
-        if not reg or reg.room != invoice.room:
+        if not context.owns_room(invoice.room_id):
             return Response({"detail": "Bạn không có quyền thanh toán hóa đơn này."}, status=403)
 
             # Validate payment_method thông qua serializer
@@ -264,7 +423,7 @@ class InvoiceViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
         serializer.is_valid(raise_exception=True)
         payment_method = serializer.validated_data['payment_method']
 
-        amount = int(invoice.total_amount)  # từ property tính từ InvoiceDetail
+        amount = int(invoice.total_amount)  # tổng tiền đã lưu sẵn trên hóa đơn
         order_id = f"{invoice.id}_{int(datetime.now().timestamp())}"
         order_desc = f"Hóa đơn ký túc xá tháng {invoice.billing_period.strftime('%m/%Y')}"
         ip = request.META.get('REMOTE_ADDR', '127.0.0.1')
@@ -277,9 +436,8 @@ class InvoiceViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAP
             ip_address=ip,
         )
 
-        # Optional: lưu payment_method tạm vào invoice để sau IPN update
-        invoice.payment_method = payment_method
-        invoice.save(update_fields=['payment_method'])
+        # Lưu giao dịch chờ vào sổ, IPN sẽ cập nhật hóa đơn với payment_method này
+        VNPayService.start_transaction(invoice, payment_method, amount, order_id)
 
         return Response({
             "payment_url": payment_url,
@@ -299,73 +457,44 @@ class InvoiceDetailViewSet(viewsets.GenericViewSet,
         detail = serializer.save()
         invoice = detail.invoice
 
-        # Danh sách loại phí (có thể tùy chỉnh nếu có thay đổi về gói dịch vụ)
-        required_fee_types = {'Tiền phòng', 'Điện', 'Nước', 'Internet'}
-
         existing_fee_types = set(invoice.invoice_details.values_list('fee_type__name', flat=True))
 
-        if required_fee_types.issubset(existing_fee_types):
-            registrations = RoomRegistration.objects.filter(room=invoice.room, is_active=True)
+        if invoice_service.REQUIRED_FEE_TYPES.issubset(existing_fee_types):
+            invoice.refresh_from_db(fields=['total_amount'])
+            registrations = RoomRegistration.objects.filter(room=invoice.room, is_active=True).select_related('student')
             for reg in registrations:
                 send_invoice_email(reg.student, invoice)
 
-            # Gửi thông báo
-            firebase_service.notify_user(
-                user=invoice.student,
-                title="Hóa đơn mới",
-                body=f"Hóa đơn {invoice.code} đã được tạo, tổng tiền: {invoice.total_amount} VNĐ",
-                data={
-                    "invoice_id": str(invoice.id),
-                    "type": "new_invoice"
-                }
-            )
+                # Gửi thông báo
+                outbox_service.enqueue_push(
+                    user=reg.student,
+                    title="Hóa đơn mới",
+                    body=f"{invoice} đã được tạo, tổng tiền: {invoice.total_amount} VNĐ",
+                    data={
+                        "invoice_id": str(invoice.id),
+                        "type": "new_invoice"
+                    }
+                )
 
 
 def payment_return(request):
     input_data = request.GET.dict()
-    vnp = VNPay()
-    vnp.responseData = input_data
-
-    # Kiểm tra chữ ký của dữ liệu trả về
-    if not vnp.validate_response(settings.VNPAY_HASH_SECRET_KEY):
-        return JsonResponse({"RspCode": "97", "Message": "Invalid Signature"}, status=400)
-
-    # Lấy mã giao dịch (TxnRef) từ dữ liệu trả về
-    order_id = input_data.get('vnp_TxnRef')
-    response_code = input_data.get('vnp_ResponseCode')
 
-    # Tìm hóa đơn dựa trên mã giao dịch (TxnRef)
-    invoice_id = order_id.split("_")[0]
-    invoice = Invoice.objects.filter(pk=invoice_id).first()
+    # Dùng chung luồng xử lý với IPN: giao dịch chỉ được ghi nhận và thông báo một lần
+    result, txn = VNPayService.process_payment(input_data)
+    code = result['RspCode']
 
-    if not invoice:
+    if code == '97':
+        return JsonResponse({"RspCode": "97", "Message": "Invalid Signature"}, status=400)
+    if code == '01':
         return JsonResponse({"RspCode": "01", "Message": "Invoice not found"}, status=404)
+    if code == '04':
+        return JsonResponse({"RspCode": "04", "Message": "Invalid amount"}, status=400)
 
-    # Nếu hóa đơn đã được thanh toán rồi
-    if invoice.is_paid:
-        return JsonResponse({"RspCode": "02", "Message": "Order already updated"}, status=400)
-
-    # Kiểm tra mã phản hồi từ VNPay, "00" là thanh toán thành công
-
-    if response_code == "00":
-        invoice.is_paid = True
-        invoice.paid_at = timezone.now()
-        invoice.save()
-
-        registrations = RoomRegistration.objects.filter(room=invoice.room, is_active=True)
-        for reg in registrations:
-            send_invoice_payment_success_email(reg.student, invoice)
-
-        firebase_service.notify_user(
-            user=invoice.student,
-            title="Thanh toán thành công",
-            body=f"Hóa đơn {invoice.code} đã được thanh toán thành công.",
-            data={
-                "invoice_id": str(invoice.id),
-                "type": "invoice_paid"
-            }
-        )
+    invoice = Invoice.objects.get(pk=txn.invoice_id)
 
+    # Người dùng tải lại trang sau khi IPN đã xử lý vẫn thấy kết quả thành công
+    if txn.status == 'success' and invoice.is_paid:
         return JsonResponse({
             "RspCode": "00",
             "Message": "Confirm Success",
@@ -377,6 +506,9 @@ def payment_return(request):
             }
         })
 
+    if code == '02':
+        return JsonResponse({"RspCode": "02", "Message": "Order already updated"}, status=400)
+
     return JsonResponse({
         "RspCode": "02",
         "Message": "Payment failed",
@@ -388,6 +520,11 @@ def payment_return(request):
     }, status=400)
 
 
+def payment_ipn(request):
+    # VNPay đọc RspCode trong body, luôn trả 200
+    return JsonResponse(VNPayService.handle_ipn(request.GET.dict()))
+
+
 class FCMTokenViewSet(viewsets.ViewSet, generics.CreateAPIView):
     serializer_class = serializers.FCMDeviceSerializer
     permission_classes = [IsAuthenticated]
@@ -401,34 +538,62 @@ class FCMTokenViewSet(viewsets.ViewSet, generics.CreateAPIView):
         )
 
 
-class NotificationViewSet(viewsets.GenericViewSet,
+class NotificationViewSet(ReadSerializerListMixin,
+                          viewsets.GenericViewSet,
                           generics.ListAPIView,
                           generics.CreateAPIView):
     queryset = Notification.objects.all().order_by('-created_at')
     serializer_class = serializers.NotificationSerializer
+    read_serializer_class = NotificationReadSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = paginators.NotificationCursorPaginator
+    # pk không phải số (/notifications/abc/read/) trả 404 từ router thay vì lỗi 500 khi filter
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
         user = self.request.user
-        if user.role == 'admin':
-            return Notification.objects.all()
-        return Notification.objects.filter(target_users=user)
-
-    # def perform_create(self, serializer):
-    #     notif = serializer.save(sent_by=self.request.user)
-    #
-    #     # Gửi FCM cho từng user
-    #     for user in notif.target_users.all():
-    #         firebase_service.notify_user(
-    #             user=user,
-    #             title=notif.title,
-    #             body=notif.content,
-    #             data={
-    #                 "type": "notification",
-    #                 "notification_id": notif.id
-    #             },
-    #             is_urgent=notif.is_urgent
-    #         )
+        if get_student_context(self.request).is_admin:
+            return Notification.objects.select_related('notification_type')
+        # Một join duy nhất với bảng người nhận, lấy luôn trạng thái đã đọc
+        return Notification.objects.select_related('notification_type') \
+            .filter(recipients__user=user) \
+            .annotate(is_read=F('recipients__is_read'), read_at=F('recipients__read_at'))
+
+    @action(methods=['get'], detail=False, url_path='unread-count')
+    def unread_count(self, request):
+        count = notification_service.unread_receipts(request.user.pk).count()
+        return Response({'unread': count})
+
+    @action(methods=['post'], detail=True, url_path='read')
+    def mark_read(self, request, pk=None):
+        updated = NotificationRecipient.objects.filter(notification_id=pk, user=request.user, is_read=False) \
+            .update(is_read=True, read_at=timezone.now())
+        if not updated and not NotificationRecipient.objects.filter(notification_id=pk, user=request.user).exists():
+            return Response({"detail": "Không tìm thấy thông báo."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=['post'], detail=False, url_path='read-all')
+    def mark_all_read(self, request):
+        updated = notification_service.unread_receipts(request.user.pk).update(is_read=True, read_at=timezone.now())
+        return Response({'updated': updated})
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        audience = data.get('audience')
+
+        with transaction.atomic():
+            notif = serializer.save(sent_by=self.request.user)
+            if audience:
+                # Worker của outbox ghi target_users theo audience rồi mới gửi
+                audience = {'audience': audience}
+                for key in ('building', 'room'):
+                    if data.get(key):
+                        audience[key] = data[key].pk
+                if data.get('gender'):
+                    audience['gender'] = data['gender']
+
+            # Gửi FCM cho người nhận qua outbox (multicast theo lô trong worker)
+            notification_service.broadcast(notif, audience=audience)
 
 
 class SupportRequestViewSet(viewsets.GenericViewSet,
@@ -436,17 +601,35 @@ class SupportRequestViewSet(viewsets.GenericViewSet,
                             generics.CreateAPIView):
     serializer_class = serializers.SupportRequestSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = paginators.SupportRequestCursorPaginator
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'admin':
-            return SupportRequest.objects.all().order_by('-created_at')
-        return SupportRequest.objects.filter(student=user).order_by('-created_at')
+        requests = SupportRequest.objects.all()
+        if not get_student_context(self.request).is_admin:
+            requests = requests.filter(student=self.request.user)
+
+        params = self.request.query_params
+        is_resolved = params.get('is_resolved')
+        building_id = params.get('building_id')
+        if is_resolved is not None:
+            if is_resolved.lower() not in ('true', 'false'):
+                raise ValidationError({'is_resolved': "Giá trị phải là true hoặc false."})
+            requests = requests.filter(is_resolved=is_resolved.lower() == 'true')
+        if building_id:
+            if not building_id.isdigit():
+                return requests.none()
+            requests = requests.filter(room__building_id=building_id)
+
+        # Phản hồi của cả trang được lấy bằng một query, số phản hồi được đếm sẵn trong SQL
+        responses = SupportResponse.objects.order_by('responded_at', 'id')
+        return requests.annotate(response_count=Count('responses')) \
+            .prefetch_related(Prefetch('responses', queryset=responses))
 
     def perform_create(self, serializer):
         # Auto-đính kèm phòng của sinh viên nếu chưa có
-        room = serializer.validated_data.get('room') or getattr(self.request.user, 'room', None)
-        serializer.save(student=self.request.user, room=room)
+        room = serializer.validated_data.pop('room', None)
+        serializer.save(student=self.request.user,
+                        room_id=room.pk if room else get_student_context(self.request).room_id)
 
 
 class SupportResponseViewSet(viewsets.GenericViewSet,
@@ -458,7 +641,7 @@ class SupportResponseViewSet(viewsets.GenericViewSet,
         response = serializer.save(responder=self.request.user)
 
         # Gửi FCM cho sinh viên khi có phản hồi
-        firebase_service.notify_user(
+        outbox_service.enqueue_push(
             user=response.request.student,
             title="Phản hồi yêu cầu hỗ trợ",
             body=f"Yêu cầu '{response.request.title}' đã được phản hồi.",